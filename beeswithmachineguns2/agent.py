@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Resident agent on the bees, runs the load engines for the controller.
+
+Listens on 127.0.0.1 only, the controller reaches it through the bee's ssh transport (a direct-tcpip channel).
+Every connection carries one json request line and gets json lines back: progress records while an engine runs,
+heartbeats so the controller knows the bee is alive, then one result or error.
+
+Shipped to ~/.bees2-agent with the engine tools and started by the controller, which restarts it when the tools
+it was started with (--digest) are out of date. Kept to the standard library and python 2/3 compatible.
+
+An attack is called off with a stop request on another connection. The engines are sent SIGTERM, the ones that can
+stop early (beeside.py, aioload.py) print a summary of what they did so far, which the attack returns as usual.
+
+requests:
+  {"op": "ping"}
+  {"op": "attack", "argv": ["python", "{tools_dir}/beeside.py", ...], "start_at": null}
+  {"op": "stop"}
+replies:
+  {"type": "progress", ...}, {"type": "heartbeat", "elapsed": 1.0}
+  {"type": "result", "result": {...}} or {"type": "error", "error": "..."}
+"""
+from __future__ import print_function
+
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from optparse import OptionParser
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+DEFAULT_PORT = 8923
+# Seconds between heartbeats while an engine runs
+HEARTBEAT = 1.0
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PID_FILENAME = os.path.join(TOOLS_DIR, 'agent.pid')
+# Lines of engine stderr sent back when it fails
+ERROR_TAIL_LINES = 20
+# Seconds a stopped engine gets to print its summary before it is killed with its children
+STOP_TIMEOUT = 10
+
+
+def raise_open_file_limit():
+    """
+    The engines inherit the agent's limits, soft up to hard
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def expand_argv(argv, work_dir):
+    """
+    Fill in the directories of this bee, the controller doesn't know them
+    :param argv: list of str, with {work_dir}, {tools_dir} and {home} placeholders
+    :param work_dir: str, the directory of this run
+    :return: list of str
+    """
+    replacements = [('{work_dir}', work_dir), ('{tools_dir}', TOOLS_DIR), ('{home}', os.path.expanduser('~'))]
+    expanded = []
+    for arg in argv:
+        for placeholder, value in replacements:
+            arg = arg.replace(placeholder, value)
+        expanded.append(arg)
+    return expanded
+
+
+def kill_group(process):
+    """
+    Kill an engine and every process it started, it leads its own process group
+    :param process: subprocess.Popen
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # Already gone
+        pass
+
+
+def wait_until(start_at):
+    """
+    :param start_at: float, epoch seconds, None to return at once
+    """
+    if start_at:
+        delay = start_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    One request per connection
+    """
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        line = (json.dumps(message) + '\n').encode('utf-8')
+        with self.send_lock:
+            self.wfile.write(line)
+            self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            if request.get('op') == 'ping':
+                self.send({'type': 'result', 'result': {'time': time.time(), 'digest': self.server.digest,
+                                                        'pid': os.getpid()}})
+            elif request.get('op') == 'attack':
+                self.send({'type': 'result', 'result': self.attack(request['argv'], request.get('start_at'))})
+            elif request.get('op') == 'stop':
+                self.send({'type': 'result', 'result': {'stopped': self.stop()}})
+            else:
+                self.send({'type': 'error', 'error': 'Unknown op {}'.format(request.get('op'))})
+        except Exception as e:
+            try:
+                self.send({'type': 'error', 'error': '{}: {}'.format(type(e).__name__, e)})
+            except (IOError, OSError):
+                # The controller is gone
+                pass
+
+    def attack(self, argv, start_at=None):
+        """
+        Run an engine in a fresh work dir, stream its progress records and return its summary, the last json line
+        it printed that isn't a progress record
+        :param argv: list of str, the engine command, see expand_argv
+        :param start_at: float, epoch seconds to start the engine at, for engines that can't wait themselves
+        :return: dict
+        """
+        work_dir = tempfile.mkdtemp(prefix='bees2-')
+        stopped = threading.Event()
+        process = None
+        try:
+            # From the start of the request, the controller gives up on a bee that goes quiet while it waits too
+            heartbeat = threading.Thread(target=self.heartbeat, args=(time.time(), stopped))
+            heartbeat.daemon = True
+            heartbeat.start()
+            wait_until(start_at)
+            started_at = time.time()
+
+            stderr_path = os.path.join(work_dir, 'stderr')
+            with open(stderr_path, 'w') as stderr:
+                process = subprocess.Popen(expand_argv(argv, work_dir), stdout=subprocess.PIPE, stderr=stderr,
+                                           cwd=work_dir, preexec_fn=os.setsid)
+                with self.server.engines_lock:
+                    self.server.engines.add(process)
+                summary = None
+                for line in iter(process.stdout.readline, b''):
+                    line = line.decode('utf-8', 'replace').strip()
+                    if not line.startswith('{'):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'progress' in record:
+                        record['type'] = 'progress'
+                        self.send(record)
+                    else:
+                        summary = record
+                exit_code = process.wait()
+            finished_at = time.time()
+
+            if summary is None:
+                with open(stderr_path) as stderr:
+                    error = ''.join(stderr.readlines()[-ERROR_TAIL_LINES:]).strip()
+                raise RuntimeError('{} exited with {} and no summary. {}'.format(argv[0], exit_code, error))
+
+            # Engines that don't time themselves are timed by the agent
+            summary.setdefault('started_at', started_at)
+            summary.setdefault('finished_at', finished_at)
+            summary['exit_code'] = exit_code
+            return summary
+        finally:
+            stopped.set()
+            if process is not None:
+                if process.poll() is None:
+                    # The controller is gone (the connection broke or it gave up), nobody collects what it does
+                    process.terminate()
+                    kill_group(process)
+                    process.wait()
+                with self.server.engines_lock:
+                    self.server.engines.discard(process)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def stop(self):
+        """
+        Ask the running engines to stop, their attacks return what they did so far
+        :return: int, number of engines asked
+        """
+        with self.server.engines_lock:
+            engines = list(self.server.engines)
+        for process in engines:
+            try:
+                process.terminate()
+            except OSError:
+                continue
+            killer = threading.Timer(STOP_TIMEOUT, kill_group, args=(process,))
+            killer.daemon = True
+            killer.start()
+        return len(engines)
+
+    def heartbeat(self, started_at, stopped):
+        while not stopped.wait(HEARTBEAT):
+            try:
+                self.send({'type': 'heartbeat', 'elapsed': time.time() - started_at})
+            except (IOError, OSError):
+                return
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port, digest):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.digest = digest
+        # Engines running, for stop
+        self.engines = set()
+        self.engines_lock = threading.Lock()
+
+
+def main():
+    parser = OptionParser(usage="python agent.py [--port PORT] [--digest DIGEST]")
+    parser.add_option('--port', dest='port', type='int', default=DEFAULT_PORT,
+                      help="Port on 127.0.0.1 to listen on (default: %d)." % DEFAULT_PORT)
+    parser.add_option('--digest', dest='digest', default='',
+                      help="Digest of the tools the agent was started with, reported by ping.")
+    (options, args) = parser.parse_args()
+
+    raise_open_file_limit()
+    server = Server(options.port, options.digest)
+    with open(PID_FILENAME, 'w') as f:
+        f.write(str(os.getpid()))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
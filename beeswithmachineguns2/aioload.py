@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+"""
+asyncio HTTP load generator, an alternative to ab selected with bees2 attack --engine aio.
+
+Runs one event loop per core in its own process, keeps connections alive and can pipeline HTTP/1.1 requests.
+With --rate it holds a constant request rate like wrk2 and measures latency from the time each request was meant
+to be sent, so a stalled server can't hide its tail behind requests that were never sent (coordinated omission).
+Prints the same json summary as beeside.py, so the controller handles both engines the same way.
+With --progress every worker also prints what it did in each interval, a progress record (see progress.py).
+On SIGTERM the workers stop sending, and the summary covers the requests answered so far.
+Shipped to the bees together with histogram.py. Python 3 only, uses uvloop when it is installed.
+
+usage:
+  python3 aioload.py -n 100000 -c 200 -k --pipeline 4 http://127.0.0.1:8000/
+  python3 aioload.py -n 60000 -c 100 -k --rate 1000 http://127.0.0.1:8000/
+"""
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import signal
+import ssl
+import sys
+import threading
+import time
+from collections import deque
+from optparse import OptionParser
+from urllib.parse import urlparse
+
+try:
+    from .histogram import LatencyHistogram
+except ImportError:
+    from histogram import LatencyHistogram
+
+DEFAULT_TIMEOUT = 30
+READ_CHUNK = 65536
+# Seconds between checks whether the workers were told to stop
+STOP_POLL = 0.1
+# Seconds the requests in flight get to come back once the workers stop
+STOP_GRACE = 1
+
+# Progress records of the worker processes, printed by the main process one line at a time
+_progress_queue = None
+# Set to 1 by SIGTERM, the workers stop. Without a lock, it's set from a signal handler.
+_stop_flag = None
+
+
+def split_evenly(total, parts):
+    """
+    Split a total in parts that differ by at most one
+    :param total: int
+    :param parts: int
+    :return: list of ints
+    """
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def build_request(url, method='GET', headers=None, body=b'', keep_alive=True):
+    """
+    Raw HTTP/1.1 request bytes
+    :param url: str
+    :param method: str
+    :param headers: list, 'Name: value' strings
+    :param body: bytes
+    :param keep_alive: bool, ask for a persistent connection
+    :return: bytes
+    """
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    lines = ['{} {} HTTP/1.1'.format(method, path),
+             'Host: {}'.format(parsed.netloc),
+             'User-Agent: bees2',
+             'Accept: */*']
+    lines.extend(headers or [])
+    if body:
+        lines.append('Content-Length: {}'.format(len(body)))
+    lines.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+class Stats(object):
+    """
+    Counters of one worker, reduced to the beeside.py summary schema
+    """
+
+    def __init__(self, corrected=False):
+        self.status_codes = {}
+        self.failed_requests_connect = 0
+        self.failed_requests_receive = 0
+        self.failed_requests_exceptions = 0
+        self.total_bytes = 0
+        self.html_bytes = 0
+        self.histogram = LatencyHistogram()
+        # Latency from the actual send time, only kept apart when histogram is corrected for coordinated omission
+        self.uncorrected_histogram = LatencyHistogram() if corrected else None
+        # What happened since the last progress record, see take_window
+        self.window = None
+
+    def record(self, status, header_bytes, body_bytes, ms, uncorrected_ms):
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        self.total_bytes += header_bytes + body_bytes
+        self.html_bytes += body_bytes
+        self.histogram.record(ms)
+        if self.uncorrected_histogram is not None:
+            self.uncorrected_histogram.record(uncorrected_ms)
+        if self.window is not None:
+            self.window.record(status, header_bytes, body_bytes, ms, uncorrected_ms)
+
+    def fail(self, key, count=1):
+        """
+        :param key: str, failed_requests_connect, failed_requests_receive or failed_requests_exceptions
+        :param count: int
+        """
+        setattr(self, key, getattr(self, key) + count)
+        if self.window is not None:
+            self.window.fail(key, count)
+
+    def take_window(self):
+        """
+        Start counting a new window
+        :return: Stats, of the window that ends, None before the first one
+        """
+        window, self.window = self.window, Stats()
+        return window
+
+    def to_progress(self, elapsed):
+        """
+        :param elapsed: float, seconds since the worker started
+        :return: dict, progress record of these stats
+        """
+        return {
+            'progress': elapsed,
+            'requests': self.histogram.count,
+            'errors': self.failed_requests_connect + self.failed_requests_receive + self.failed_requests_exceptions,
+            'status_codes': self.status_codes,
+            'latency_histogram': self.histogram.to_dict(),
+        }
+
+    def to_dict(self):
+        stats = {
+            'status_codes': self.status_codes,
+            'failed_requests_connect': self.failed_requests_connect,
+            'failed_requests_receive': self.failed_requests_receive,
+            'failed_requests_length': 0,
+            'failed_requests_exceptions': self.failed_requests_exceptions,
+            'total_bytes': self.total_bytes,
+            'html_bytes': self.html_bytes,
+            'latency_histogram': self.histogram.to_dict(),
+        }
+        if self.uncorrected_histogram is not None:
+            stats['uncorrected_latency_histogram'] = self.uncorrected_histogram.to_dict()
+        return stats
+
+
+class Worker(object):
+    """
+    Fires a share of the requests from one event loop over concurrent keep-alive connections.
+    With a rate, request i is due at start + i / rate whichever connection sends it.
+    """
+
+    def __init__(self, url, requests, concurrency, request, keep_alive=True, pipeline=1, timeout=DEFAULT_TIMEOUT,
+                 rate=None, progress=None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.ssl = None
+        if parsed.scheme == 'https':
+            self.ssl = ssl.create_default_context()
+            self.ssl.check_hostname = False
+            self.ssl.verify_mode = ssl.CERT_NONE
+        self.port = parsed.port or (443 if self.ssl else 80)
+        self.remaining = requests
+        self.concurrency = concurrency
+        self.request = request
+        self.keep_alive = keep_alive
+        # A connection waiting for the next due time can't read, so constant rate sends one request at a time
+        self.pipeline = pipeline if keep_alive and not rate else 1
+        self.timeout = timeout
+        self.interval = 1.0 / rate if rate else None
+        self.started = None
+        self.scheduled = 0
+        self.stats = Stats(corrected=bool(rate))
+        # Seconds between progress records, None for none
+        self.progress = progress
+
+    def _claim(self):
+        """
+        Take the next request
+        :return: float, perf_counter time the request is due, None when all requests are taken
+        """
+        if self.remaining <= 0:
+            return None
+        self.remaining -= 1
+        if not self.interval:
+            return time.perf_counter()
+        due = self.started + self.scheduled * self.interval
+        self.scheduled += 1
+        return due
+
+    async def _read_response(self, reader):
+        """
+        :return: tuple, (status code str, header bytes, body bytes, server keeps the connection open)
+        """
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = lines[0].split(' ', 2)[1]
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        body_bytes = 0
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0], 16)
+                await reader.readexactly(size + 2)
+                body_bytes += size
+                if size == 0:
+                    # trailers end with an empty line
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    break
+        elif 'content-length' in headers:
+            body_bytes = int(headers['content-length'])
+            await reader.readexactly(body_bytes)
+        elif status[0] != '1' and status not in ('204', '304'):
+            # No length, the body ends when the server closes the connection
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                body_bytes += len(chunk)
+            return status, len(head), body_bytes, False
+
+        keep_open = headers.get('connection', '').lower() != 'close' and lines[0].startswith('HTTP/1.1')
+        return status, len(head), body_bytes, keep_open
+
+    async def _connection(self):
+        while self.remaining > 0:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                if self._claim() is not None:
+                    self.stats.fail('failed_requests_connect')
+                continue
+
+            in_flight = deque()
+            try:
+                while True:
+                    while len(in_flight) < self.pipeline:
+                        due = self._claim()
+                        if due is None:
+                            break
+                        delay = due - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        writer.write(self.request)
+                        in_flight.append((due, time.perf_counter()))
+                    if not in_flight:
+                        break
+                    await writer.drain()
+                    status, header_bytes, body_bytes, keep_open = await asyncio.wait_for(
+                        self._read_response(reader), self.timeout)
+                    due, sent = in_flight.popleft()
+                    now = time.perf_counter()
+                    self.stats.record(status, header_bytes, body_bytes, (now - min(due, sent)) * 1000,
+                                      (now - sent) * 1000)
+                    if not (self.keep_alive and keep_open):
+                        # Requests pipelined behind a response that closed the connection are sent again
+                        self.remaining += len(in_flight)
+                        in_flight.clear()
+                        break
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    ValueError, IndexError):
+                self.stats.fail('failed_requests_receive')
+                # The other requests in flight on a broken connection never got an answer
+                self.stats.fail('failed_requests_exceptions', max(0, len(in_flight) - 1))
+            finally:
+                writer.close()
+
+    def _send_progress(self):
+        _progress_queue.put(self.stats.take_window().to_progress(time.perf_counter() - self.started))
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress)
+            self._send_progress()
+
+    async def _stop_when_told(self, connections):
+        while not _stop_flag.value:
+            await asyncio.sleep(STOP_POLL)
+        # No new requests, then whatever is still in flight is dropped
+        self.remaining = 0
+        await asyncio.sleep(STOP_GRACE)
+        for connection in connections:
+            connection.cancel()
+
+    async def run(self):
+        self.started = time.perf_counter()
+        reporter = None
+        if self.progress:
+            self.stats.take_window()
+            reporter = asyncio.ensure_future(self._report_progress())
+        connections = [asyncio.ensure_future(self._connection()) for _ in range(self.concurrency)]
+        stopper = asyncio.ensure_future(self._stop_when_told(connections)) if _stop_flag is not None else None
+        outcomes = await asyncio.gather(*connections, return_exceptions=True)
+        if stopper:
+            stopper.cancel()
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+        if reporter:
+            reporter.cancel()
+            # The last partial window, so the records add up to the summary
+            self._send_progress()
+        return self.stats
+
+
+def init_worker(progress_queue, stop_flag):
+    """
+    Worker process initializer
+    :param progress_queue: multiprocessing.Queue, for the progress records, None without
+    :param stop_flag: multiprocessing.RawValue, set to 1 when the workers have to stop
+    """
+    global _progress_queue, _stop_flag
+    _progress_queue = progress_queue
+    _stop_flag = stop_flag
+
+
+def stop(signum, frame):
+    _stop_flag.value = 1
+
+
+def print_progress(queue):
+    """
+    Print the progress records of the workers until a None
+    :param queue: multiprocessing.Queue
+    """
+    for record in iter(queue.get, None):
+        print(json.dumps(record), flush=True)
+
+
+def run_worker(args):
+    """
+    Process entry point, runs one Worker on its own event loop
+    :param args: tuple, Worker arguments
+    :return: dict, stats of the worker
+    """
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(Worker(*args).run()).to_dict()
+    finally:
+        loop.close()
+
+
+def merge_summaries(summaries, concurrency, seconds):
+    """
+    Merge worker stats in the beeside.py summary schema
+    :param summaries: list of dicts, from run_worker
+    :param concurrency: int, total concurrency of all workers
+    :param seconds: float, wall clock time of the run
+    :return: dict
+    """
+    histogram = LatencyHistogram()
+    uncorrected_histogram = LatencyHistogram()
+    summary = {'status_codes': {}}
+    for worker in summaries:
+        histogram.merge(LatencyHistogram.from_dict(worker.pop('latency_histogram')))
+        if 'uncorrected_latency_histogram' in worker:
+            uncorrected_histogram.merge(LatencyHistogram.from_dict(worker.pop('uncorrected_latency_histogram')))
+        for code, count in worker.pop('status_codes').items():
+            summary['status_codes'][code] = summary['status_codes'].get(code, 0) + count
+        for key, value in worker.items():
+            summary[key] = summary.get(key, 0) + value
+
+    for status_class in range(2, 6):
+        summary['number_of_%d00s' % status_class] = sum(count for code, count in summary['status_codes'].items()
+                                                        if code.startswith(str(status_class)))
+    summary['non_2xx_responses'] = histogram.count - summary['number_of_200s']
+    summary['complete_requests'] = histogram.count
+    summary['failed_requests'] = summary['failed_requests_connect'] + summary['failed_requests_receive'] + \
+        summary['failed_requests_exceptions']
+    summary['requests_per_second'] = histogram.count / seconds if seconds else 0.0
+    if uncorrected_histogram.count:
+        # At a constant rate the connections wait for requests to be due, concurrency says nothing about latency.
+        # The mean of the latencies from when requests were due.
+        summary['ms_per_request'] = histogram.mean()
+    elif summary['requests_per_second']:
+        # same meaning as ab's "Time per request (mean)"
+        summary['ms_per_request'] = concurrency * 1000.0 / summary['requests_per_second']
+    summary['seconds'] = seconds
+    summary['processes'] = len(summaries)
+    summary['latency_histogram'] = histogram.to_dict()
+    if uncorrected_histogram.count:
+        summary['uncorrected_latency_histogram'] = uncorrected_histogram.to_dict()
+    return summary
+
+
+def main():
+    parser = OptionParser(usage="python3 aioload.py -n REQUESTS -c CONCURRENCY [options] URL")
+    parser.add_option('-n', dest='requests', type='int', default=1, help="Number of requests (default: 1).")
+    parser.add_option('-c', dest='concurrency', type='int', default=1, help="Number of connections (default: 1).")
+    parser.add_option('-k', dest='keep_alive', action='store_true', default=False, help="Use keep-alive.")
+    parser.add_option('--pipeline', dest='pipeline', type='int', default=1,
+                      help="Requests in flight per keep-alive connection (default: 1).")
+    parser.add_option('--rate', dest='rate', type='float', default=None,
+                      help="Constant request rate per second, latency is measured from when each request was due.")
+    parser.add_option('--start-at', dest='start_at', type='float', default=None,
+                      help="Epoch seconds to start firing at, to start together with other bees.")
+    parser.add_option('-P', '--processes', dest='processes', type='int', default=0,
+                      help="Event loop processes (default: one per core).")
+    parser.add_option('--progress', dest='progress', type='float', default=None,
+                      help="Seconds between progress records (default: none).")
+    parser.add_option('-H', dest='headers', action='append', default=[], help="Header, 'Name: value'.")
+    parser.add_option('-m', dest='method', default='GET', help="HTTP method (default: GET).")
+    parser.add_option('-p', dest='post_file', help="File with the request body.")
+    parser.add_option('-T', dest='content_type', help="Content-Type header.")
+    parser.add_option('-A', dest='basic_auth', help="BASIC auth, username:password.")
+    parser.add_option('-s', dest='timeout', type='float', default=DEFAULT_TIMEOUT,
+                      help="Seconds to wait for each connect and response (default: 30).")
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('Please enter one url.')
+    url = args[0] if '://' in args[0] else 'http://' + args[0]
+
+    # From the start, a stop can come at any time. The workers inherit the handler, any of them stops them all.
+    init_worker(multiprocessing.Queue() if options.progress else None, multiprocessing.RawValue('b', 0))
+    signal.signal(signal.SIGTERM, stop)
+
+    headers = list(options.headers)
+    body = b''
+    method = options.method
+    if options.post_file:
+        with open(options.post_file, 'rb') as f:
+            body = f.read()
+        method = 'POST' if method == 'GET' else method
+    if options.content_type:
+        headers.append('Content-Type: {}'.format(options.content_type))
+    if options.basic_auth:
+        headers.append('Authorization: Basic {}'.format(base64.b64encode(options.basic_auth.encode()).decode()))
+    request = build_request(url, method, headers, body, options.keep_alive)
+
+    concurrency = max(1, min(options.concurrency, options.requests))
+    processes = max(1, min(options.processes or os.cpu_count() or 1, concurrency))
+    rate = options.rate / processes if options.rate else None
+    jobs = [(url, n, c, request, options.keep_alive, options.pipeline, options.timeout, rate, options.progress)
+            for n, c in zip(split_evenly(options.requests, processes), split_evenly(concurrency, processes))]
+
+    printer = None
+    if options.progress:
+        printer = threading.Thread(target=print_progress, args=(_progress_queue,))
+        printer.daemon = True
+        printer.start()
+
+    pool = multiprocessing.Pool(processes, init_worker, (_progress_queue, _stop_flag)) if processes > 1 else None
+    # The worker processes are up before the swarm's start time
+    while options.start_at and time.time() < options.start_at and not _stop_flag.value:
+        time.sleep(min(STOP_POLL, options.start_at - time.time()))
+    started = time.time()
+    if pool is None:
+        summaries = [run_worker(jobs[0])]
+    else:
+        try:
+            summaries = pool.map(run_worker, jobs)
+        finally:
+            pool.close()
+            # Exiting workers flush what they queued
+            pool.join()
+    finished = time.time()
+    if printer:
+        # Every record is out before the summary
+        _progress_queue.put(None)
+        printer.join()
+    summary = merge_summaries(summaries, concurrency, finished - started)
+    summary['started_at'] = started
+    summary['finished_at'] = finished
+    if options.rate:
+        summary['target_rate'] = options.rate
+
+    print(json.dumps(summary))
+    if not summary['complete_requests']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
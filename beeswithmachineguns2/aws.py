@@ -0,0 +1,286 @@
+"""
+The boto3 clients of the swarm, one per service and region for the whole process.
+
+Clients are made once, the first time a region is worked on, and shared by every thread working on it: botocore
+clients are thread safe and pool their HTTP connections, so zones of a region running side by side reuse the same
+connections instead of each opening its own. The boto3 session they are made from isn't thread safe, it is only used
+under a lock.
+
+Every API call of a client goes through call:
+- EC2 throttles the calls of an account per region in token buckets, one for the reads (Describe*) and one for the
+  calls changing resources. Each region has the same buckets here, a call waits for a token of its bucket, so the
+  threads of all zones together stay within what the API allows instead of tripping RequestLimitExceeded.
+  https://docs.aws.amazon.com/AWSEC2/latest/APIReference/throttling.html
+- Throttled calls were turned down by the API, they are retried with full jitter backoff, and the bucket of the
+  call is emptied so the other threads slow down too.
+- Reads made again while the same read is in flight (i.e. the zones of a region polling the same bees) wait for it
+  and get a copy of its response instead of calling the API again.
+- Calls, throttles, coalesced reads and latencies are counted per operation, see get_stats.
+"""
+from __future__ import division
+
+import copy
+import functools
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+from .lazy import LazyModule
+
+# Imported with the first client, see lazy.py
+boto3 = LazyModule('boto3')
+botocore_config = LazyModule('botocore.config')
+botocore_exceptions = LazyModule('botocore.exceptions')
+
+# Region the regions are listed from when none is configured
+DEFAULT_REGION = 'us-east-1'
+# HTTP connections each client keeps open, at least one per thread calling it at once
+MAX_POOL_CONNECTIONS = 64
+# Seconds
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+# botocore Config of the clients. Calls are retried by call, not botocore, so throttles are seen, budgeted and counted
+CLIENT_CONFIG = dict(max_pool_connections=MAX_POOL_CONNECTIONS, retries={'max_attempts': 0},
+                     connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT)
+
+# Calls per second and burst of the buckets of a region, under EC2's own (20/100 and 5/200)
+READ_BUDGET = (18, 90)
+WRITE_BUDGET = (4.5, 180)
+READ_PREFIXES = ('describe_', 'get_', 'list_')
+# Errors of calls the API turned down, safe to retry whatever the call
+THROTTLE_CODES = frozenset(['RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'RequestThrottled',
+                            'TooManyRequestsException', 'ServiceUnavailable', 'Unavailable'])
+# Retries of a call that was turned down or couldn't connect, the backoff doubles from RETRY_BASE_DELAY seconds
+MAX_RETRIES = 10
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+
+_session = None
+_clients = {}
+_buckets = {}
+_flights = {}
+_stats = defaultdict(lambda: {'calls': 0, 'throttles': 0, 'retries': 0, 'coalesced': 0, 'seconds': 0.0,
+                              'max_seconds': 0.0, 'waited': 0.0})
+_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    Budget of calls, rate tokens a second up to burst, shared by the threads calling a region
+    """
+
+    def __init__(self, rate, burst, clock=time.time, sleep=time.sleep):
+        """
+        :param rate: float, tokens a second
+        :param burst: int, max tokens
+        :param clock: callable, epoch seconds
+        :param sleep: callable, sleep function
+        """
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """
+        Wait for a token
+        :return: float, seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+    def empty(self):
+        """
+        The API throttled a call, its bucket is empty so this one is as well
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+class _Flight(object):
+    """
+    A read in flight, the threads making it again wait for it
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class Client(object):
+    """
+    A boto3 client whose API calls go through call, the rest (get_waiter, get_paginator, meta) is the client's
+    """
+
+    def __init__(self, client, region):
+        self._client = client
+        self._region = region
+
+    def __getattr__(self, name):
+        if name in self._client.meta.method_to_api_mapping:
+            return functools.partial(call, self._client, self._region, name)
+        return getattr(self._client, name)
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.Session()
+    return _session
+
+
+def get_client(region, service='ec2'):
+    """
+    :param region: str, region name
+    :param service: str, boto3 service name
+    :return: Client, of the boto3 client of the service in the region
+    """
+    with _lock:
+        client = _clients.get((service, region))
+        if client is None:
+            client = _clients[(service, region)] = Client(
+                _get_session().client(service, region_name=region,
+                                      config=botocore_config.Config(**CLIENT_CONFIG)), region)
+        return client
+
+
+def get_default_region():
+    """
+    :return: str, the configured region, DEFAULT_REGION without one
+    """
+    with _lock:
+        return _get_session().region_name or DEFAULT_REGION
+
+
+def _is_read(operation):
+    return operation.startswith(READ_PREFIXES)
+
+
+def _get_bucket(region, operation):
+    read = _is_read(operation)
+    with _lock:
+        bucket = _buckets.get((region, read))
+        if bucket is None:
+            bucket = _buckets[(region, read)] = TokenBucket(*(READ_BUDGET if read else WRITE_BUDGET))
+        return bucket
+
+
+def _count(operation, **counts):
+    with _lock:
+        stats = _stats[operation]
+        for name, value in counts.items():
+            stats[name] += value
+        stats['max_seconds'] = max(stats['max_seconds'], counts.get('seconds', 0.0))
+
+
+def _get_retry_delay(attempt):
+    # Full jitter, https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _call(client, region, operation, kwargs):
+    bucket = _get_bucket(region, operation)
+    method = getattr(client, operation)
+    attempt = 0
+    while True:
+        waited = bucket.take()
+        started = time.time()
+        try:
+            response = method(**kwargs)
+        except (botocore_exceptions.ClientError, botocore_exceptions.EndpointConnectionError) as e:
+            _count(operation, calls=1, seconds=time.time() - started, waited=waited)
+            connect_error = isinstance(e, botocore_exceptions.EndpointConnectionError)
+            throttled = not connect_error and e.response.get('Error', {}).get('Code') in THROTTLE_CODES
+            if not (throttled or connect_error) or attempt == MAX_RETRIES:
+                raise
+            if throttled:
+                bucket.empty()
+                _count(operation, throttles=1)
+            _count(operation, retries=1)
+            time.sleep(_get_retry_delay(attempt))
+            attempt += 1
+            continue
+        _count(operation, calls=1, seconds=time.time() - started, waited=waited)
+        return response
+
+
+def call(client, region, operation, **kwargs):
+    """
+    Make an API call within the budget of its region, retried when throttled, reads coalesced
+    :param client: boto3 client
+    :param region: str, the client's region
+    :param operation: str, client method, i.e. describe_instances
+    :param kwargs: parameters of the call
+    :return: dict, the response
+    """
+    if not _is_read(operation):
+        return _call(client, region, operation, kwargs)
+
+    key = (id(client), operation, json.dumps(kwargs, sort_keys=True, default=str))
+    with _lock:
+        flight = _flights.get(key)
+        leading = flight is None
+        if leading:
+            flight = _flights[key] = _Flight()
+
+    if not leading:
+        _count(operation, coalesced=1)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        # Callers are free to change their response
+        return copy.deepcopy(flight.response)
+
+    try:
+        flight.response = _call(client, region, operation, kwargs)
+        return flight.response
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def get_stats():
+    """
+    :return: dict, operation to its calls (attempts made), throttles, retries, coalesced (reads answered by another
+        one in flight), seconds and max_seconds of the calls, and seconds waited on the budget
+    """
+    with _lock:
+        return dict((operation, dict(stats)) for operation, stats in _stats.items())
+
+
+def format_stats(stats=None):
+    """
+    :param stats: dict, from get_stats, the current ones by default
+    :return: str, one line, None without calls
+    """
+    stats = get_stats() if stats is None else stats
+    calls = sum(s['calls'] for s in stats.values())
+    if not calls:
+        return None
+    return "AWS API: {} calls, {} throttled, {} coalesced, {:.0f} [ms] mean, {:.1f}s waiting on the budget.".format(
+        calls, sum(s['throttles'] for s in stats.values()), sum(s['coalesced'] for s in stats.values()),
+        1000 * sum(s['seconds'] for s in stats.values()) / calls, sum(s['waited'] for s in stats.values()))
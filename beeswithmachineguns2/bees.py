@@ -6,56 +6,138 @@ Main bees module for bringing bees up and down and attacking
 from __future__ import division
 from __future__ import print_function
 
-from future import standard_library
-standard_library.install_aliases()
-from builtins import zip
-from builtins import map
-from builtins import bytes
-from builtins import range
-from past.utils import old_div
-from multiprocessing import Pool
 import os
-import re
 import socket
 import sys
 import ast
 from operator import itemgetter
-IS_PY2 = sys.version_info.major == 2
-if IS_PY2:
-    from urllib.request import urlopen, Request
-    from io import StringIO
-else:
-    from urllib.request import urlopen, Request
-    from io import StringIO
+from io import StringIO
+import atexit
 import base64
+import hashlib
+import calendar
 import csv
-import random
-import ssl
 from contextlib import contextmanager
 import traceback
-
-import boto.ec2  # TODO: deprecated
-import boto.exception  # TODO: deprecated
-
-import boto3  # Converting to boto3 slowly.. starting with broken stuff
-from botocore.exceptions import ClientError
-import paramiko
 import json
+
+try:
+    import resource
+except ImportError:
+    # No rlimits (Windows)
+    resource = None
+
+from .lazy import LazyModule
+from . import aws
+from .engines import ENGINES, get_engine, get_tools
+from .histogram import LatencyHistogram
+from .progress import SloGuard, SwarmProgress, format_breach, watch
+from . import roster
+from .roster import get_region as _get_region
 from collections import defaultdict
+import threading
 import time
 
+IS_PY2 = sys.version_info.major == 2
+
+# Imported by the commands that use them, see lazy.py
+paramiko = LazyModule('paramiko')
+botocore_exceptions = LazyModule('botocore.exceptions')
+futures = LazyModule('concurrent.futures')
 
-STATE_FILENAME = os.path.expanduser('~/.bees2')  # Changing affects _get_existing_regions
+
+# Images made by bake, per region
+BAKED_IMAGES_FILENAME = os.path.expanduser('~/.bees2-images')
 
 # ECS Optimized AMI to use, different per region. ID changes when an updated AMI is released.
 # Good choice for now as its regularly updated
 # https://docs.aws.amazon.com/AmazonECS/latest/developerguide/ecs-optimized_AMI.html
 AMI_NAME = 'amzn-ami-????.??.?-amazon-ecs-optimized'  # 'amzn-ami-2018.03.l-amazon-ecs-optimized'
 
+# Readiness polling for new bees, seconds. The delay grows while nothing changes and resets on progress.
+READY_POLL_MIN_DELAY = 2
+READY_POLL_MAX_DELAY = 15
+READY_POLL_BACKOFF = 1.5
+READY_TIMEOUT = 900
+# Max instance ids per describe call
+DESCRIBE_BATCH_SIZE = 100
+# Max instance ids per terminate or stop call
+TERMINATE_BATCH_SIZE = 1000
+# Polling of bees going down with down --wait, seconds
+DOWN_POLL_DELAY = 5
+DOWN_TIMEOUT = 600
+# Max zones worked on at once by multi zone commands
+MAX_ZONE_WORKERS = 16
+# Max bees connected to, armed or bootstrapped at once. Firing bees each wait on their own channel.
+MAX_BEE_WORKERS = 64
+# Max bees waiting on their channel at once while they fire, a thread each. Bees past it fire as others finish.
+MAX_FIRING_BEES = 2048
+# ssh to a bee, seconds, each attempt. Connection errors are retried, authentication errors aren't.
+SSH_CONNECT_TIMEOUT = 10
+SSH_CONNECT_ATTEMPTS = 3
+SSH_RETRY_DELAY = 2
+# Seconds between keepalives on cached ssh sessions, so NATs and idle timeouts don't drop them mid attack
+SSH_KEEPALIVE = 30
+# Run once on every new bee by up: more open files for the load generators, more local ports and quick reuse of
+# TIME_WAIT sockets for the connections they open. Written to /etc so it survives in baked images.
+BEE_BOOTSTRAP_COMMAND = "echo '* - nofile 65535' | sudo tee /etc/security/limits.d/bees.conf >/dev/null && " \
+                        "printf 'net.ipv4.ip_local_port_range = 1024 65535\\nnet.ipv4.tcp_tw_reuse = 1\\n' | " \
+                        "sudo tee /etc/sysctl.d/99-bees.conf >/dev/null && sudo sysctl -q -p /etc/sysctl.d/99-bees.conf"
+# Passes once the bootstrap took, in a new ssh session
+BEE_PROBE_COMMAND = 'test "$(ulimit -Hn)" -ge 65535'
+# sshd can lag behind the instance status checks
+BOOTSTRAP_CONNECT_ATTEMPTS = 15
+BOOTSTRAP_CONNECT_DELAY = 10
+# Polling of spot requests, seconds
+SPOT_POLL_DELAY = 10
+# Polling of images being baked, seconds
+BAKE_POLL_DELAY = 15
+BAKE_TIMEOUT = 1800
+# The resident agent on the bees, listening on 127.0.0.1 and reached through the ssh transport
+AGENT_PORT = 8923
+AGENT_DIR = '.bees2-agent'  # relative to the bee user's home
+AGENT_START_TIMEOUT = 10
+# Seconds without a line from the agent before a bee is given up on, the agent sends a heartbeat every second
+AGENT_READ_TIMEOUT = 15
+# Seconds between the last bee armed and the swarm firing, time for every bee to reconnect and get its orders
+START_DELAY = 10
+# Seconds between the live windows checked against the service level thresholds, at most
+SLO_CHECK_INTERVAL = 2
+# Latency percentiles in the attack report, 100 is the max
+REPORTED_PERCENTILES = [50, 90, 99, 99.9, 100]
+# Tags up puts on every bee, whatever tags are asked for, the swarm is found again by them when the roster is lost
+SWARM_TAGS = [{'Key': 'Application', 'Value': 'the_swarm'}, {'Key': 'Type', 'Value': 'bee-instance'}]
+# Tag with the user the bees are logged in as, bees without it are ec2-user's
+LOGIN_TAG = 'Login'
+DEFAULT_LOGIN = 'ec2-user'
+# Bees found by their tags, the states the roster keeps
+DISCOVER_STATES = ['pending', 'running', 'stopping', 'stopped']
+# Max instances per page of a filtered describe, the API allows 1000
+DISCOVER_PAGE_SIZE = 1000
+
 
 # Utilities
 
 
+def raise_open_file_limit():
+    """
+    Every bee keeps an ssh session, a socket, open for the whole command: the soft open file limit goes up to the
+    hard one so a large swarm doesn't run out of descriptors
+    :return: int, the soft limit, None where there are no limits
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            # macOS caps the soft limit below an unlimited hard one
+            pass
+    return soft
+
+
 @contextmanager
 def _redirect_stdout(outfile=None):
     save_stdout = sys.stdout
@@ -64,71 +146,110 @@ def _redirect_stdout(outfile=None):
     sys.stdout = save_stdout
 
 
-def _read_server_list(*mr_zone):
-    if len(mr_zone) > 0:
-        mr_state_filename = _get_new_state_file_name(mr_zone[-1])
-    else:
-        mr_state_filename = STATE_FILENAME
-    if not os.path.isfile(mr_state_filename):
+def _read_server_list(zone):
+    """
+    The bees of a zone on the roster
+    :param zone:
+    :return: tuple, username, key name, zone and list of instance ids, all None when there are none
+    """
+    entry = roster.get_zone(zone)
+    if not entry:
         return None, None, None, None
 
-    with open(mr_state_filename, 'r') as f:
-        username = f.readline().strip()
-        key_name = f.readline().strip()
-        zone = f.readline().strip()
-        text = f.read()
-        instance_ids = [i for i in text.split('\n') if i != '']
+    instance_ids = list(entry['bees'])
+    print("Read {} bees from the roster: {}".format(len(instance_ids), zone))
+    return entry['username'], entry['key_name'], zone, instance_ids
 
-        print("Read {} bees from the roster: {}".format(len(instance_ids), zone))
 
-    return username, key_name, zone, instance_ids
+def _read_armed_engines(zone):
+    """
+    Engines up installed and verified on the bees of a zone
+    :param zone:
+    :return: dict, instance id to list of engine names
+    """
+    entry = roster.get_zone(zone) or {'bees': {}}
+    return dict((instance_id, bee['armed']) for instance_id, bee in entry['bees'].items() if bee.get('armed'))
 
 
-def _write_server_list(username, key_name, zone, instances):
+def _get_bee_record(instance, armed=None):
     """
-    Write .bees file
+    What the roster keeps of a bee
+    :param instance: dict, from describe_instances
+    :param armed: list, names of the engines the bee is armed with
+    :return: dict
+    """
+    cpu_options = instance.get('CpuOptions') or {}
+    return {
+        'ip': instance.get('PublicIpAddress') or instance.get('PrivateIpAddress'),
+        'dns': instance.get('PublicDnsName') or instance.get('PrivateDnsName') or None,
+        'type': instance.get('InstanceType'),
+        'armed': armed or [],
+        'cores': cpu_options.get('CoreCount', 0) * cpu_options.get('ThreadsPerCore', 1) or None,
+        'launched_at': _epoch(instance.get('LaunchTime'), None),
+        'state': instance['State']['Name'],
+    }
+
+
+def _write_server_list(username, key_name, zone, instances, armed=None):
+    """
+    Put the bees of a zone on the roster, in place of the ones there
     :param username:
     :param key_name:
     :param zone:
     :param instances: list, list of dicts (instances)
+    :param armed: dict, instance id to list of engine names the bee is armed with
     :return:
     """
-    with open(_get_new_state_file_name(zone), 'w') as f:
-        f.write('%s\n' % username)
-        f.write('%s\n' % key_name)
-        f.write('%s\n' % zone)
+    armed = armed or {}
+    roster.set_zone(zone, username, key_name, dict((instance['InstanceId'],
+                                                    _get_bee_record(instance, armed.get(instance['InstanceId'])))
+                                                   for instance in instances))
 
-        f.write('\n'.join([instance['InstanceId'] for instance in instances]))
+
+def _merge_server_list(username, key_name, zone, instances, armed=None, removed=()):
+    """
+    Put the bees of a zone on the roster next to the ones there, in one change of the roster so bees put on it or
+    taken off it meanwhile (by another up, discover or down) aren't lost
+    :param username:
+    :param key_name:
+    :param zone:
+    :param instances: list, list of dicts (instances)
+    :param armed: dict, instance id to list of engine names the bee is armed with
+    :param removed: list, instance ids to take off the roster, i.e. bees found dead
+    :return:
+    """
+    armed = armed or {}
+    roster.merge_zone(zone, username, key_name, dict((instance['InstanceId'],
+                                                      _get_bee_record(instance, armed.get(instance['InstanceId'])))
+                                                     for instance in instances), removed)
 
 
-def _delete_server_list(zone):
+def _remove_from_server_list(zone, instance_ids):
     """
-    Delete .bees file
+    Take bees of a zone off the roster, the others stay
     :param zone:
+    :param instance_ids: list
     :return:
     """
-    try:
-        os.remove(_get_new_state_file_name(zone))
-    except IOError:
-        pass
+    roster.remove_bees(zone, instance_ids)
 
 
-def _get_pem_path(key):
+def _delete_server_list(zone):
     """
-    Get ssh key path
-    :param key:
+    Take the bees of a zone off the roster
+    :param zone:
     :return:
     """
-    return os.path.expanduser('~/.ssh/%s.pem' % key)
+    roster.delete_zone(zone)
 
 
-def _get_region(zone):
+def _get_pem_path(key):
     """
-    Get region name from zone
-    :param zone: str, zone
+    Get ssh key path
+    :param key:
     :return:
     """
-    return zone if 'gov' in zone else zone[:-1] # chop off the "d" in the "us-east-1d" to get the "Region"
+    return os.path.expanduser('~/.ssh/%s.pem' % key)
 
 
 def _get_subnet_id(connection, subnet_name):
@@ -192,6 +313,83 @@ def _get_security_group_id(connection, security_group_name):
     return security_groups[0]['GroupId'] if security_groups else None
 
 
+def run_in_zones(target, jobs, max_workers=MAX_ZONE_WORKERS):
+    """
+    Fan a bees command out across zones on a bounded thread pool and wait for all of them.
+    SystemExit raised by a command is captured as that zone's exit code instead of ending the process.
+    :param target: callable, i.e. up or attack
+    :param jobs: list, (zone, args, kwargs) tuples
+    :param max_workers: int, max zones worked on at once
+    :return: list of dicts (zone, result, exit_code, seconds), in the order of jobs
+    """
+    def _run(zone, args, kwargs):
+        outcome = {'zone': zone, 'result': None, 'exit_code': 0}
+        started = time.time()
+        try:
+            outcome['result'] = target(*args, **kwargs)
+        except SystemExit as e:
+            outcome['exit_code'] = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            print("Zone {} failed:".format(zone))
+            traceback.print_exc()
+            outcome['exit_code'] = 1
+        outcome['seconds'] = time.time() - started
+        return outcome
+
+    if not jobs:
+        return []
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        zone_futures = [executor.submit(_run, zone, args, kwargs) for zone, args, kwargs in jobs]
+        return [future.result() for future in zone_futures]
+
+
+def run_on_bees(target, params, max_workers=MAX_BEE_WORKERS, on_result=None):
+    """
+    Run a command on every bee from this process, on a bounded thread pool. paramiko blocks, but in socket reads,
+    so a thread per bee in flight is all a bee costs, not a forked process.
+    :param target: callable, takes the params of one bee, i.e. _arm or _attack
+    :param params: list of dicts, one per bee
+    :param max_workers: int, max bees worked on at once
+    :param on_result: callable, (params, result) of each bee as soon as it finishes
+    :return: list of results, in the order of params
+    """
+    if not params:
+        return []
+
+    results = [None] * len(params)
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(params)))) as executor:
+        bee_futures = dict((executor.submit(target, bee_params), i) for i, bee_params in enumerate(params))
+        for future in futures.as_completed(bee_futures):
+            i = bee_futures[future]
+            results[i] = future.result()
+            if on_result:
+                on_result(params[i], results[i])
+    return results
+
+
+def _get_exit_code(outcomes):
+    """
+    Combine the per zone outcomes of run_in_zones into one process exit code
+    :param outcomes: list, from run_in_zones
+    :return: int, 0 when every zone succeeded
+    """
+    return max([outcome['exit_code'] for outcome in outcomes] or [0])
+
+
+def _print_zone_outcomes(outcomes):
+    """
+    Print how each zone of a multi zone command ended
+    :param outcomes: list, from run_in_zones
+    :return:
+    """
+    if len(outcomes) < 2:
+        return
+    for outcome in outcomes:
+        print("Zone {}: {} in {:.1f}s.".format(outcome['zone'], 'failed' if outcome['exit_code'] else 'done',
+                                               outcome['seconds']))
+
+
 # Methods
 
 def up(count, group, zone, image_id, instance_type, username, key_name, subnet, tags, bid=None):
@@ -211,24 +409,43 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     """
     subnet = subnet or ''
     existing_username, existing_key_name, existing_zone, instance_ids = _read_server_list(zone)
+    if not instance_ids:
+        # A lost roster doesn't lose the bees, the ones of this login and key are found by their tags
+        found_instances = _find_own_bees(zone, username, key_name)
+        if found_instances:
+            _merge_server_list(username, key_name, zone, found_instances)
+            existing_username, existing_key_name, existing_zone, instance_ids = _read_server_list(zone)
+    read_instance_ids = list(instance_ids or [])
 
     count = int(count)
+    # Running and pending bees of the roster, they count towards count
+    existing_instances = []
+    # Stopped bees of the warm pool, started before new ones are launched
+    stopped_instances = []
+    woken_instances = []
+    # Bees of the roster still stopping (i.e. bees2 down --stop without --wait) or shutting down, left as they are
+    settling_instances = []
 
-    boto3_session = boto3.Session()
-    boto3_ec2_client = boto3_session.client('ec2', region_name=_get_region(zone))
+    boto3_ec2_client = aws.get_client(_get_region(zone))
 
     if existing_username == username and existing_key_name == key_name and existing_zone == zone:
 
-        try:
-            existing_reservations = boto3_ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
-        except ClientError:
-            print("Existing bees are invalid, cleaning up server list")
-            existing_reservations = []
-            _delete_server_list(zone)
-
-        existing_instances = [instance for reservation in existing_reservations for instance in reservation['Instances']
-                              if instance['State'] == 'running']
-        # User, key and zone match existing values and instance ids are found on state file
+        # Bees that no longer exist are left out, they go from the roster with the terminated ones
+        found_instances = _find_instances(boto3_ec2_client, instance_ids)
+        if not found_instances:
+            print("The roster is out of date, looking for the bees by their tags.")
+            found_instances = _find_own_bees(zone, username, key_name)
+            instance_ids = [instance['InstanceId'] for instance in found_instances]
+
+        existing_instances = [instance for instance in found_instances
+                              if instance['State']['Name'] in ('pending', 'running')]
+        stopped_instances = [instance for instance in found_instances if instance['State']['Name'] == 'stopped']
+        settling_instances = [instance for instance in found_instances
+                              if instance['State']['Name'] in ('stopping', 'shutting-down')]
+        if settling_instances:
+            print("{} bees are still stopping or shutting down, they are left as they are.".format(
+                len(settling_instances)))
+        # User, key and zone match existing values and instance ids are found on the roster
         if count <= len(existing_instances):
             # Count is less than the amount of existing instances. No need to create new ones.
             print('Bees are already assembled and awaiting orders.')
@@ -236,14 +453,18 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
         else:
             # Count is greater than the amount of existing instances. Need to create the only the extra instances.
             count -= len(existing_instances)
+            if stopped_instances:
+                woken_instances = _wake_bees(boto3_ec2_client, stopped_instances[:count])
+                stopped_instances = stopped_instances[count:]
+                count -= len(woken_instances)
     elif instance_ids:
-        # Instances found on state file but user, key and/or zone not matching existing value.
-        # State file only stores one user/key/zone config combination so instances are unusable.
+        # Instances found on the roster but user, key and/or zone not matching existing value.
+        # The roster only stores one user/key combination per zone so instances are unusable.
         print('Taking down {} unusable bees.'.format(len(instance_ids)))
         # Redirect prints in down() to devnull to avoid duplicate messages
         with _redirect_stdout():
-            down()
-        # down() deletes existing state file so _read_server_list() returns a blank state
+            down(zone)
+        # down() takes the zone off the roster so _read_server_list() returns a blank state
         existing_username, existing_key_name, existing_zone, instance_ids = _read_server_list(zone)
 
     pem_path = _get_pem_path(key_name)
@@ -256,16 +477,6 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     print('Connecting to the hive.')
 
     region = _get_region(zone)
-    try:
-        ec2_connection = boto.ec2.connect_to_region(region)
-    except boto.exception.NoAuthHandlerFound as e:
-        print("Authentication config error, perhaps you do not have a ~/.boto file with correct permissions?")
-        raise e
-        # return e
-    except Exception as e:
-        print("Unknown error occurred:")
-        raise e
-        # return e
 
     # TODO: Could check if after sg- is all numeric as well
     security_group_id = group if \
@@ -283,6 +494,11 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     placement = None if 'gov' in zone else zone
     print("Placement: %s" % placement)
 
+    baked_image = _read_baked_images().get(region)
+    if not image_id and baked_image:
+        image_id = baked_image['ImageId']
+        print("Using the image baked on {}.".format(baked_image['CreationDate']))
+
     if not image_id:
         ecs_amis = boto3_ec2_client.describe_images(
             Filters=[
@@ -295,7 +511,10 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
         image_id = ecs_amis[0]['ImageId']
     print("Image ID: %s" % image_id)
 
-    if bid:
+    if not count:
+        # The warm pool had enough bees
+        ready_instances = []
+    elif bid:
         # TODO: Not tested
         print('Attempting to call up %i spot bees, this can take a while...' % count)
 
@@ -315,11 +534,8 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
         # it can take a few seconds before the spot requests are fully processed
         time.sleep(5)
 
-        if not ec2_connection:
-            raise Exception("Invalid zone specified? Unable to connect to region {} using zone name {}"
-                            "".format(region, zone))
-
-        ready_instances = _wait_for_spot_request_fulfillment(ec2_connection, spot_requests)  # TODO convert to boto3
+        ready_instances = _wait_for_spot_request_fulfillment(
+            boto3_ec2_client, [request['SpotInstanceRequestId'] for request in spot_requests['SpotInstanceRequests']])
     else:
         print('Attempting to call up %i bees.' % count)
 
@@ -336,8 +552,8 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
 
             time.sleep(3)  # Wait a bit for bees to come up
 
-        except boto.exception.EC2ResponseError as e:
-            print(("Unable to call bees:", e.message))
+        except botocore_exceptions.ClientError as e:
+            print("Unable to call bees: {}".format(e))
             print("Is your sec group available in this region?")
             print("Subnet", subnet)
             print("SubnetGroupID", security_group_id)
@@ -346,26 +562,17 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
 
         ready_instances = reservation['Instances']
 
-    if not tags:
-        # tags = '{"Type": "bee-instance"}'
-        tags = [
-            {
-                'Key': 'Name',
-                'Value': 'a bee!',
-            },        {
-                'Key': 'Application',
-                'Value': 'the_swarm',
-            },
-            {
-                'Key': 'Type',
-                'Value': 'bee-instance'
-            }
-        ]
-    else:
-        tags = ast.literal_eval(tags)
+    try:
+        tags = _get_bee_tags(tags, username)
+    except (ValueError, SyntaxError) as e:
+        print("Unable to read the tags, the bees only get the swarm's:")
+        print("example: bees up -x \"{'any_key': 'any_value'}\"")
+        print(e)
+        tags = _get_bee_tags(None, username)
 
     try:
-        boto3_ec2_client.create_tags(Resources=[instance['InstanceId'] for instance in ready_instances], Tags=tags)
+        if ready_instances:
+            boto3_ec2_client.create_tags(Resources=[instance['InstanceId'] for instance in ready_instances], Tags=tags)
     except Exception as e:
         print("Unable to create tags:")
         print("example: bees up -x \"{'any_key': 'any_value'}\"")
@@ -373,160 +580,677 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
 
     # instance_ids refers to existing ec2 instances, while ready_instances are the new ones just created in this run
     if instance_ids:
-        # Add existing instances to ready instances if running
-        try:
-            existing_reservations = boto3_ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
-        except ClientError:
-            print("Existing bees are invalid, cleaning up server list")
-            existing_reservations = []
-            _delete_server_list(zone)
-
-        existing_instances = [instance for reservation in existing_reservations for instance in reservation['Instances']
-                              if instance['State']['Name'] == 'running']
+        # Running bees of the roster are armed with the new ones, pending ones are waited on first
         list(map(ready_instances.append, existing_instances))
-        dead_instances = [i for i in instance_ids if i not in [j['InstanceId'] for j in existing_instances]]
-        if dead_instances and instance_ids:
-            # TODO: cleanup dead instances from server list?
-            list(map(instance_ids.pop, [instance_ids.index(i) for i in dead_instances]))
+        kept_instance_ids = [j['InstanceId'] for j in
+                             existing_instances + woken_instances + stopped_instances + settling_instances]
+        # Terminated and missing bees leave the roster at the end
+        instance_ids = [i for i in instance_ids if i in kept_instance_ids]
 
     print("Waiting for bees to load their machine guns...")
 
     instance_ids = instance_ids or []
 
+    ready_instances.extend(woken_instances)
+
     # Can be 'pending'|'running'|'shutting-down'|'terminated'|'stopping'|'stopped'
-    for instance in [i for i in ready_instances if i['State']['Name'] == 'pending']:
+    pending_instances = [i for i in ready_instances if i['State']['Name'] == 'pending']
+    provisioning_times, lost_instance_ids = _wait_for_instances_ready(boto3_ec2_client, pending_instances)
+
+    for instance in pending_instances:
         instance_id = instance['InstanceId']
-        private_ip = instance['PrivateIpAddress']
+        if instance_id in lost_instance_ids:
+            continue
+        if instance_id not in instance_ids:
+            instance_ids.append(instance_id)
+        if instance_id in provisioning_times:
+            print("Bee {}, private ip {} is ready for the attack after {:.1f}s."
+                  "".format(instance_id, instance.get('PrivateIpAddress'), provisioning_times[instance_id]))
+        else:
+            print("Bee {}, private ip {} is still initializing, it may not be ready for the attack."
+                  "".format(instance_id, instance.get('PrivateIpAddress')))
+
+    if provisioning_times:
+        latencies = sorted(provisioning_times.values())
+        print("Provisioning latency: min {:.1f}s, median {:.1f}s, max {:.1f}s."
+              "".format(latencies[0], latencies[len(latencies) // 2], latencies[-1]))
+
+    if instance_ids:
+        boto3_ec2_client.create_tags(Resources=instance_ids, Tags=tags)
+
+    ready_instances = [i for i in ready_instances if i['InstanceId'] not in lost_instance_ids]
+
+    # Only the bees this run read or launched are changed. Described again, the roster keeps their addresses and
+    # states: stopped bees that weren't needed stay in the warm pool, bees lost while loading stay until they are
+    # terminated, terminated and missing bees go.
+    known_instance_ids = sorted(set(read_instance_ids) | set(lost_instance_ids) | set(
+        i['InstanceId'] for i in ready_instances + stopped_instances + settling_instances))
+    roster_instances = [i for i in _find_instances(boto3_ec2_client, known_instance_ids)
+                        if i['State']['Name'] != 'terminated']
+    roster_instance_ids = set(i['InstanceId'] for i in roster_instances)
+    removed_instance_ids = [i for i in known_instance_ids if i not in roster_instance_ids]
+    armed = _read_armed_engines(zone)
+    # On the roster before they are armed, arming that fails or is interrupted doesn't lose them
+    _merge_server_list(username, key_name, zone, roster_instances, armed, removed_instance_ids)
+
+    # Bees are armed once, here, so attacks start right away
+    unarmed_instance_ids = [i['InstanceId'] for i in ready_instances if not armed.get(i['InstanceId'])]
+    if unarmed_instance_ids:
+        print("Arming {} bees.".format(len(unarmed_instance_ids)))
+        armed.update(_bootstrap_bees(boto3_ec2_client, unarmed_instance_ids, username, key_name))
+        _merge_server_list(username, key_name, zone, [i for i in roster_instances
+                                                      if i['InstanceId'] in unarmed_instance_ids], armed)
+
+    print("The swarm has {} bees assembled and ready, {} armed.".format(
+        len(ready_instances), len([i for i in ready_instances if armed.get(i['InstanceId'])])))
+    if stopped_instances:
+        print("{} more bees are stopped in the warm pool.".format(len(stopped_instances)))
+
+
+def _get_bee_tags(tags, username):
+    """
+    Tags of new bees, the swarm tags and the login are added to the ones asked for
+    :param tags: str, python literal of a dict of tags or a list of Key/Value dicts, None for a bee's Name
+    :param username: str, the bees are logged in as
+    :return: list of Key/Value dicts
+    """
+    if not tags:
+        tags = [{'Key': 'Name', 'Value': 'a bee!'}]
+    else:
+        tags = ast.literal_eval(tags)
+        if isinstance(tags, dict):
+            tags = [{'Key': key, 'Value': value} for key, value in tags.items()]
+    swarm_tags = SWARM_TAGS + [{'Key': LOGIN_TAG, 'Value': username}]
+    swarm_keys = set(tag['Key'] for tag in swarm_tags)
+    return [tag for tag in tags if tag['Key'] not in swarm_keys] + swarm_tags
+
+
+def _wake_bees(ec2_client, instances):
+    """
+    Start stopped bees of the warm pool
+    :param ec2_client: boto3 ec2 client
+    :param instances: list, stopped instances from describe_instances
+    :return: list, the instances, pending, without the LaunchTime of their first boot
+    """
+    if not instances:
+        return []
+    print('Waking up {} stopped bees.'.format(len(instances)))
+    ec2_client.start_instances(InstanceIds=[instance['InstanceId'] for instance in instances])
+    # Their provisioning time is counted from now, by the waiter, not from when they were first launched
+    return [dict(((k, v) for k, v in instance.items() if k != 'LaunchTime'), State={'Name': 'pending'})
+            for instance in instances]
 
-        instance = boto3_ec2_client.describe_instance_status(InstanceIds=[instance_id, ])['InstanceStatuses']
 
-        if len(instance):
-            instance = instance[0]
+def _get_instance_name(instance):
+    """
+    :param instance: dict, from describe_instances
+    :return: str, address to ssh to, None once the instance is gone
+    """
+    # PrivateDnsName is useless if you can't resolve the private ip from it.
+    return instance.get('PublicDnsName') or instance.get('PrivateIpAddress')
+
+
+def _bootstrap(params):
+    """
+    Arm a new bee: raise its limits, install every engine, check that they run and start the agent.
+
+    Intended for use with run_on_bees.
+    :param params: dict, i, instance_id, instance_name, username and key_name
+    :return: tuple, (instance id, list of names of the engines that passed their check)
+    """
+    try:
+        client = _get_ssh_session(params, attempts=BOOTSTRAP_CONNECT_ATTEMPTS, delay=BOOTSTRAP_CONNECT_DELAY)
+    except (socket.error, paramiko.SSHException) as e:
+        print("Bee {} isn't accepting ssh ({}).".format(params['instance_id'], e))
+        return params['instance_id'], []
+
+    try:
+        stdin, stdout, stderr = client.exec_command(BEE_BOOTSTRAP_COMMAND)
+        if stdout.channel.recv_exit_status() != 0:
+            print("Bee {} bootstrap failed: {}".format(params['instance_id'], stderr.read().strip()))
+
+        for engine in params['engines']:
+            if engine.install_command:
+                stdin, stdout, stderr = client.exec_command(engine.install_command)
+                stdout.channel.recv_exit_status()
+
+        # Limits are set when a session logs in, the probe runs in a new one. It's cached for the next commands.
+        _close_ssh_session(params)
+        client = _get_ssh_session(params)
+        stdin, stdout, stderr = client.exec_command(BEE_PROBE_COMMAND)
+        if stdout.channel.recv_exit_status() != 0:
+            print("Bee {} failed the probe: open file limit not raised.".format(params['instance_id']))
+            return params['instance_id'], []
+
+        armed = []
+        for engine in params['engines']:
+            stdin, stdout, stderr = client.exec_command(engine.check_command)
+            if stdout.channel.recv_exit_status() == 0:
+                armed.append(engine.name)
+
+        # Started from the session with the raised limits, the engines inherit them
+        _ensure_agent(client)
+    except AgentError as e:
+        print("Bee {} agent didn't start: {}".format(params['instance_id'], e))
+        return params['instance_id'], []
+    except (socket.error, paramiko.SSHException) as e:
+        _close_ssh_session(params)
+        print("Bee {} lost its connection while arming: {}".format(params['instance_id'], e))
+        return params['instance_id'], []
+
+    print("Bee {} is armed with {}.".format(params['instance_id'], ', '.join(armed) or 'nothing'))
+    return params['instance_id'], armed
+
+
+def _bootstrap_bees(ec2_client, instance_ids, username, key_name):
+    """
+    Arm bees in parallel
+    :param ec2_client: boto3 ec2 client
+    :param instance_ids: list
+    :param username:
+    :param key_name:
+    :return: dict, instance id to list of names of the engines the bee is armed with
+    """
+    instances = _describe_instances(ec2_client, instance_ids)
+
+    engines = [ENGINES[name] for name in sorted(ENGINES)]
+    params = [{
+        'i': i,
+        'instance_id': instance['InstanceId'],
+        'instance_name': _get_instance_name(instance),
+        'username': username,
+        'key_name': key_name,
+        'engines': engines,
+    } for i, instance in enumerate(instances) if _get_instance_name(instance)]
+    if not params:
+        return {}
+
+    return dict(run_on_bees(_bootstrap, params))
 
-            instance['State'] = instance['InstanceState']
 
-        while not instance or instance['State']['Name'] != 'running':
-            print('.')
-            # print(instance['State']['Name'])
-            time.sleep(5)
-            instance = boto3_ec2_client.describe_instance_status(InstanceIds=[instance_id, ])['InstanceStatuses']
-            if len(instance):
-                instance = instance[0]
-                instance['State'] = instance['InstanceState']
+def _read_baked_images():
+    """
+    :return: dict, region to the image bake made there
+    """
+    if not os.path.isfile(BAKED_IMAGES_FILENAME):
+        return {}
+    with open(BAKED_IMAGES_FILENAME, 'r') as f:
+        return json.load(f)
 
-        instance['PrivateIpAddress'] = private_ip
-        instance_ids.append(instance['InstanceId'])
 
-        # TODO: Need to figure out how we can check they are initialized fully or not, keep waiting...
-        print("Bee {}, private ip {} is ready for the attack. Make sure they all finished initializing first"
-              "".format(instance['InstanceId'], instance['PrivateIpAddress']))
+def _write_baked_image(region, image):
+    """
+    Record the image baked in a region, up launches it from then on
+    :param region:
+    :param image: dict, ImageId, Name, CreationDate, SourceInstanceId and Engines
+    :return:
+    """
+    images = _read_baked_images()
+    images[region] = image
+    with open(BAKED_IMAGES_FILENAME, 'w') as f:
+        json.dump(images, f, indent=2, sort_keys=True)
 
-    boto3_ec2_client.create_tags(Resources=instance_ids, Tags=tags)
 
-    _write_server_list(username, key_name, zone, ready_instances)
+def bake(zone, name=None):
+    """
+    Make a private image from an armed bee, up uses it by default in its region so new bees boot ready to fire.
+    :param zone: str, az of the bees, the first one is baked
+    :param name: str, image name (default: bees2-<date>)
+    :return: dict, the recorded image or None
+    """
+    username, key_name, zone, instance_ids = _read_server_list(zone)
+    if not instance_ids:
+        print("No bees have been mobilized in {}, bake needs one from bees up.".format(zone))
+        return
 
-    print("The swarm has {} bees assembled and ready.".format(len(ready_instances)))
+    region = _get_region(zone)
+    boto3_ec2_client = aws.get_client(region)
+
+    instance_id = instance_ids[0]
+    print("Arming bee {} with every engine.".format(instance_id))
+    engines = _bootstrap_bees(boto3_ec2_client, [instance_id], username, key_name).get(instance_id)
+    if not engines:
+        print("Bee {} couldn't be armed, not baking it.".format(instance_id))
+        sys.exit(1)
+
+    name = name or 'bees2-{}'.format(time.strftime('%Y%m%d-%H%M%S', time.gmtime()))
+    print("Baking {} from bee {}, it reboots once.".format(name, instance_id))
+    image_id = boto3_ec2_client.create_image(InstanceId=instance_id, Name=name,
+                                             Description='bees2 bee armed with {}'.format(', '.join(engines)))['ImageId']
+    boto3_ec2_client.create_tags(Resources=[image_id], Tags=[{'Key': 'Application', 'Value': 'the_swarm'},
+                                                            {'Key': 'Type', 'Value': 'bee-image'}])
+
+    waiter = boto3_ec2_client.get_waiter('image_available')
+    waiter.wait(ImageIds=[image_id], WaiterConfig={'Delay': BAKE_POLL_DELAY,
+                                                   'MaxAttempts': BAKE_TIMEOUT // BAKE_POLL_DELAY})
+
+    image = {
+        'ImageId': image_id,
+        'Name': name,
+        'CreationDate': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'SourceInstanceId': instance_id,
+        'Engines': engines,
+    }
+    _write_baked_image(region, image)
+    print("Image {} is ready, bees up in {} will use it.".format(image_id, region))
+    return image
 
 
 def report():
     """
-    Report the status of the load testing servers.
+    Report the status of the load testing servers, the regions all at once
+    :return: list, per region outcomes from run_in_zones, the result maps the region's zones to their instances
     """
-    def _check_instances():
-        """
-        helper function to check multiple region files ~/.bees.*
-        """
-        if not instance_ids:
-            print("No bees have been mobilized.")
-            return
+    zones = _get_existing_regions()
+    if not zones:
+        print("No bees have been mobilized.")
+        return []
+
+    jobs = [(region, (region, region_zones), {}) for region, region_zones in sorted(_group_by_region(zones).items())]
+    outcomes = run_in_zones(_report_region, jobs)
+    for outcome in outcomes:
+        for zone, (instance_ids, instances) in sorted((outcome['result'] or {}).items()):
+            print("Zone {}: {} bees.".format(zone, len(instance_ids)))
+            found = dict((instance['InstanceId'], instance) for instance in instances)
+            for instance_id in instance_ids:
+                instance = found.get(instance_id)
+                if instance:
+                    print("Bee {}: {} @ {}".format(instance_id, instance['State']['Name'],
+                                                   instance.get('PublicIpAddress')))
+                else:
+                    print("Bee {}: gone".format(instance_id))
+    return outcomes
+
+
+def _report_region(region, zones):
+    """
+    :param region: str
+    :param zones: list, zones of the region on the roster
+    :return: dict, zone to the instance ids on the roster and the instances found of them
+    """
+    ec2_client = aws.get_client(region)
+    instance_ids = dict((zone, _read_server_list(zone)[3] or []) for zone in zones)
+    instances = _find_instances(ec2_client, [i for zone in zones for i in instance_ids[zone]])
+    return dict((zone, (instance_ids[zone], [i for i in instances if i['InstanceId'] in instance_ids[zone]]))
+                for zone in zones)
+
+
+def down(*mr_zone, **options):
+    """
+    Shutdown the load testing server, the regions all at once
+    :param mr_zone: zones to take down, all the zones on the roster by default
+    :param options: stop, stop the bees and keep them on the roster instead of terminating them. wait, return once
+        every bee is terminated (stopped).
+    :return: list, per region outcomes from run_in_zones, the result has the bees of the region, the ones stood down
+        and the ones still not terminated (stopped) after waiting
+    """
+    zones = mr_zone or _get_existing_regions()
+    if not zones:
+        print("No bees have been mobilized.")
+        return []
+
+    print("Connecting to the hive.")
+    jobs = [(region, (region, region_zones), options)
+            for region, region_zones in sorted(_group_by_region(zones).items())]
+    outcomes = run_in_zones(_down_region, jobs)
+    for outcome in outcomes:
+        result = outcome['result']
+        if not result:
+            print("Region {}: failed in {:.1f}s, its bees stay on the roster.".format(outcome['zone'],
+                                                                                     outcome['seconds']))
+            continue
+        print("Region {}: {} {} of {} bees in {:.1f}s{}.".format(
+            outcome['zone'], 'stopped' if options.get('stop') else 'stood down', len(result['stood_down']),
+            result['bees'], outcome['seconds'],
+            ', {} still not {}'.format(len(result['pending']), result['state']) if result['pending'] else ''))
+    if options.get('stop'):
+        print("bees up starts the stopped bees again.")
+    return outcomes
+
+
+def _down_region(region, zones, stop=False, wait=False):
+    """
+    Terminate (stop) the bees of the zones of a region, TERMINATE_BATCH_SIZE a call
+    :param region: str
+    :param zones: list, zones of the region on the roster
+    :param stop: bool, stop the bees and keep them on the roster
+    :param wait: bool, return once they are terminated (stopped)
+    :return: dict, bees, the number on the roster, stood_down, the instance ids terminated (stopped), state and
+        pending, the ones not in it yet
+    """
+    ec2_client = aws.get_client(region)
+    zone_bees = [(zone, _read_server_list(zone)[3] or []) for zone in zones]
+    instance_ids = [i for _, zone_instance_ids in zone_bees for i in zone_instance_ids]
+    action, state = (ec2_client.stop_instances, 'stopped') if stop else (ec2_client.terminate_instances,
+                                                                         'terminated')
 
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+    stood_down = []
+    for chunk in _chunks(instance_ids, TERMINATE_BATCH_SIZE):
+        stood_down.extend(_call_on_instances(ec2_client, action, chunk))
 
-        reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    pending = _wait_for_instances_state(ec2_client, stood_down, state) if wait else []
+    if not stop:
+        # The bees read, terminated or already gone. Bees put on the roster meanwhile (by up) stay.
+        for zone, zone_instance_ids in zone_bees:
+            _remove_from_server_list(zone, zone_instance_ids)
+    return {'bees': len(instance_ids), 'stood_down': stood_down, 'state': state, 'pending': pending}
 
-        instances = []
 
-        for reservation in reservations:
-            instances.extend(reservation.instances)
+def _call_on_instances(ec2_client, action, instance_ids):
+    """
+    Call an instance action, the instances that no longer exist are left out instead of failing the call
+    :param ec2_client: boto3 ec2 client
+    :param action: callable, i.e. ec2_client.terminate_instances, taking InstanceIds
+    :param instance_ids: list
+    :return: list, the instance ids the action was called on
+    """
+    try:
+        action(InstanceIds=instance_ids)
+        return instance_ids
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidInstanceID.NotFound':
+            raise
+
+    instance_ids = [i['InstanceId'] for i in _find_instances(ec2_client, instance_ids)
+                    if i['State']['Name'] != 'terminated']
+    if instance_ids:
+        action(InstanceIds=instance_ids)
+    return instance_ids
 
-        for instance in instances:
-            print("Bee {}: {} @ {}".format(instance.id, instance.state, instance.ip_address))
 
-    for i in _get_existing_regions():
-        username, key_name, zone, instance_ids = _read_server_list(i)
-        _check_instances()
+def _wait_for_instances_state(ec2_client, instance_ids, state, timeout=DOWN_TIMEOUT, sleep=time.sleep,
+                              clock=time.time):
+    """
+    Poll the instances, DESCRIBE_BATCH_SIZE a call, until they all are in a state
+    :param ec2_client: boto3 ec2 client
+    :param instance_ids: list
+    :param state: str, i.e. terminated
+    :param timeout: int, seconds
+    :param sleep: callable, sleep function
+    :param clock: callable, current epoch seconds
+    :return: list, the instance ids not in the state at the timeout
+    """
+    started = clock()
+    pending = list(instance_ids)
+    while pending:
+        sleep(DOWN_POLL_DELAY)
+        # Terminated instances end up not being found at all
+        found = dict((i['InstanceId'], i['State']['Name']) for i in _find_instances(ec2_client, pending))
+        pending = [i for i in pending if found.get(i, 'terminated') != state]
+        if clock() - started > timeout:
+            break
+    return pending
+
+
+def _find_instances(ec2_client, instance_ids):
+    """
+    Describe instances by an instance-id filter, the ones that no longer exist are left out instead of failing the
+    call as with InstanceIds
+    :param ec2_client: boto3 ec2 client
+    :param instance_ids: list
+    :return: list, the instances from describe_instances
+    """
+    instances = []
+    for chunk in _chunks(instance_ids, DESCRIBE_BATCH_SIZE):
+        response = ec2_client.describe_instances(Filters=[{'Name': 'instance-id', 'Values': chunk}])
+        for reservation in response['Reservations']:
+            instances.extend(reservation['Instances'])
+    return instances
 
 
-def down(*mr_zone):
+def _group_by_region(zones):
     """
-    Shutdown the load testing server.
-    :param mr_zone:
-    :return:
+    :param zones: list
+    :return: dict, region to list of its zones
     """
-    def _check_to_down_it():
-        """
-        check if we can bring down some bees
-        """
-        username, key_name, zone, instance_ids = _read_server_list(region)
+    regions = defaultdict(list)
+    for zone in zones:
+        regions[_get_region(zone)].append(zone)
+    return regions
 
-        if not instance_ids:
-            print("No bees have been mobilized.")
-            return
 
-        print("Connecting to the hive.")
+def _chunks(items, size):
+    """
+    Split a list into consecutive chunks
+    :param items: list
+    :param size: int, max chunk length
+    :return: generator of lists
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
-        boto3_session = boto3.Session()
-        boto3_ec2_client = boto3_session.client('ec2', region_name=_get_region(zone))
 
-        print("Calling off the swarm for {}.".format(region))
+def _describe_instances(ec2_client, instance_ids):
+    """
+    :param ec2_client: boto3 ec2 client
+    :param instance_ids: list
+    :return: list, the instances from describe_instances
+    """
+    instances = []
+    for chunk in _chunks(instance_ids, DESCRIBE_BATCH_SIZE):
+        for reservation in ec2_client.describe_instances(InstanceIds=chunk)['Reservations']:
+            instances.extend(reservation['Instances'])
+    return instances
 
-        try:
-            terminated_instance_ids = boto3_ec2_client.terminate_instances(InstanceIds=instance_ids)
-            print(terminated_instance_ids)
-        except boto3_ec2_client.exceptions.ClientError as e:
-            if 'do not exist' in str(e):
-                terminated_instance_ids = []  # TODO: Not used
 
-        print("Stood down {} bees.".format(len(instance_ids)))
+def _get_all_regions():
+    """
+    :return: list, the regions of the account
+    """
+    ec2_client = aws.get_client(aws.get_default_region())
+    return sorted(region['RegionName'] for region in ec2_client.describe_regions()['Regions'])
 
-        _delete_server_list(zone)
 
-    if len(mr_zone) > 0:
-        # TODO: not used
-        username, key_name, zone, instance_ids = _read_server_list(mr_zone[-1])
-    else:
-        for region in _get_existing_regions():
-            _check_to_down_it()
+def _find_bees(region):
+    """
+    The bees of a region, by the tags up puts on them, a page of up to DISCOVER_PAGE_SIZE instances per call
+    :param region: str
+    :return: dict, zone to list of instances from describe_instances
+    """
+    ec2_client = aws.get_client(region)
+    filters = [{'Name': 'tag:%s' % tag['Key'], 'Values': [tag['Value']]} for tag in SWARM_TAGS] + \
+              [{'Name': 'instance-state-name', 'Values': DISCOVER_STATES}]
+    zones = defaultdict(list)
+    kwargs = {'Filters': filters, 'MaxResults': DISCOVER_PAGE_SIZE}
+    while True:
+        # Paged by hand, each page is a budgeted call
+        page = ec2_client.describe_instances(**kwargs)
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                zones[instance['Placement']['AvailabilityZone']].append(instance)
+        if not page.get('NextToken'):
+            return zones
+        kwargs['NextToken'] = page['NextToken']
+
+
+def discover(regions=None):
+    """
+    Put the bees found by their tags on the roster, in place of the zones of the regions on it.
+    The regions are searched in parallel, a few calls each whatever the number of bees.
+    :param regions: list, region names, all the regions of the account by default
+    :return: dict, zone to list of instances found
+    """
+    regions = regions or _get_all_regions()
+    print("Looking for bees in {} regions.".format(len(regions)))
+    outcomes = run_in_zones(_find_bees, [(region, (region,), {}) for region in regions])
+
+    found = {}
+    for outcome in outcomes:
+        if outcome['exit_code']:
+            # An unreachable region (i.e. not enabled for the account) keeps its zones on the roster
+            continue
+        for zone in roster.get_zones():
+            if _get_region(zone) == outcome['zone'] and zone not in outcome['result']:
+                _delete_server_list(zone)
+        for zone, instances in outcome['result'].items():
+            found[zone] = _put_found_bees(zone, instances)
+
+    print("Found {} bees in {} zones.".format(sum(len(instances) for instances in found.values()), len(found)))
+    return found
+
+
+def _get_bee_login(instance):
+    """
+    :param instance: dict, from describe_instances
+    :return: tuple, the user and key name the bee is logged in with
+    """
+    tags = dict((tag['Key'], tag['Value']) for tag in instance.get('Tags') or [])
+    return tags.get(LOGIN_TAG, DEFAULT_LOGIN), instance.get('KeyName')
 
 
-def _wait_for_spot_request_fulfillment(conn, requests, fulfilled_requests=None):
+def _find_own_bees(zone, username, key_name):
     """
-    Wait until all spot requests are fulfilled.
-    Once all spot requests are fulfilled, return a
-    list of corresponding spot instances.
-    :param conn:
-    :param requests:
-    :param fulfilled_requests:
-    :return:
+    The bees of a zone found by their tags that are logged in with username and key_name, the ones up launched for
+    them. Bees with another login or key (i.e. a colleague's) are left alone, they never get on the roster this way.
+    :param zone: str
+    :param username: str
+    :param key_name: str
+    :return: list, the instances from describe_instances
     """
-    # TODO: Use describe_instances, describe_spot_fleet_instances(
-    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.describe_spot_fleet_instances
-    fulfilled_requests = fulfilled_requests or []
-    if len(requests) == 0:
-        reservations = conn.get_all_instances(instance_ids = [r.instance_id for r in fulfilled_requests])
-        return [r.instances[0] for r in reservations]
-    else:
-        time.sleep(10)
-        print('.')
+    instances = _find_bees(_get_region(zone)).get(zone, [])
+    own_instances = [i for i in instances if _get_bee_login(i) == (username, key_name)]
+    if own_instances:
+        print("Found {} bees of {} by their tags.".format(len(own_instances), zone))
+    if len(own_instances) < len(instances):
+        print("Leaving {} bees of {} alone, they are logged in with another user or key."
+              "".format(len(instances) - len(own_instances), zone))
+    return own_instances
+
+
+def _put_found_bees(zone, instances):
+    """
+    Put the bees found in a zone on the roster. The roster keeps one login and key per zone, the ones most bees
+    have, bees with others are left out.
+    :param zone: str
+    :param instances: list, from describe_instances
+    :return: list, the instances put on the roster
+    """
+    logins = defaultdict(list)
+    for instance in instances:
+        logins[_get_bee_login(instance)].append(instance)
+    (username, key_name), kept = max(logins.items(), key=lambda login: len(login[1]))
+    if len(kept) < len(instances):
+        print("Leaving {} bees of {} off the roster, they are logged in with another user or key."
+              "".format(len(instances) - len(kept), zone))
+
+    _write_server_list(username, key_name, zone, kept, _read_armed_engines(zone))
+    return kept
+
+
+def _epoch(value, default):
+    """
+    Convert a boto3 datetime to epoch seconds
+    :param value: datetime or None
+    :param default: float, returned when value is missing
+    :return: float
+    """
+    if value is None:
+        return default
+    return calendar.timegm(value.utctimetuple())
+
+
+def _is_instance_ready(status):
+    """
+    Check an entry of describe_instance_status: running with system and instance checks passed
+    :param status: dict, InstanceStatuses item
+    :return: bool
+    """
+    return status['InstanceState']['Name'] == 'running' and \
+        status.get('SystemStatus', {}).get('Status') == 'ok' and \
+        status.get('InstanceStatus', {}).get('Status') == 'ok'
+
 
-    requests = conn.get_all_spot_instance_requests(request_ids=[req.id for req in requests])
-    for req in requests:
-        if req.status.code == 'fulfilled':
-            fulfilled_requests.append(req)
-            print("spot bee `{}` joined the swarm.".format(req.instance_id))
+def _describe_instance_statuses(ec2_client, instance_ids):
+    """
+    Batched and paginated describe_instance_status, includes instances that are not running yet
+    :param ec2_client: boto3 ec2 client
+    :param instance_ids: list, instance ids
+    :return: generator of InstanceStatuses items
+    """
+    for chunk in _chunks(instance_ids, DESCRIBE_BATCH_SIZE):
+        kwargs = dict(InstanceIds=chunk, IncludeAllInstances=True)
+        while True:
+            page = ec2_client.describe_instance_status(**kwargs)
+            for status in page['InstanceStatuses']:
+                yield status
+            if not page.get('NextToken'):
+                break
+            kwargs['NextToken'] = page['NextToken']
+
+
+def _wait_for_instances_ready(ec2_client, instances, timeout=READY_TIMEOUT, sleep=time.sleep, clock=time.time):
+    """
+    Wait for new bees using one batched status poll per round for all pending instances.
+    A bee is ready as soon as it is running and passes both status checks.
+    :param ec2_client: boto3 ec2 client, or a stub providing describe_instance_status
+    :param instances: list, instance dicts from run_instances
+    :param timeout: int, seconds before giving up on bees that are still initializing
+    :param sleep: callable, sleep function
+    :param clock: callable, current epoch seconds
+    :return: tuple, (dict instance id -> provisioning latency in seconds, set of instance ids that died)
+    """
+    started = clock()
+    launched = dict((i['InstanceId'], _epoch(i.get('LaunchTime'), started)) for i in instances)
+    pending = set(launched)
+    provisioning_times = {}
+    lost_instance_ids = set()
+    delay = READY_POLL_MIN_DELAY
+
+    while pending:
+        progressed = False
+        for status in _describe_instance_statuses(ec2_client, sorted(pending)):
+            instance_id = status['InstanceId']
+            if instance_id not in pending:
+                continue
+            if _is_instance_ready(status):
+                provisioning_times[instance_id] = clock() - launched[instance_id]
+            elif status['InstanceState']['Name'] in ('shutting-down', 'terminated', 'stopping', 'stopped'):
+                print("Bee {} was lost while loading ({}).".format(instance_id, status['InstanceState']['Name']))
+                lost_instance_ids.add(instance_id)
+            else:
+                continue
+            pending.discard(instance_id)
+            progressed = True
+
+        if not pending:
+            break
+        if clock() - started > timeout:
+            print("Gave up waiting on {} bees after {}s.".format(len(pending), timeout))
+            break
+
+        print("{} of {} bees ready.".format(len(provisioning_times), len(launched)))
+        delay = READY_POLL_MIN_DELAY if progressed else min(delay * READY_POLL_BACKOFF, READY_POLL_MAX_DELAY)
+        sleep(delay)
+
+    return provisioning_times, lost_instance_ids
 
-    return _wait_for_spot_request_fulfillment(conn, [r for r in requests if r not in
-                                                     fulfilled_requests], fulfilled_requests)
+
+def _wait_for_spot_request_fulfillment(ec2_client, request_ids, sleep=time.sleep):
+    """
+    Wait until all spot requests are fulfilled or given up on, one describe per round for all of them.
+    :param ec2_client: boto3 ec2 client
+    :param request_ids: list, spot instance request ids
+    :param sleep: callable, sleep function
+    :return: list, the instances of the fulfilled requests from describe_instances
+    """
+    pending = set(request_ids)
+    instance_ids = []
+    while pending:
+        sleep(SPOT_POLL_DELAY)
+        print('.')
+        requests = ec2_client.describe_spot_instance_requests(SpotInstanceRequestIds=sorted(pending))
+        for request in requests['SpotInstanceRequests']:
+            if request['Status']['Code'] == 'fulfilled':
+                instance_ids.append(request['InstanceId'])
+                print("spot bee `{}` joined the swarm.".format(request['InstanceId']))
+            elif request['State'] in ('cancelled', 'closed', 'failed'):
+                print("Spot request {} {}: {}".format(request['SpotInstanceRequestId'], request['State'],
+                                                      request['Status'].get('Message')))
+            else:
+                continue
+            pending.discard(request['SpotInstanceRequestId'])
+
+    return _describe_instances(ec2_client, instance_ids)
 
 
 def _sting(params):
@@ -542,6 +1266,13 @@ def _sting(params):
     post_file = params['post_file']
     basic_auth = params['basic_auth']
 
+    # urllib.request pulls in ssl, http and email, only attack stings
+    import ssl
+    try:
+        from urllib.request import urlopen, Request
+    except ImportError:
+        from urllib2 import urlopen, Request
+
     # Create request
     request = Request(url)
 
@@ -555,7 +1286,7 @@ def _sting(params):
             else:
                 # python3 removed add_data method from Request and added data attribute,
                 # either bytes or iterable of bytes
-                request.data = bytes(content.encode('utf-8'))
+                request.data = content.encode('utf-8')
         except IOError:
             print('bees: error: The post file you provided doesn\'t exist.')
             return
@@ -587,183 +1318,337 @@ def _sting(params):
     response.read()
 
 
-def _attack(params):
+class AgentError(Exception):
+    """
+    The bee agent couldn't be reached or its engine failed
     """
-    Test the target URL with requests.
 
-    Intended for use with multiprocessing.
-    :param params:
+
+def _get_agent_tools():
     """
-    print('Bee {} is joining the swarm.'.format(params['i']))
-    client = _paramiko_connect(params)
-    print('Bee {} joined the swarm.'.format(params['i']))
+    :return: list, file names the agent needs on a bee, every engine's tools and itself
+    """
+    return sorted(set(get_tools() + ['agent.py']))
 
+
+_agent_digest = []
+
+
+def _get_agent_digest():
+    """
+    Digest of the agent tools of this package, a bee agent started from other tools is restarted
+    :return: str
+    """
+    if not _agent_digest:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for filename in _get_agent_tools():
+            digest.update(filename.encode('utf-8'))
+            with open(os.path.join(package_dir, filename), 'rb') as f:
+                digest.update(f.read())
+        _agent_digest.append(digest.hexdigest()[:16])
+    return _agent_digest[0]
+
+
+def _upload_bee_tools(client):
+    """
+    Copy the agent and the engine tools to a bee
+    :param client: paramiko client
+    :return:
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sftp = client.open_sftp()
     try:
-        print("Bee {:d} is firing her machine gun. Bang bang!".format(params['i']))
+        try:
+            sftp.mkdir(AGENT_DIR)
+        except IOError:
+            # Already there
+            pass
+        for filename in _get_agent_tools():
+            sftp.put(os.path.join(package_dir, filename), '{}/{}'.format(AGENT_DIR, filename))
+    finally:
+        sftp.close()
 
-        options = ''
-        if params['headers'] is not '':
-            for h in params['headers'].split(';'):
-                if h != '':
-                    options += ' -H "%s"' % h.strip()
 
-        if params['contenttype'] is not '':
-            options += ' -T %s' % params['contenttype']
+def _agent_request(client, request, on_progress=None):
+    """
+    Send one request to a bee's agent and read its replies until the result
+    :param client: paramiko client
+    :param request: dict, see agent.py
+    :param on_progress: callable, progress records of the request as they come
+    :return: dict, result
+    """
+    try:
+        channel = client.get_transport().open_channel('direct-tcpip', ('127.0.0.1', AGENT_PORT), ('127.0.0.1', 0))
+    except paramiko.ChannelException as e:
+        raise AgentError("Agent not listening: {}".format(e))
 
-        stdin, stdout, stderr = client.exec_command('mktemp')
-        # paramiko's read() returns bytes which need to be converted back to a str
-        params['csv_filename'] = IS_PY2 and stdout.read().strip() or stdout.read().decode('utf-8').strip()
-        if params['csv_filename']:
-            options += ' -e %(csv_filename)s' % params
-        else:
-            print("Bee {} ({}) lost sight of the target (connection timed out creating csv_filename)."
-                  "".format(params['i'], params['instance_name']))
-            return None
+    try:
+        # A bee that dies or is cut off stops the heartbeats, it mustn't hold up the swarm
+        channel.settimeout(AGENT_READ_TIMEOUT)
+        channel.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        for line in channel.makefile('r'):
+            message = json.loads(line)
+            if message['type'] == 'result':
+                return message['result']
+            elif message['type'] == 'error':
+                raise AgentError(message['error'])
+            elif message['type'] == 'progress' and on_progress:
+                on_progress(message)
+        raise AgentError("Agent closed the connection")
+    except socket.timeout:
+        raise AgentError("No word from the agent for {}s".format(AGENT_READ_TIMEOUT))
+    finally:
+        channel.close()
+
+
+def _ensure_agent(client):
+    """
+    Make sure a bee runs the agent of this package, uploading the tools and starting it when needed
+    :param client: paramiko client
+    :return: dict, ping result of the running agent
+    """
+    digest = _get_agent_digest()
+    try:
+        ping = _agent_request(client, {'op': 'ping'})
+        if ping.get('digest') == digest:
+            return ping
+    except AgentError:
+        pass
 
-        if params['post_file']:
-            pem_file_path=_get_pem_path(params['key_name'])
-            scp_command = "scp -q -o 'StrictHostKeyChecking=no' -i %s %s %s@%s:~/" \
-                          "".format((pem_file_path, params['post_file'], params['username'], params['instance_name']))
-            os.system(scp_command)
-            options += ' -p ~/%s' % params['post_file']
+    _upload_bee_tools(client)
+    stdin, stdout, stderr = client.exec_command(
+        # The pid file survives reboots (stopped bees, baked images), its pid is only killed while it is the agent
+        'cd {dir} && (pid=$(cat agent.pid 2>/dev/null); '
+        'grep -q agent.py /proc/$pid/cmdline 2>/dev/null && kill $pid; sleep 0.2; '
+        'nohup python agent.py --port {port} --digest {digest} >agent.log 2>&1 </dev/null &)'
+        ''.format(dir=AGENT_DIR, port=AGENT_PORT, digest=digest))
+    stdout.channel.recv_exit_status()
+
+    deadline = time.time() + AGENT_START_TIMEOUT
+    while True:
+        try:
+            return _agent_request(client, {'op': 'ping'})
+        except AgentError:
+            if time.time() > deadline:
+                raise AgentError("Agent didn't start, see ~/{}/agent.log on the bee".format(AGENT_DIR))
+            time.sleep(0.2)
 
-        if params['keep_alive']:
-            options += ' -k'
 
-        if params['cookies'] is not '':
-            options += ' -H \"Cookie: %s;sessionid=NotARealSessionID;\"' % params['cookies']
-        else:
-            options += ' -C \"sessionid=NotARealSessionID\"'
-
-        if params['ciphers'] is not '':
-            options += ' -Z %s' % params['ciphers']
-
-        if params['basic_auth'] is not '':
-            options += ' -A %s' % params['basic_auth']
-
-        params['options'] = options
-        # substrings to use for grep to perform remote output filtering
-        # resolves issue #194, too much data sent over SSH control channel to BWMG
-        # any future statistics parsing that requires more output from ab
-        # may need this line altered to include other patterns
-        params['output_filter_patterns'] = '\n'.join(
-            ['Time per request:', 'Requests per second: ', 'Failed requests: ', 'Connect: ', 'Receive: ',
-             'Length: ', 'Exceptions: ', 'Complete requests: ', 'HTTP/1.1'])
-
-        # Make sure we have ab
-        # TODO Move to up, and poll until done, then ready, default ami user?
-        ab_install_command = 'sudo yum install httpd-tools -y'
-        client.exec_command(ab_install_command)
-        time.sleep(5)  # Wait for install
-
-        # TODO: bee is going down
-        # Traceback (most recent call last):
-        #   File "/usr/local/Cellar/python/3.7.2/Frameworks/Python.framework/Versions/3.7/lib/python3.7/threading.py", line 917, in _bootstrap_inner
-        #     self.run()
-        #   File "/usr/local/Cellar/python/3.7.2/Frameworks/Python.framework/Versions/3.7/lib/python3.7/threading.py", line 865, in run
-        #     self._target(*self._args, **self._kwargs)
-        #   File "/usr/local/lib/python3.7/site-packages/beeswithmachineguns2/bees.py", line 1173, in attack
-        #     requests_per_instance, sting)
-        #   File "/usr/local/lib/python3.7/site-packages/beeswithmachineguns2/bees.py", line 956, in _get_paramiko_conn_params
-        #     instance_name = instance['PublicDnsName'] or instance['PrivateIpAddress']
-        # KeyError: 'PrivateIpAddress'
-
-        # Make sure we can open many concurrent connections
-        # print("Bee {} ({}) Increasing open file limit & installing ab.".format(params['i'], params['instance_name']))
-        # ulimit_command = 'ulimit -S -n 4096'  # TODO: change permantenly
-        # client.exec_command(ulimit_command)
-        # time.sleep(1)
-        # https://www.thatsgeeky.com/2011/11/installing-apachebench-without-apache-on-amazons-linux/
-        # default image set to ? ami-0f552e0a86f08b660
-        # benchmark_command = 'ab -v 3 -r -n %(num_requests)s -c %(concurrent_requests)s %(options)s "%(url)s" ' \
-        benchmark_command = 'ulimit -S -n 4096 && ab -v 3 -r -n %(num_requests)s -c %(concurrent_requests)s %(options)s "%(url)s" ' \
-                            '2>/dev/null | grep -F "%(output_filter_patterns)s"' % params
-        print("Benchmark command is: {}".format(benchmark_command))
-        stdin, stdout, stderr = client.exec_command(benchmark_command)
-
-        response = {}
-
-        # paramiko's read() returns bytes which need to be converted back to a str
-        ab_results = IS_PY2 and stdout.read() or stdout.read().decode('utf-8')
-        ms_per_request_search = re.search('Time\ per\ request:\s+([0-9.]+)\ \[ms\]\ \(mean\)', ab_results)
-
-        if not ms_per_request_search:
-            print("Bee {} ({}) lost sight of the target (ab command failed).".format(params['i'],
-                                                                                     params['instance_name']))
-            print("Error is: {}. It could be that the bee cannot resolve the target or "
-                  "that the open file limit is reached (See ulimit -a).".format(stderr))
-            return None
+_payload_digests = {}
 
-        requests_per_second_search = re.search('Requests\ per\ second:\s+([0-9.]+)\ \[#\/sec\]\ \(mean\)', ab_results)
-        failed_requests = re.search('Failed\ requests:\s+([0-9.]+)', ab_results)
-        response['failed_requests_connect'] = 0
-        response['failed_requests_receive'] = 0
-        response['failed_requests_length'] = 0
-        response['failed_requests_exceptions'] = 0
-        if float(failed_requests.group(1)) > 0:
-            failed_requests_detail = re.search('(Connect: [0-9.]+, Receive: [0-9.]+, Length: [0-9.]+, '
-                                               'Exceptions: [0-9.]+)', ab_results)
-            if failed_requests_detail:
-                response['failed_requests_connect'] = float(re.search('Connect:\s+([0-9.]+)',
-                                                                      failed_requests_detail.group(0)).group(1))
-                response['failed_requests_receive'] = float(re.search('Receive:\s+([0-9.]+)',
-                                                                      failed_requests_detail.group(0)).group(1))
-                response['failed_requests_length'] = float(re.search('Length:\s+([0-9.]+)',
-                                                                     failed_requests_detail.group(0)).group(1))
-                response['failed_requests_exceptions'] = float(re.search('Exceptions:\s+([0-9.]+)',
-                                                                         failed_requests_detail.group(0)).group(1))
-
-        complete_requests_search = re.search('Complete\ requests:\s+([0-9]+)', ab_results)
-
-        response['number_of_200s'] = len(re.findall('HTTP/1.1\ 2[0-9][0-9]', ab_results))
-        response['number_of_300s'] = len(re.findall('HTTP/1.1\ 3[0-9][0-9]', ab_results))
-        response['number_of_400s'] = len(re.findall('HTTP/1.1\ 4[0-9][0-9]', ab_results))
-        response['number_of_500s'] = len(re.findall('HTTP/1.1\ 5[0-9][0-9]', ab_results))
-
-        response['ms_per_request'] = float(ms_per_request_search.group(1))
-        response['requests_per_second'] = float(requests_per_second_search.group(1))
-        response['failed_requests'] = float(failed_requests.group(1))
-        response['complete_requests'] = float(complete_requests_search.group(1))
-
-        stdin, stdout, stderr = client.exec_command('cat %(csv_filename)s' % params)
-        response['request_time_cdf'] = []
-        for row in csv.DictReader(stdout):
-            row["Time in ms"] = float(row["Time in ms"])
-            response['request_time_cdf'].append(row)
-        if not response['request_time_cdf']:
-            print("Bee {} ({}) lost sight of the target (connection timed out reading csv)."
-                  "".format(params['i'], params['instance_name']))
-            return None
 
-        print('Bee %i is out of ammo.' % params['i'])
+def _get_payload_digest(path):
+    """
+    sha256 of a payload file, hashed once per process unless it changes
+    :param path: str
+    :return: str
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _payload_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        _payload_digests[key] = digest.hexdigest()
+    return _payload_digests[key]
+
+
+def _upload_payload(client, path):
+    """
+    Copy a payload file (i.e. the post file) to a bee over its ssh session, named by its content so a bee that has it
+    already isn't sent it again
+    :param client: paramiko client
+    :param path: str, local file
+    :return: str, digest of the file, the engines find it under it
+    """
+    digest = _get_payload_digest(path)
+    remote_dir = '{}/payloads'.format(AGENT_DIR)
+    remote_path = '{}/{}'.format(remote_dir, digest)
 
-        client.close()
+    sftp = client.open_sftp()
+    try:
+        try:
+            sftp.stat(remote_path)
+            return digest
+        except IOError:
+            pass
 
-        return response
-    except socket.error as e:
-        return e
-    except Exception as e:
-        traceback.print_exc()
-        print()
-        raise e
+        try:
+            sftp.mkdir(remote_dir)
+        except IOError:
+            # Already there
+            pass
+        # Renamed once complete, an interrupted upload never passes for the payload
+        partial_path = '{}.{}.part'.format(remote_path, os.getpid())
+        sftp.put(path, partial_path)
+        sftp.posix_rename(partial_path, remote_path)
+    finally:
+        sftp.close()
+    return digest
+
+
+def _get_clock_offset(client):
+    """
+    How far a bee's clock is ahead of ours, accurate to half the round trip of an agent ping
+    :param client: paramiko client
+    :return: float, seconds
+    """
+    sent = time.time()
+    bee_time = _agent_request(client, {'op': 'ping'})['time']
+    received = time.time()
+    return bee_time - (sent + received) / 2.0
 
 
-def _summarize_results(results, params, csv_filename):
+def _arm(params):
     """
-    Summarize results
-    :param results:
+    Get a bee ready to fire, its engine installed and its agent running.
+    The first phase of an attack, every bee is armed before any of them fires.
+
+    Intended for use with run_on_bees.
     :param params:
-    :param csv_filename:
-    :return:
+    :return: dict, params with clock_offset, None or socket.error when the bee couldn't be armed
     """
-    summarized_results = dict()
-    summarized_results['timeout_bees'] = [r for r in results if r is None]
-    summarized_results['exception_bees'] = [r for r in results if type(r) == socket.error]
-    summarized_results['complete_bees'] = [r for r in results if r is not None and type(r) != socket.error]
-    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
-    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if type(r) == socket.error]
+    engine = get_engine(params['engine'])
+
+    print('Bee {} is joining the swarm.'.format(params['i']))
+
+    try:
+        client = _get_ssh_session(params)
+        print('Bee {} joined the swarm.'.format(params['i']))
+
+        if engine.install_command and engine.name not in params['armed']:
+            # Bees from before up armed them, or where arming failed
+            print("Bee {} isn't armed with {}, installing it.".format(params['i'], engine.name))
+            stdin, stdout, stderr = client.exec_command(engine.install_command)
+            stdout.channel.recv_exit_status()
+
+        _ensure_agent(client)
+
+        if params['post_file']:
+            params['post_file_digest'] = _upload_payload(client, params['post_file'])
+
+        params['clock_offset'] = _get_clock_offset(client)
+        print('Bee {} is armed.'.format(params['i']))
+
+        return params
+    except (AgentError, paramiko.SSHException) as e:
+        # paramiko.SSHException, authentication or negotiation failed after the retries of _paramiko_connect
+        print("Bee {} ({}) couldn't be armed: {}".format(params['i'], params['instance_name'], e))
+        _close_ssh_session(params)
+        return None
+    except socket.error as e:
+        _close_ssh_session(params)
+        return e
+    except Exception as e:
+        traceback.print_exc()
+        print()
+        raise e
+
+
+def _attack(params):
+    """
+    Test the target URL with requests.
+    The second phase of an attack, the bee waits on its own clock for the swarm's start_at and fires.
+
+    Intended for use with run_on_bees.
+    :param params: dict, armed params from _arm with start_at, epoch seconds of our clock, and swarm_progress,
+        the SwarmProgress the bee's progress records go to (optional)
+    """
+    engine = get_engine(params['engine'])
+
+    try:
+        # Same session _arm opened, no new handshake
+        client = _get_ssh_session(params)
+
+        print("Bee {:d} is firing her machine gun. Bang bang!".format(params['i']))
+
+        # The engines read start_at on the bee's clock
+        bee_params = dict(params, start_at=params['start_at'] + params['clock_offset'])
+        print("Benchmark command is: {}".format(engine.command(bee_params)))
+        request = {'op': 'attack', 'argv': engine.argv(bee_params),
+                   'start_at': None if engine.schedules_start else bee_params['start_at']}
+
+        on_progress = None
+        if params.get('swarm_progress'):
+            def on_progress(record):
+                params['swarm_progress'].add(params['instance_id'], record)
+
+        try:
+            response = engine.result(_agent_request(client, request, on_progress))
+            error = None
+        except (AgentError, paramiko.SSHException) as e:
+            response = None
+            error = e
+
+        if response is None:
+            print("Bee {} ({}) lost sight of the target ({} command failed).".format(params['i'],
+                                                                                    params['instance_name'],
+                                                                                    engine.name))
+            print("Error is: {}. It could be that the bee cannot resolve the target or "
+                  "that the open file limit is reached (See ulimit -a).".format(error))
+            return None
+
+        # Back to our clock
+        for key in ('started_at', 'finished_at'):
+            if response.get(key) is not None:
+                response[key] -= params['clock_offset']
+
+        if params['long_output']:
+            print("Bee {} ({}): {:.0f} requests, {:f} [#/sec], {} processes, response codes {}"
+                  "".format(params['instance_id'], params['instance_name'], response['complete_requests'],
+                            response['requests_per_second'], response.get('processes', 1),
+                            response['status_codes']))
+
+        print('Bee %i is out of ammo.' % params['i'])
+
+        return response
+    except paramiko.SSHException as e:
+        print("Bee {} ({}) lost its connection: {}".format(params['i'], params['instance_name'], e))
+        _close_ssh_session(params)
+        return None
+    except socket.error as e:
+        _close_ssh_session(params)
+        return e
+    except Exception as e:
+        traceback.print_exc()
+        print()
+        raise e
+
+
+def _stop(params):
+    """
+    Call off a firing bee, its attack returns what it did so far.
+
+    Intended for use with run_on_bees.
+    :param params: dict, armed params from _arm
+    :return: dict, the agent's answer, None when the bee didn't get the order
+    """
+    try:
+        return _agent_request(_get_ssh_session(params), {'op': 'stop'})
+    except (AgentError, paramiko.SSHException, socket.error) as e:
+        print("Bee {} ({}) didn't get the order to stop: {}".format(params['i'], params['instance_name'], e))
+        return None
+
+
+def _summarize_results(results, params, csv_filename):
+    """
+    Summarize results
+    :param results:
+    :param params:
+    :param csv_filename:
+    :return:
+    """
+    summarized_results = dict()
+    summarized_results['timeout_bees'] = [r for r in results if r is None]
+    # On python 3 the connection errors are subclasses of socket.error (OSError), i.e. ConnectionResetError
+    summarized_results['exception_bees'] = [r for r in results if isinstance(r, socket.error)]
+    summarized_results['complete_bees'] = [r for r in results if r is not None and not isinstance(r, socket.error)]
+    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
+    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if isinstance(r, socket.error)]
     summarized_results['complete_bees_params'] = [p for r, p in zip(results, params) if
-                                                  r is not None and type(r) != socket.error]
+                                                  r is not None and not isinstance(r, socket.error)]
     summarized_results['num_timeout_bees'] = len(summarized_results['timeout_bees'])
     summarized_results['num_exception_bees'] = len(summarized_results['exception_bees'])
     summarized_results['num_complete_bees'] = len(summarized_results['complete_bees'])
@@ -802,6 +1687,9 @@ def _summarize_results(results, params, csv_filename):
     complete_results = [r['number_of_500s'] for r in summarized_results['complete_bees']]
     summarized_results['total_number_of_500s'] = sum(complete_results)
 
+    complete_results = [r.get('total_bytes', 0) for r in summarized_results['complete_bees']]
+    summarized_results['total_bytes'] = sum(complete_results)
+
     complete_results = [r['requests_per_second'] for r in summarized_results['complete_bees']]
     summarized_results['mean_requests'] = sum(complete_results)
 
@@ -809,78 +1697,140 @@ def _summarize_results(results, params, csv_filename):
     if summarized_results['num_complete_bees'] == 0:
         summarized_results['mean_response'] = "no bees are complete"
     else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
+        summarized_results['mean_response'] = sum(complete_results) / summarized_results['num_complete_bees']
+
+    summarized_results['regions'] = _summarize_zones(summarized_results['complete_bees'],
+                                                     summarized_results['complete_bees_params'])
 
     summarized_results['tpr_bounds'] = params[0]['tpr']
     summarized_results['rps_bounds'] = params[0]['rps']
-
-    if summarized_results['tpr_bounds'] is not None:
-        if summarized_results['mean_response'] < summarized_results['tpr_bounds']:
-            summarized_results['performance_accepted'] = True
-        else:
-            summarized_results['performance_accepted'] = False
-
-    if summarized_results['rps_bounds'] is not None:
-        if summarized_results['mean_requests'] > summarized_results['rps_bounds'] and \
-                summarized_results['performance_accepted'] is True or None:
-            summarized_results['performance_accepted'] = True
-        else:
-            summarized_results['performance_accepted'] = False
-
-    summarized_results['request_time_cdf'] = _get_request_time_cdf(summarized_results['total_complete_requests'],
-                                                                   summarized_results['complete_bees'])
+    _check_performance(summarized_results)
+
+    summarized_results['latency_histogram'] = _merge_latency_histograms(summarized_results['complete_bees'])
+    summarized_results['latency_percentiles'] = _get_latency_percentiles(summarized_results['latency_histogram'])
+    # Constant throughput attacks also report latency from the actual send time
+    uncorrected_histogram = _merge_latency_histograms(summarized_results['complete_bees'],
+                                                      'uncorrected_latency_histogram')
+    if uncorrected_histogram.count:
+        summarized_results['target_rate'] = sum(r.get('target_rate', 0) for r in summarized_results['complete_bees'])
+        summarized_results['uncorrected_latency_percentiles'] = _get_latency_percentiles(uncorrected_histogram)
+    summarized_results['request_time_cdf'] = summarized_results['latency_histogram'].percentiles(list(range(100)))
+    summarized_results.update(_summarize_skew(summarized_results['complete_bees']))
     if csv_filename:
-        _create_request_time_cdf_csv(results, summarized_results['complete_bees_params'],
+        _create_request_time_cdf_csv(summarized_results['complete_bees'], summarized_results['complete_bees_params'],
                                      summarized_results['request_time_cdf'], csv_filename)
 
     return summarized_results
 
 
-def _create_request_time_cdf_csv(results, complete_bees_params, request_time_cdf, csv_filename):
+def _summarize_skew(complete_bees):
+    """
+    How far apart the bees started and stopped firing
+    :param complete_bees: list of bee results, started_at and finished_at on our clock
+    :return: dict, start_skew, stop_skew and overlap in seconds, empty when no bee reported its times
+    """
+    timed_bees = [r for r in complete_bees if 'started_at' in r and 'finished_at' in r]
+    if not timed_bees:
+        return {}
+
+    started = [r['started_at'] for r in timed_bees]
+    finished = [r['finished_at'] for r in timed_bees]
+    return {
+        'start_skew': max(started) - min(started),
+        'stop_skew': max(finished) - min(finished),
+        # Time all bees were firing at once
+        'overlap': max(0.0, min(finished) - max(started)),
+    }
+
+
+def _summarize_zones(complete_bees, complete_bees_params):
+    """
+    Per zone breakdown of the completed bees
+    :param complete_bees: list, results of the completed bees
+    :param complete_bees_params: list, params of the completed bees
+    :return: list of dicts, one per zone sorted by zone name
+    """
+    zones = defaultdict(list)
+    for r, p in zip(complete_bees, complete_bees_params):
+        zones[p.get('zone')].append(r)
+
+    summarized_zones = []
+    for zone in sorted(zones, key=str):
+        zone_results = zones[zone]
+        summarized_zones.append({
+            'zone': zone,
+            'num_complete_bees': len(zone_results),
+            'total_complete_requests': sum(r['complete_requests'] for r in zone_results),
+            'total_failed_requests': sum(r['failed_requests'] for r in zone_results),
+            'mean_requests': sum(r['requests_per_second'] for r in zone_results),
+            'mean_response': sum(r['ms_per_request'] for r in zone_results) / len(zone_results),
+        })
+    return summarized_zones
+
+
+def _check_performance(summarized_results):
+    """
+    Set performance_accepted from the tpr and rps bounds, both must pass when both are given.
+    Leaves the results untouched when no bounds are given.
+    :param summarized_results: dict, with mean_response, mean_requests, tpr_bounds and rps_bounds
+    :return:
+    """
+    if summarized_results['tpr_bounds'] is None and summarized_results['rps_bounds'] is None:
+        return
+
+    checks = [summarized_results['num_complete_bees'] > 0]
+    if summarized_results['tpr_bounds'] is not None and checks[0]:
+        checks.append(summarized_results['mean_response'] < summarized_results['tpr_bounds'])
+    if summarized_results['rps_bounds'] is not None:
+        checks.append(summarized_results['mean_requests'] > summarized_results['rps_bounds'])
+
+    summarized_results['performance_accepted'] = all(checks)
+
+
+def _create_request_time_cdf_csv(complete_bees, complete_bees_params, request_time_cdf, csv_filename):
     if csv_filename:
         # csv requires files in text-mode with newlines='' in python3
         # see http://python3porting.com/problems.html#csv-api-changes
         openmode = IS_PY2 and 'w' or 'wt'
         openkwargs = IS_PY2 and {} or {'encoding': 'utf-8', 'newline': ''}
-        with open(csv_filename, openmode, openkwargs) as stream:
+        bee_cdfs = [r['latency_histogram'].percentiles(list(range(100))) for r in complete_bees
+                    if 'latency_histogram' in r]
+        with open(csv_filename, openmode, **openkwargs) as stream:
             writer = csv.writer(stream)
             header = ["% faster than", "all bees [ms]"]
-            for p in complete_bees_params:
-                header.append("bee %(instance_id)s [ms]" % p)
+            for r, p in zip(complete_bees, complete_bees_params):
+                if 'latency_histogram' in r:
+                    header.append("bee %(instance_id)s [ms]" % p)
             writer.writerow(header)
             for i in range(100):
-                row = [i, request_time_cdf[i]] if i < len(request_time_cdf) else [i,float("inf")]
-                for r in results:
-                    if r is not None:
-                        row.append(r['request_time_cdf'][i]["Time in ms"])
+                row = [i, request_time_cdf[i]]
+                for cdf in bee_cdfs:
+                    row.append(cdf[i])
                 writer.writerow(row)
 
 
-def _get_request_time_cdf(total_complete_requests, complete_bees):
+def _merge_latency_histograms(complete_bees, key='latency_histogram'):
     """
-    Recalculate the global cdf based on the csv files collected from
-    ab. Can do this by sampling the request_time_cdfs for each of
-    the completed bees in proportion to the number of
-    complete_requests they have
-    :param total_complete_requests:
-    :param complete_bees:
-    :return:
+    Merge the latency histograms of the bees, exact at any request count
+    :param complete_bees: list, results of the completed bees
+    :param key: str, result key of the histograms
+    :return: LatencyHistogram
     """
-    n_final_sample = 100
-    sample_size = 100 * n_final_sample
-    n_per_bee = [int(r['complete_requests'] / total_complete_requests * sample_size)
-                 for r in complete_bees]
-    sample_response_times = []
-    for n, r in zip(n_per_bee, complete_bees):
-        cdf = r['request_time_cdf']
-        for i in range(n):
-            j = int(random.random() * len(cdf))
-            sample_response_times.append(cdf[j]["Time in ms"])
-    sample_response_times.sort()
-    # python3 division returns floats so convert back to int
-    request_time_cdf = sample_response_times[0:sample_size:int(old_div(sample_size, n_final_sample))]
+    merged = LatencyHistogram()
+    for r in complete_bees:
+        if r.get(key):
+            merged.merge(r[key])
+    return merged
+
 
-    return request_time_cdf
+def _get_latency_percentiles(histogram):
+    """
+    Reported percentiles of a latency histogram
+    :param histogram: LatencyHistogram
+    :return: list of (label, ms) tuples
+    """
+    values = histogram.percentiles(REPORTED_PERCENTILES)
+    return [('{:g}%'.format(p) if p < 100 else 'max', v) for p, v in zip(REPORTED_PERCENTILES, values)]
 
 
 def _print_results(summarized_results):
@@ -913,6 +1863,7 @@ def _print_results(summarized_results):
     print('          3xx:\t\t%i' % summarized_results['total_number_of_300s'])
     print('          4xx:\t\t%i' % summarized_results['total_number_of_400s'])
     print('          5xx:\t\t%i' % summarized_results['total_number_of_500s'])
+    print('     Total transferred:\t\t%i [bytes]' % summarized_results['total_bytes'])
     print('     Requests per second:\t%f [#/sec] (mean of bees)' % summarized_results['mean_requests'])
     if 'rps_bounds' in summarized_results and summarized_results['rps_bounds'] is not None:
         print('     Requests per second:\t%f [#/sec] (upper bounds)' % summarized_results['rps_bounds'])
@@ -921,12 +1872,41 @@ def _print_results(summarized_results):
     if 'tpr_bounds' in summarized_results and summarized_results['tpr_bounds'] is not None:
         print('     Time per request:\t\t%f [ms] (lower bounds)' % summarized_results['tpr_bounds'])
 
-    print('     50%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][49])
-    print('     90%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][89])
+    if 'start_skew' in summarized_results:
+        print('     Start skew:\t\t\t%f [s] (first to last bee firing)' % summarized_results['start_skew'])
+        print('     Stop skew:\t\t\t%f [s]' % summarized_results['stop_skew'])
+        print('     All bees firing for:\t\t%f [s]' % summarized_results['overlap'])
+
+    if 'target_rate' in summarized_results:
+        print('     Target rate:\t\t%f [#/sec] (latency from when requests were due)' % summarized_results['target_rate'])
+
+    for label, value in summarized_results['latency_percentiles']:
+        if value is None:
+            continue
+        if label == 'max':
+            print('     Longest request:\t\t{:f} [ms]'.format(value))
+        else:
+            print('     {} responses faster than:\t{:f} [ms]'.format(label, value))
+
+    if 'uncorrected_latency_percentiles' in summarized_results:
+        print('     Uncorrected (from actual send):')
+        for label, value in summarized_results['uncorrected_latency_percentiles']:
+            if value is not None:
+                print('          {}:\t\t{:f} [ms]'.format(label, value))
+
+    if len(summarized_results['regions']) > 1:
+        print('     Per zone:')
+        for region in summarized_results['regions']:
+            print('          {zone}:\t{num_complete_bees} bees, {total_complete_requests:.0f} complete, '
+                  '{total_failed_requests:.0f} failed, {mean_requests:f} [#/sec], {mean_response:f} [ms]'
+                  ''.format(**region))
 
     if 'performance_accepted' in summarized_results:
         print('     Performance check:\t\t%s' % summarized_results['performance_accepted'])
 
+    if 'slo_breach' in summarized_results:
+        print('     Service levels breached:\t%s' % format_breach(summarized_results['slo_breach']))
+
     if summarized_results['mean_response'] < 500:
         print('Mission Assessment: Target crushed bee offensive.')
     elif summarized_results['mean_response'] < 1000:
@@ -943,7 +1923,7 @@ def _get_paramiko_conn_params(instances, url, options, username, key_name, heade
                               contenttype, cookies, ciphers, connections_per_instance,
                               requests_per_instance, sting):
     """
-    Gets paramiko conn params for ab
+    Gets paramiko conn params for the attack engines
     :param instances: dict, from ['Reservations']['Instances'] from describe_instances
     :param url: string, list of urls, comma spliced
     :param options:
@@ -967,13 +1947,13 @@ def _get_paramiko_conn_params(instances, url, options, username, key_name, heade
         print("bees: warning: more urls given than instances. last urls will be ignored.")
 
     for i, instance in enumerate(instances):
-        # PrivateDnsName is useless if you can't resolve the private ip from it.
-        instance_name = instance['PublicDnsName'] or instance['PrivateIpAddress']
+        instance_name = _get_instance_name(instance)
 
         params.append({
             'i': i,
             'instance_id': instance['InstanceId'],
             'instance_name': instance_name,
+            'armed': options.get('armed', {}).get(instance['InstanceId'], []),
             'url': urls[i % url_count],
             'concurrent_requests': connections_per_instance,
             'num_requests': requests_per_instance,
@@ -988,7 +1968,22 @@ def _get_paramiko_conn_params(instances, url, options, username, key_name, heade
             'mime_type': options.get('mime_type', ''),
             'tpr': options.get('tpr'),
             'rps': options.get('rps'),
-            'basic_auth': options.get('basic_auth')
+            'basic_auth': options.get('basic_auth'),
+            'zone': options.get('zone'),
+            'engine': options.get('engine') or 'ab',
+            'pipeline': options.get('pipeline') or 1,
+            'processes': options.get('processes') or 0,
+            'progress': options.get('progress'),
+            # The bee's share of the swarm's rate, set by attack once it knows how many bees are armed
+            'rate': None,
+            'long_output': options.get('long_output'),
+            'seconds': options.get('seconds'),
+            'verb': options.get('verb'),
+            'threads': options.get('threads'),
+            'fetches': options.get('fetches'),
+            'timeout': options.get('timeout'),
+            'send_buffer': options.get('send_buffer'),
+            'recv_buffer': options.get('recv_buffer')
         })
 
     if sting == 1:
@@ -998,8 +1993,7 @@ def _get_paramiko_conn_params(instances, url, options, username, key_name, heade
     elif sting == 2:
         print('Stinging URL in parallel so it will be cached for the attack.')
         url_used_count = min(url_count - 1, instance_count - 1)
-        pool = Pool(url_used_count + 1)
-        pool.map(_sting, params[:url_used_count - 1])
+        run_on_bees(_sting, params[:url_used_count - 1])
     else:
         print('Stinging URL skipped.')
 
@@ -1029,111 +2023,19 @@ def _is_valid_concurrency_to_instances(n, c, instance_count):
     return True
 
 
-# TODO: create _attack_wrk2 and _summarize_results_wrk2
-# def attack_wrk2(url, n, c, **options):
-#     """
-#
-#     :param url:
-#     :param n:
-#     :param c:
-#     :param options:
-#     :return:
-#     """
-#
-#     username, key_name, zone, instance_ids = _read_server_list(options.get('zone'))
-#     headers = options.get('headers', '')
-#     contenttype = options.get('contenttype', '')
-#     csv_filename = options.get("csv_filename", '')
-#     cookies = options.get('cookies', '')
-#     ciphers = options.get('ciphers', '')
-#     # post_file = options.get('post_file', '')
-#     # keep_alive = options.get('keep_alive', False)
-#     # basic_auth = options.get('basic_auth', '')
-#     sting = options.get('sting', 1)
-#
-#     if csv_filename:
-#         try:
-#             stream = open(csv_filename, 'w')
-#         except IOError as e:
-#             raise IOError("Specified csv_filename='%s' is not writable. Check permissions or specify a different "
-#                           "filename and try again." % csv_filename)
-#
-#     if not instance_ids:
-#         print('No bees are ready to attack.')
-#         return
-#
-#     print('Connecting to the hive.')
-#
-#     boto3_session = boto3.Session()
-#     boto3_ec2_client = boto3_session.client('ec2', region_name=_get_region(zone))
-#
-#     print('Assembling bees.')
-#
-#     try:
-#         reservations = boto3_ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
-#     except ClientError:
-#         print("bees: failed to assemble working bees.")
-#         _delete_server_list(zone)
-#         raise
-#
-#     instances = []
-#
-#     for reservation in reservations:
-#         instances.extend(reservation['Instances'])
-#
-#     instance_count = len(instances)
-#
-#     if not _is_valid_concurrency_to_instances(n, c, instance_count):
-#         return
-#
-#     requests_per_instance = int(old_div(float(n), instance_count))
-#     connections_per_instance = int(old_div(float(c), instance_count))
-#
-#     print("Each of {:d} bees will fire {} rounds, {} at a time.".format(instance_count, requests_per_instance,
-#                                                                         connections_per_instance))
-#
-#     params = _get_paramiko_conn_params(instances, url, options, username, key_name, headers,
-#                                        contenttype, cookies, ciphers, connections_per_instance,
-#                                        requests_per_instance, sting)
-#
-#     print('Organizing the swarm.')
-#     # Spin up processes for connecting to EC2 instances
-#     pool = Pool(len(params))
-#
-#     try:
-#         results = pool.map(_attack_wrk2, params)
-#     except Exception as e:
-#         print("Unable to connect to bees instances, are they all accessible?")
-#         raise e
-#
-#     summarized_results = _summarize_results_wrk2(results, params, csv_filename)
-#     print('Offensive complete.')
-#     _print_results(summarized_results)
-#
-#     print('The swarm is awaiting new orders.')
-#
-#     if 'performance_accepted' in summarized_results:
-#         if summarized_results['performance_accepted'] is False:
-#             print("Your targets performance tests did not meet our standard.")
-#             sys.exit(1)
-#         else:
-#             print('Your targets performance tests meet our standards, the Queen sends her regards.')
-#             sys.exit(0)
-
-
-def attack(url, n, c, **options):
+def _get_zone_params(url, n, c, **options):
     """
-    Test the root url of this site.
+    Assemble the bees of one zone to test the root url of this site.
     :param url:
     :param n:
     :param c:
     :param options:
-    :return:
+    :return: list, params of the bees of this zone or None
     """
     username, key_name, zone, instance_ids = _read_server_list(options.get('zone'))
+    options['armed'] = _read_armed_engines(options.get('zone'))
     headers = options.get('headers', '')
     contenttype = options.get('contenttype', '')
-    csv_filename = options.get("csv_filename", '')
     cookies = options.get('cookies', '')
     ciphers = options.get('ciphers', '')
     # post_file = options.get('post_file', '')
@@ -1141,253 +2043,269 @@ def attack(url, n, c, **options):
     # basic_auth = options.get('basic_auth', '')
     sting = options.get('sting', 1)
 
-    if csv_filename:
-        try:
-            stream = open(csv_filename, 'w')
-        except IOError as e:
-            raise IOError("Specified csv_filename='%s' is not writable. Check permissions or specify a different "
-                          "filename and try again." % csv_filename)
-
     if not instance_ids:
-        print('No bees are ready to attack.')
+        print('No bees are ready to attack in {}.'.format(options.get('zone')))
         return
 
     print('Connecting to the hive.')
 
-    boto3_session = boto3.Session()
-    boto3_ec2_client = boto3_session.client('ec2', region_name=_get_region(zone))
+    boto3_ec2_client = aws.get_client(_get_region(zone))
 
     print('Assembling bees.')
 
-    try:
-        reservations = boto3_ec2_client.describe_instances(InstanceIds=instance_ids)['Reservations']
-    except ClientError:
-        # reservations = []
-        print("bees: failed to assemble working bees.")
-        _delete_server_list(zone)
-        raise
-
-    instances = []
+    # Bees that no longer exist are left out instead of failing the call, only they and terminated ones leave the
+    # roster
+    instances = [i for i in _find_instances(boto3_ec2_client, instance_ids) if i['State']['Name'] != 'terminated']
+    found_instance_ids = set(i['InstanceId'] for i in instances)
+    gone_instance_ids = [i for i in instance_ids if i not in found_instance_ids]
+    if gone_instance_ids:
+        print("{} bees in {} are gone, taking them off the roster.".format(len(gone_instance_ids), zone))
+        _remove_from_server_list(zone, gone_instance_ids)
+        if not instances:
+            return
 
-    for reservation in reservations:
-        instances.extend(reservation['Instances'])
+    stopped_count = len([i for i in instances if i['State']['Name'] != 'running'])
+    if stopped_count:
+        print("{} bees in {} aren't running, bees up starts stopped ones.".format(stopped_count, zone))
+        instances = [i for i in instances if i['State']['Name'] == 'running']
+        if not instances:
+            return
 
     instance_count = len(instances)
 
     if not _is_valid_concurrency_to_instances(n, c, instance_count):
         return
 
-    requests_per_instance = int(old_div(float(n), instance_count))
-    connections_per_instance = int(old_div(float(c), instance_count))
+    requests_per_instance = int(float(n) / instance_count)
+    connections_per_instance = int(float(c) / instance_count)
 
-    print("Each of {:d} bees will fire {} rounds, {} at a time.".format(instance_count, requests_per_instance,
-                                                                        connections_per_instance))
+    print("Each of {:d} bees in {} will fire {} rounds, {} at a time.".format(instance_count, zone,
+                                                                              requests_per_instance,
+                                                                              connections_per_instance))
 
     params = _get_paramiko_conn_params(instances, url, options, username, key_name, headers,
                                        contenttype, cookies, ciphers, connections_per_instance,
                                        requests_per_instance, sting)
 
-    print('Organizing the swarm.')
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-
-    try:
-        results = pool.map(_attack, params)
-    except Exception as e:
-        print("Unable to connect to bees instances, are they all accessible?")
-        raise e
-
-    summarized_results = _summarize_results(results, params, csv_filename)
-    print('Offensive complete.')
-    _print_results(summarized_results)
-
-    print('The swarm is awaiting new orders.')
-
-    if 'performance_accepted' in summarized_results:
-        if summarized_results['performance_accepted'] is False:
-            print("Your targets performance tests did not meet our standard.")
-            sys.exit(1)
-        else:
-            print('Your targets performance tests meet our standards, the Queen sends her regards.')
-            sys.exit(0)
-
-#############################
-### hurl version methods, ###
-#############################
+    return params
 
 
-def hurl_attack(url, n, c, **options):
+def attack(url, n, c, **options):
     """
     Test the root url of this site.
+    Every zone fires n requests c at a time, the results of all zones are summarized together.
     :param url:
     :param n:
     :param c:
-    :param options:
-    :return:
+    :param options: zones (list of zones to attack from, default [zone]) and the attack options
+    :return: dict, summarized results of all zones
     """
-    # TODO: Create a hurl binary for amazon linux that can use
-    raise NotImplementedError("This feature is disabled for now.")
-
-    # print(options.get('zone'))
-    username, key_name, zone, instance_ids = _read_server_list(options.get('zone'))
-    headers = options.get('headers', '')
-    contenttype = options.get('contenttype', '')
+    # No zones when the roster is empty, there are no bees to attack with
+    zones = options.pop('zones', None) or ([options['zone']] if options.get('zone') else [])
     csv_filename = options.get("csv_filename", '')
-    cookies = options.get('cookies', '')
-    post_file = options.get('post_file', '')
-    keep_alive = options.get('keep_alive', False)
-    basic_auth = options.get('basic_auth', '')
 
     if csv_filename:
         try:
-            stream = open(csv_filename, 'w')
+            open(csv_filename, 'w').close()
         except IOError as e:
-            raise IOError("Specified csv_filename='%s' is not writable. Check permissions or specify a "
-                          "different filename and try again." % csv_filename)
-
-    if not instance_ids:
-        print("No bees are ready to attack.")
-        return
-
-    print("Connecting to the hive.")
-
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
-
-    print("Assembling bees.")
-
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
-
-    instances = []
-
-    for reservation in reservations:
-        instances.extend(reservation.instances)
-
-    instance_count = len(instances)
+            raise IOError("Specified csv_filename='%s' is not writable. Check permissions or specify a different "
+                          "filename and try again." % csv_filename)
 
-    if n < instance_count * 2:
-        print("bees: error: the total number of requests must be at least {:d} (2x num. instances)"
-              "".format(instance_count * 2))
-        return
-    if c < instance_count:
-        print("bees: error: the number of concurrent requests must be at least {:d} (num. instances)"
-              "".format(instance_count))
-        return
-    if n < c:
-        print("bees: error: the number of concurrent requests ({:d}) must be at most the same as number of "
-              "requests ({:d})".format(c, n))
+    guard = SloGuard(options.get('max_p99'),
+                     options['max_error_rate'] / 100.0 if options.get('max_error_rate') is not None else None,
+                     options['max_5xx_rate'] / 100.0 if options.get('max_5xx_rate') is not None else None,
+                     options.get('breach_for') or 0)
+    if guard.thresholds:
+        # Checked on the live windows, a breach is seen within seconds
+        options['progress'] = min(options.get('progress') or SLO_CHECK_INTERVAL, SLO_CHECK_INTERVAL)
+        if not get_engine(options.get('engine') or 'ab').progress:
+            print("The {} engine doesn't report while it fires, the service levels won't be checked."
+                  "".format(options.get('engine')))
+
+    jobs = [(zone, (url, n, c), dict(options, zone=zone)) for zone in zones]
+    outcomes = run_in_zones(_get_zone_params, jobs)
+    swarm_params = [bee_params for outcome in outcomes for bee_params in outcome['result'] or []]
+
+    if not swarm_params:
+        print('No bees are ready to attack.')
+        _print_zone_outcomes(outcomes)
+        if _get_exit_code(outcomes):
+            sys.exit(_get_exit_code(outcomes))
         return
 
-    requests_per_instance = int(old_div(float(n), instance_count))
-    connections_per_instance = int(old_div(float(c), instance_count))
-
-    print("Each of {:d} bees will fire {} rounds, {} at a time.".format(instance_count, requests_per_instance,
-                                                                        connections_per_instance))
+    # Two phases so the bees fire together: every bee of every zone is armed, then all fire at the same instant
+    print('Organizing the swarm.')
+    try:
+        swarm_armed = run_on_bees(_arm, swarm_params)
+    except Exception as e:
+        print("Unable to connect to bees instances, are they all accessible?")
+        raise e
 
+    results = []
     params = []
+    armed = []
+    breaches = []
+    for bee_armed, bee_params in zip(swarm_armed, swarm_params):
+        if isinstance(bee_armed, dict):
+            armed.append(bee_armed)
+        else:
+            # Never armed, reported like a bee that lost the target or the connection
+            results.append(bee_armed)
+            params.append(bee_params)
+
+    if armed and options.get('rate'):
+        # The target rate is held by the bees that fire, every one of them fires its share
+        for bee_params in armed:
+            bee_params['rate'] = float(options['rate']) / len(armed)
+        print("Each bee will hold {:.1f} requests per second.".format(float(options['rate']) / len(armed)))
+
+    if armed:
+        start_at = time.time() + START_DELAY
+        print('The swarm is armed, {} bees fire in {} seconds.'.format(len(armed), START_DELAY))
+        reported = []
+
+        def _report(bee_params, result):
+            reported.append(bee_params['instance_id'])
+            print('{} of {} bees reported.'.format(len(reported), len(armed)))
+
+        def _call_off(breach):
+            breaches.append(breach)
+            print('Service levels breached: {}. Calling off the swarm.'.format(format_breach(breach)))
+            run_on_bees(_stop, armed)
+
+        # The bees stream what they did every few seconds, merged and printed as they come
+        swarm_progress = None
+        stopped = threading.Event()
+        if options.get('progress'):
+            swarm_progress = SwarmProgress(len(armed), started=start_at)
+            watcher = threading.Thread(target=watch, args=(swarm_progress, options['progress'], stopped, None,
+                                                           guard if guard.thresholds else None, _call_off))
+            watcher.daemon = True
+            watcher.start()
+
+        # Every firing bee waits on its channel for the whole attack, so all of them get a worker, up to a point
+        if len(armed) > MAX_FIRING_BEES:
+            print("Only {} bees fire at once, the other {} fire as they finish.".format(
+                MAX_FIRING_BEES, len(armed) - MAX_FIRING_BEES))
+        try:
+            results.extend(run_on_bees(_attack, [dict(bee_params, start_at=start_at, swarm_progress=swarm_progress)
+                                                 for bee_params in armed],
+                                       max_workers=MAX_FIRING_BEES, on_result=_report))
+        except Exception as e:
+            print("Unable to connect to bees instances, are they all accessible?")
+            raise e
+        finally:
+            stopped.set()
+        params.extend(armed)
 
-    # These conn params are different from ab ones
-    for i, instance in enumerate(instances):
-        params.append({
-            'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.private_ip_address if instance.public_dns_name == "" else instance.public_dns_name,
-            'url': url,
-            'concurrent_requests': connections_per_instance,
-            'num_requests': requests_per_instance,
-            'username': username,
-            'key_name': key_name,
-            'headers': headers,
-            'contenttype': contenttype,
-            'cookies': cookies,
-            'post_file': options.get('post_file'),
-            'keep_alive': options.get('keep_alive'),
-            'mime_type': options.get('mime_type', ''),
-            'tpr': options.get('tpr'),
-            'rps': options.get('rps'),
-            'basic_auth': options.get('basic_auth'),
-            'seconds': options.get('seconds'),
-            'rate': options.get('rate'),
-            'long_output': options.get('long_output'),
-            'responses_per': options.get('responses_per'),
-            'verb': options.get('verb'),
-            'threads': options.get('threads'),
-            'fetches': options.get('fetches'),
-            'timeout': options.get('timeout'),
-            'send_buffer': options.get('send_buffer'),
-            'recv_buffer': options.get('recv_buffer')
-        })
+    summarized_results = _summarize_results(results, params, csv_filename)
+    if breaches:
+        # What the bees did until they were called off
+        summarized_results['slo_breach'] = breaches[0]
+        print('Offensive called off.')
+    else:
+        print('Offensive complete.')
+    _print_results(summarized_results)
 
-    print('Stinging URL so it will be cached for the attack.')
+    _print_zone_outcomes(outcomes)
+    print('The swarm is awaiting new orders.')
 
-    request = Request(url)
-    # Need to revisit to support all http verbs.
-    if post_file:
-        try:
-            with open(post_file, 'r') as content_file:
-                content = content_file.read()
-            if IS_PY2:
-                request.add_data(content)
-            else:
-                # python3 removed add_data method from Request and added data attribute,
-                # either bytes or iterable of bytes
-                request.data = bytes(content.encode('utf-8'))
-        except IOError:
-            print('bees: error: The post file you provided doesn\'t exist.')
-            return
+    if 'slo_breach' in summarized_results:
+        print("Your target breached its service levels, the swarm was called off.")
+        sys.exit(1)
 
-    if cookies is not '':
-        request.add_header('Cookie', cookies)
+    if _get_exit_code(outcomes):
+        # The zones that did attack are summarized above, the others never fired
+        print("Not every zone could attack.")
+        sys.exit(_get_exit_code(outcomes))
 
-    if basic_auth is not '':
-        authentication = base64.encodestring(basic_auth).replace('\n', '')
-        request.add_header('Authorization', 'Basic %s' % authentication)
+    if 'performance_accepted' in summarized_results:
+        if summarized_results['performance_accepted'] is False:
+            print("Your targets performance tests did not meet our standard.")
+            sys.exit(1)
+        else:
+            print('Your targets performance tests meet our standards, the Queen sends her regards.')
+            sys.exit(0)
 
-    # Ping url so it will be cached for testing
-    dict_headers = {}
-    if headers is not '':
-        dict_headers = dict(j.split(':') for j in [i.strip() for i in headers.split(';') if i != ''])
+    return summarized_results
 
-    if contenttype is not '':
-        request.add_header("Content-Type", contenttype)
+# ssh sessions to the bees, kept for the life of the process so each command is one round trip. Only for the life of
+# the process: every bees2 command connects to the bees again (in parallel), paramiko can't share the ControlMaster
+# sockets of OpenSSH and nothing outlives a command to hold them.
+_ssh_sessions = {}
+_ssh_sessions_lock = threading.Lock()
 
-    for key, value in list(dict_headers.items()):
-        request.add_header(key, value)
 
-    if url.lower().startswith("https://") and hasattr(ssl, '_create_unverified_context'):
-        context = ssl._create_unverified_context()
-        response = urlopen(request, context=context)
-    else:
-        response = urlopen(request)
+def _get_ssh_session_key(params):
+    return params['instance_name'], params['username'], params.get('key_name')
 
-    response.read()
 
-    print('Organizing the swarm.')
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_hurl_attack, params)
+def _get_ssh_session(params, **connect_options):
+    """
+    Cached ssh connection to a bee, connected on first use or when the cached one dropped
+    :param params: dict, config params
+    :param connect_options: attempts and delay for _paramiko_connect
+    :return: paramiko client
+    """
+    key = _get_ssh_session_key(params)
+    with _ssh_sessions_lock:
+        client = _ssh_sessions.get(key)
+    transport = client and client.get_transport()
+    if transport is not None and transport.is_active():
+        return client
+
+    client = _paramiko_connect(params, **connect_options)
+    client.get_transport().set_keepalive(SSH_KEEPALIVE)
+    with _ssh_sessions_lock:
+        _ssh_sessions[key] = client
+    return client
 
-    summarized_results = _hurl_summarize_results(results, params, csv_filename)
-    print('Offensive complete.')
 
-    _hurl_print_results(summarized_results)
+def _close_ssh_session(params):
+    """
+    Drop a bee's cached ssh connection, the next _get_ssh_session reconnects
+    :param params: dict, config params
+    """
+    with _ssh_sessions_lock:
+        client = _ssh_sessions.pop(_get_ssh_session_key(params), None)
+    if client is not None:
+        client.close()
 
-    print('The swarm is awaiting new orders.')
 
-    if 'performance_accepted' in summarized_results:
-        if summarized_results['performance_accepted'] is False:
-            print("Your targets performance tests did not meet our standard.")
-            sys.exit(1)
-        else:
-            print('Your targets performance tests meet our standards, the Queen sends her regards.')
-            sys.exit(0)
+@atexit.register
+def _close_ssh_sessions():
+    with _ssh_sessions_lock:
+        clients = list(_ssh_sessions.values())
+        _ssh_sessions.clear()
+    for client in clients:
+        client.close()
 
 
-def _paramiko_connect(params):
+def _paramiko_connect(params, attempts=SSH_CONNECT_ATTEMPTS, delay=SSH_RETRY_DELAY):
     """
-    Create ssh connection with client
+    Create ssh connection with client, retrying connection errors
     :param params: dict, config params
+    :param attempts: int, connection attempts
+    :param delay: float, seconds between attempts
     :return: paramiko client, conn client
     """
+    for attempt in range(1, attempts + 1):
+        try:
+            return _paramiko_connect_once(params)
+        except paramiko.ssh_exception.AuthenticationException:
+            raise
+        except (socket.error, paramiko.SSHException) as e:
+            if attempt == attempts:
+                raise
+            print("Bee {} connection failed ({}), retrying.".format(params.get('i'), e))
+            time.sleep(delay)
+
+
+def _paramiko_connect_once(params):
+    """
+    :param params: dict, config params
+    :return: paramiko client
+    """
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
@@ -1399,7 +2317,9 @@ def _paramiko_connect(params):
         try:
             client.connect(params['instance_name'],
                            username=params['username'],
-                           timeout=10
+                           timeout=SSH_CONNECT_TIMEOUT,
+                           banner_timeout=SSH_CONNECT_TIMEOUT,
+                           auth_timeout=SSH_CONNECT_TIMEOUT
                            )
         except paramiko.ssh_exception.AuthenticationException:
             raise Exception("Pem key {} not found, all other authentication methods failed".format(pem_path))
@@ -1408,373 +2328,14 @@ def _paramiko_connect(params):
             params['instance_name'],
             username=params['username'],
             key_filename=pem_path,
-            timeout=10)
+            timeout=SSH_CONNECT_TIMEOUT,
+            banner_timeout=SSH_CONNECT_TIMEOUT,
+            auth_timeout=SSH_CONNECT_TIMEOUT)
     return client
 
 
-def _hurl_attack(params):
-    """
-    Test the target URL with requests.
-
-    Intended for use with multiprocessing.
-
-    hurl:
-    https://github.com/VerizonDigital/hurl
-
-    :param params:
-    :return:
-    """
-
-    # TODO: Create a hurl binary for amazon linux that can use
-    raise NotImplementedError("This feature is disabled for now.")
-
-    print('Bee %i is joining the swarm.' % params['i'])
-
-    client = _paramiko_connect(params)
-
-    try:
-
-        print('Bee %i is firing her machine gun. Bang bang!' % params['i'])
-
-        options = ''
-        if params['headers'] is not '':
-            for h in params['headers'].split(';'):
-                if h != '':
-                    options += ' -H "%s"' % h.strip()
-
-        if params['contenttype'] is not '':
-            options += ' -H \"Content-Type : %s\"' % params['contenttype']
-
-        stdin, stdout, stderr = client.exec_command('mktemp')
-        # paramiko's read() returns bytes which need to be converted back to a str
-        params['csv_filename'] = IS_PY2 and stdout.read().strip() or stdout.read().decode('utf-8').strip()
-        if params['csv_filename']:
-            options += ' -o %(csv_filename)s' % params
-        else:
-            print("Bee {} ({}) lost sight of the target (connection timed out creating csv_filename)."
-                  "".format(params['i'], params['instance_name']))
-            return None
-
-        if params['post_file']:
-            pem_file_path=_get_pem_path(params['key_name'])
-            scp_command = "scp -q -o 'StrictHostKeyChecking=no' -i %s %s %s@%s:~/" \
-                          "".format((pem_file_path,params['post_file'], params['username'], params['instance_name']))
-            os.system(scp_command)
-            options += ' -d ~/%s' % params['post_file']
-
-        if params['cookies'] is not '':
-            options += ' -H \"Cookie: %s;\"' % params['cookies']
-
-        if params['basic_auth'] is not '':
-            options += ' -H \"Authorization : Basic %s\"' % params['basic_auth']
-
-        if params['seconds']:
-            options += ' -l %d' % params['seconds']
-
-        if params['rate']:
-            options += ' -A %d' % params['rate']
-
-        if params['responses_per']:
-            options += ' -L'
-
-        if params['verb'] is not '':
-            options += ' -X %s' % params['verb']
-
-        if params['threads']:
-            options += ' -t %d' % params['threads']
-
-        if params['fetches']:
-            options += ' -f %d' % params['fetches']
-
-        if params['timeout']:
-            options += ' -T %d' % params['timeout']
-
-        if params['send_buffer']:
-            options += ' -S %d' % params['send_buffer']
-
-        if params['recv_buffer']:
-            options += ' -R %d' % params['recv_buffer']
-
-        params['options'] = options
-
-        # benchmark_command
-        hurl_command = 'hurl %(url)s -p %(concurrent_requests)s %(options)s -j' % params
-        stdin, stdout, stderr = client.exec_command(hurl_command)
-
-        response = defaultdict(int)
-
-        # paramiko's read() returns bytes which need to be converted back to a str
-        hurl_results = IS_PY2 and stdout.read() or stdout.read().decode('utf-8')
-
-        # print output for each instance if -o/--long_output is supplied
-        def _long_output():
-            '''if long_output option,.. display info per bee instead of summarized version'''
-            tabspace=''
-            singletab=()
-            doubletabs = ('seconds', 'connect-ms-min',
-                          'fetches', 'bytes-per-sec',
-                          'end2end-ms-min',
-                          'max-parallel', 'response-codes',
-                          'end2end-ms-max', 'connect-ms-max')
-            trippletab= 'bytes'
-            try:
-                print("Bee: {}".format(params['instance_id']))
-                for k, v in list(response.items()):
-                    if k == 'response-codes':
-                        print(k)
-                        tabspace='\t'
-                        for rk, rv in list(v.items()):
-                            print("{}{}:{}{}".format(tabspace, rk, tabspace + tabspace, rv))
-                        continue
-                    if k in doubletabs:
-                        tabspace='\t\t'
-                    elif k in trippletab:
-                        tabspace='\t\t\t'
-                    else:
-                        tabspace='\t'
-                    print("{}:{}{}".format(k, tabspace, v))
-                print("\n")
-
-            except Exception as e:
-                print("Please check the url entered, also possible no requests were successful Line: 1018, {}"
-                      "".format(e))
-                return None
-
-        # create the response dict to return to hurl_attack()
-        stdin, stdout, stderr = client.exec_command('cat %(csv_filename)s' % params)
-        try:
-            hurl_json = dict(json.loads(stdout.read().decode('utf-8')))
-            for k ,v in list(hurl_json.items()):
-                response[k] = v
-
-            # check if user wants output for separate instances and display if so
-            if params['long_output']:
-                print(hurl_command)
-                print("\n", params['instance_id'] + "\n",params['instance_name'] + "\n" , hurl_results)
-                _long_output()
-                time.sleep(.02)
-
-        except:
-            print("Please check the url entered, also possible no requests were successful Line: 1032")
-            return None
-        finally:
-            print("Bee {:d} is out of ammo.".format(params['i']))
-            client.close()
-            return response
-
-        # # TODO: Code is unreachable:
-        # # print(hurl_json['response-codes'])
-        # response['request_time_cdf'] = []
-        # for row in csv.DictReader(stdout):
-        #     row["Time in ms"] = float(row["Time in ms"])
-        #     response['request_time_cdf'].append(row)
-        # if not response['request_time_cdf']:
-        #     print('Bee %i lost sight of the target (connection timed out reading csv).' % params['i'])
-        #     return None
-        #
-        # print("Bee {:d} is out of ammo.".format(params['i']))
-        #
-        # client.close()
-        #
-        # return response
-    except socket.error as e:
-        return e
-    except Exception as e:
-        traceback.print_exc()
-        print()
-        raise e
-
-
-def _hurl_summarize_results(results, params, csv_filename):
-    """
-    Hurl results summary
-    :param results:
-    :param params:
-    :param csv_filename:
-    :return:
-    """
-
-    summarized_results = defaultdict(int)
-    summarized_results['timeout_bees'] = [r for r in results if r is None]
-    summarized_results['exception_bees'] = [r for r in results if type(r) == socket.error]
-    summarized_results['complete_bees'] = [r for r in results if r is not None and type(r) != socket.error]
-    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
-    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if type(r) == socket.error]
-    summarized_results['complete_bees_params'] = [p for r, p in zip(results, params) if r and type(r) != socket.error]
-    summarized_results['num_timeout_bees'] = len(summarized_results['timeout_bees'])
-    summarized_results['num_exception_bees'] = len(summarized_results['exception_bees'])
-    summarized_results['num_complete_bees'] = len(summarized_results['complete_bees'])
-
-    complete_results = [r['fetches'] for r in summarized_results['complete_bees']]
-    summarized_results['total_complete_requests'] = sum(complete_results)
-
-    # make summarized_results based of the possible response codes hurl gets
-    reported_response_codes = [r['response-codes'] for r in [x for x in summarized_results['complete_bees']]]
-    for i in reported_response_codes:
-        if isinstance(i, dict):
-            for k , v in list(i.items()):
-                if k.startswith('20'):
-                    summarized_results['total_number_of_200s']+=float(v)
-                elif k.startswith('30'):
-                    summarized_results['total_number_of_300s']+=float(v)
-                elif k.startswith('40'):
-                    summarized_results['total_number_of_400s']+=float(v)
-                elif k.startswith('50'):
-                    summarized_results['total_number_of_500s']+=float(v)
-
-    complete_results = [r['bytes'] for r in summarized_results['complete_bees']]
-    summarized_results['total_bytes'] = sum(complete_results)
-
-    complete_results = [r['seconds'] for r in summarized_results['complete_bees']]
-    summarized_results['seconds'] = max(complete_results)
-
-    complete_results = [r['connect-ms-max'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-max'] = max(complete_results)
-
-    complete_results = [r['1st-resp-ms-max'] for r in summarized_results['complete_bees']]
-    summarized_results['1st-resp-ms-max'] = max(complete_results)
-
-    complete_results = [r['1st-resp-ms-mean'] for r in summarized_results['complete_bees']]
-    summarized_results['1st-resp-ms-mean'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['fetches-per-sec'] for r in summarized_results['complete_bees']]
-    summarized_results['fetches-per-sec'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['fetches'] for r in summarized_results['complete_bees']]
-    summarized_results['total-fetches'] = sum(complete_results)
-
-    complete_results = [r['connect-ms-min'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-min'] = min(complete_results)
-
-    complete_results = [r['bytes-per-sec'] for r in summarized_results['complete_bees']]
-    summarized_results['bytes-per-second-mean'] = old_div(sum(complete_results),
-                                                          summarized_results['num_complete_bees'])
-
-    complete_results = [r['end2end-ms-min'] for r in summarized_results['complete_bees']]
-    summarized_results['end2end-ms-min'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['mean-bytes-per-conn'] for r in summarized_results['complete_bees']]
-    summarized_results['mean-bytes-per-conn'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['connect-ms-mean'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-mean'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    if summarized_results['num_complete_bees'] == 0:
-        summarized_results['mean_response'] = "no bees are complete"
-    else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['connect-ms-mean'] for r in summarized_results['complete_bees']]
-    if summarized_results['num_complete_bees'] == 0:
-        summarized_results['mean_response'] = "no bees are complete"
-    else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-
-    summarized_results['tpr_bounds'] = params[0]['tpr']
-    summarized_results['rps_bounds'] = params[0]['rps']
-
-    if summarized_results['tpr_bounds'] is not None:
-        if summarized_results['mean_response'] < summarized_results['tpr_bounds']:
-            summarized_results['performance_accepted'] = True
-        else:
-            summarized_results['performance_accepted'] = False
-
-    if summarized_results['rps_bounds'] is not None:
-        if summarized_results['mean_requests'] > summarized_results['rps_bounds'] and \
-                summarized_results['performance_accepted'] is True or None:
-            summarized_results['performance_accepted'] = True
-        else:
-            summarized_results['performance_accepted'] = False
-
-    summarized_results['request_time_cdf'] = _get_request_time_cdf(summarized_results['total_complete_requests'],
-                                                                   summarized_results['complete_bees'])
-    if csv_filename:
-        _create_request_time_cdf_csv(results, summarized_results['complete_bees_params'],
-                                     summarized_results['request_time_cdf'], csv_filename)
-
-    return summarized_results
-
-
-def _hurl_print_results(summarized_results):
-    """
-    Print summarized load-testing results.
-    :param summarized_results:
-    :return:
-    """
-    if summarized_results['exception_bees']:
-        print(
-            "     {:d} of your bees didn't make it to the action. They might be taking a little longer than normal to"
-            " find their machine guns, or may have been terminated without using \"bees down\".".format(
-                summarized_results['num_exception_bees']))
-
-    if summarized_results['timeout_bees']:
-        print("     Target timed out without fully responding to %i bees." % summarized_results['num_timeout_bees'])
-
-    if summarized_results['num_complete_bees'] == 0:
-        print("     No bees completed the mission. Apparently your bees are peace-loving hippies.")
-        return
-    print("\nSummarized Results")
-    print("     Total bytes:\t\t%i" % summarized_results['total_bytes'])
-    print("     Seconds:\t\t\t%i" % summarized_results['seconds'])
-    print("     Connect-ms-max:\t\t%f" % summarized_results['connect-ms-max'])
-    print("     1st-resp-ms-max:\t\t%f" % summarized_results['1st-resp-ms-max'])
-    print("     1st-resp-ms-mean:\t\t%f" % summarized_results['1st-resp-ms-mean'])
-    print("     Fetches/sec mean:\t\t%f" % summarized_results['fetches-per-sec'])
-    print("     connect-ms-min:\t\t%f" % summarized_results['connect-ms-min'])
-    print("     Total fetches:\t\t%i" % summarized_results['total-fetches'])
-    print("     bytes/sec mean:\t\t%f" % summarized_results['bytes-per-second-mean'])
-    print("     end2end-ms-min mean:\t%f" % summarized_results['end2end-ms-min'])
-    print("     mean-bytes-per-conn:\t%f" % summarized_results['mean-bytes-per-conn'])
-    print("     connect-ms-mean:\t\t%f" % summarized_results['connect-ms-mean'])
-    print("\nResponse Codes:")
-
-    print("     2xx:\t\t\t%i" % summarized_results['total_number_of_200s'])
-    print("     3xx:\t\t\t%i" % summarized_results['total_number_of_300s'])
-    print("     4xx:\t\t\t%i" % summarized_results['total_number_of_400s'])
-    print("     5xx:\t\t\t%i" % summarized_results['total_number_of_500s'])
-    print()
-
-    if 'rps_bounds' in summarized_results and summarized_results['rps_bounds'] is not None:
-        print("     Requests per second:\t%f [#/sec] (upper bounds)" % summarized_results['rps_bounds'])
-
-    if 'tpr_bounds' in summarized_results and summarized_results['tpr_bounds'] is not None:
-        print("     Time per request:\t\t%f [ms] (lower bounds)" % summarized_results['tpr_bounds'])
-
-    if 'performance_accepted' in summarized_results:
-        print("     Performance check:\t\t%s" % summarized_results['performance_accepted'])
-
-    if summarized_results['mean_response'] < 500:
-        print("Mission Assessment: Target crushed bee offensive.")
-    elif summarized_results['mean_response'] < 1000:
-        print("Mission Assessment: Target successfully fended off the swarm.")
-    elif summarized_results['mean_response'] < 1500:
-        print("Mission Assessment: Target wounded, but operational.")
-    elif summarized_results['mean_response'] < 2000:
-        print("Mission Assessment: Target severely compromised.")
-    else:
-        print("Mission Assessment: Swarm annihilated target.")
-
-
-def _get_new_state_file_name(zone):
-    """
-    Take zone and return multi regional bee file,
-    from ~/.bees to ~/.bees.${region}
-    :param zone:
-    :return:
-    """
-    return '{}.{}'.format(STATE_FILENAME, zone)
-
-
 def _get_existing_regions():
     """
-    return a list of zone name strings from looking at
-    existing region ~/.bees.* files
-    :return:
+    :return: list, the zones with bees on the roster. Only bees2 discover puts bees found by their tags on it.
     """
-    existing_regions = []
-    possible_files = os.listdir(os.path.expanduser('~'))
-    for f in possible_files:
-        something = re.search(r'\.bees2\.(.*)', f)
-        existing_regions.append(something.group(1)) if something else "no"
-    return existing_regions
+    return roster.get_zones()
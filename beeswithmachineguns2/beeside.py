@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""
+Runs on the bees next to the load generator and reduces its raw output to a compact json summary,
+so what travels back over ssh stays the same size whether the bee fired ten thousand or a hundred million requests.
+
+ab uses a single core, with --run beeside.py starts one ab per core, splits the requests and the concurrency
+across them and merges their summaries on the bee. With --progress it also prints the responses of each interval
+as they stream, a progress record (see progress.py). ab only times the requests in its -g file once it is done,
+and doesn't say which requests failed while it runs, so the records carry the status codes only.
+On SIGTERM the ab processes are interrupted, they report what they did so far and the summary covers that.
+
+Shipped to the bees together with histogram.py, which has to sit in the same directory.
+Kept to the standard library and python 2/3 compatible.
+
+usage:
+  ab -v 3 -r ... -g GNUPLOT_FILE URL 2>/dev/null | python beeside.py --gnuplot GNUPLOT_FILE
+  python beeside.py --run -n REQUESTS -c CONCURRENCY -d WORK_DIR [-P PROCESSES] -- -v 3 -r ... URL
+"""
+from __future__ import division
+from __future__ import print_function
+
+import json
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+try:
+    from .histogram import LatencyHistogram, read_ab_gnuplot
+except (ImportError, ValueError):
+    from histogram import LatencyHistogram, read_ab_gnuplot
+
+# Every line of ab -v 3 output is matched once, against one pattern: the status line ab prints for every response,
+# the failed requests detail and the summary lines. The name of the group that matched says what the line is.
+AB_LINE = re.compile(
+    r'HTTP/\d\.\d (?P<status>\d{3})'
+    r'|\s+\(Connect: (?P<failed_requests_connect>\d+), Receive: (?P<failed_requests_receive>\d+), '
+    r'Length: (?P<failed_requests_length>\d+), Exceptions: (?P<failed_requests_exceptions>\d+)\)'
+    r'|Complete requests:\s+(?P<complete_requests>\d+)'
+    r'|Failed requests:\s+(?P<failed_requests>\d+)'
+    r'|Non-2xx responses:\s+(?P<non_2xx_responses>\d+)'
+    r'|Total transferred:\s+(?P<total_bytes>\d+) bytes'
+    r'|HTML transferred:\s+(?P<html_bytes>\d+) bytes'
+    r'|Requests per second:\s+(?P<requests_per_second>[0-9.]+) \[#/sec\] \(mean\)'
+    r'|Time per request:\s+(?P<ms_per_request>[0-9.]+) \[ms\] \(mean\)'
+)
+AB_FAILED_DETAIL_KEYS = ('failed_requests_connect', 'failed_requests_receive', 'failed_requests_length',
+                         'failed_requests_exceptions')
+
+
+class AbParser(object):
+    """
+    Reads ab -v 3 output a line at a time as it arrives and keeps only counters, whatever the length of the run
+    """
+
+    def __init__(self):
+        self.summary = {
+            'status_codes': {},
+            'failed_requests_connect': 0,
+            'failed_requests_receive': 0,
+            'failed_requests_length': 0,
+            'failed_requests_exceptions': 0,
+            'non_2xx_responses': 0,
+            'total_bytes': 0,
+            'html_bytes': 0,
+        }
+
+    def feed(self, line):
+        """
+        :param line: str, one line of ab stdout
+        """
+        match = AB_LINE.match(line)
+        if match is None:
+            return
+
+        key = match.lastgroup
+        if key == 'status':
+            status_codes = self.summary['status_codes']
+            code = match.group('status')
+            status_codes[code] = status_codes.get(code, 0) + 1
+        elif key == 'failed_requests_exceptions':
+            for detail_key in AB_FAILED_DETAIL_KEYS:
+                self.summary[detail_key] = float(match.group(detail_key))
+        else:
+            self.summary[key] = float(match.group(key))
+
+    def result(self, gnuplot_lines):
+        """
+        :param gnuplot_lines: iterable of str, the ab -g file
+        :return: dict, the summary the controller consumes, without ms_per_request when ab didn't finish
+        """
+        summary = self.summary
+        for status_class in range(2, 6):
+            summary['number_of_%d00s' % status_class] = sum(count for code, count in summary['status_codes'].items()
+                                                            if code.startswith(str(status_class)))
+
+        summary['latency_histogram'] = read_ab_gnuplot(gnuplot_lines).to_dict()
+        return summary
+
+
+def summarize_ab(lines, gnuplot_lines):
+    """
+    Reduce ab output to the summary the controller consumes
+    :param lines: iterable of str, ab -v 3 stdout
+    :param gnuplot_lines: iterable of str, the ab -g file
+    :return: dict, without ms_per_request when ab didn't finish
+    """
+    parser = AbParser()
+    for line in lines:
+        parser.feed(line)
+    return parser.result(gnuplot_lines)
+
+
+def split_evenly(total, parts):
+    """
+    Split a total in parts that differ by at most one, the bigger parts first
+    :param total: int
+    :param parts: int
+    :return: list of ints
+    """
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def get_cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def merge_ab_summaries(summaries, concurrency):
+    """
+    Merge the summaries of ab processes that ran side by side
+    :param summaries: list of dicts, from summarize_ab, all with ms_per_request
+    :param concurrency: int, total concurrency of the processes
+    :return: dict, summarize_ab schema
+    """
+    histogram = LatencyHistogram()
+    summary = {'status_codes': {}}
+    for process in summaries:
+        histogram.merge(LatencyHistogram.from_dict(process.pop('latency_histogram')))
+        for code, count in process.pop('status_codes').items():
+            summary['status_codes'][code] = summary['status_codes'].get(code, 0) + count
+        process.pop('ms_per_request')
+        for key, value in process.items():
+            summary[key] = summary.get(key, 0) + value
+
+    # The processes overlap, so their rates add up. Same meaning as ab's "Time per request (mean)"
+    if summary.get('requests_per_second'):
+        summary['ms_per_request'] = concurrency * 1000.0 / summary['requests_per_second']
+    summary['processes'] = len(summaries)
+    summary['latency_histogram'] = histogram.to_dict()
+    return summary
+
+
+def _feed_lines(stream, parser):
+    for line in iter(stream.readline, ''):
+        parser.feed(line)
+    stream.close()
+
+
+def _report_progress(parsers, interval, started_at, stopped):
+    """
+    Print the status codes the ab processes reported since the last record, every interval seconds and once more
+    when stopped
+    """
+    reported = {}
+    while True:
+        last = stopped.wait(interval)
+        totals = {}
+        for parser in parsers:
+            # A copy, the readers keep counting
+            for code, count in dict(parser.summary['status_codes']).items():
+                totals[code] = totals.get(code, 0) + count
+        status_codes = dict((code, count - reported.get(code, 0)) for code, count in totals.items()
+                            if count != reported.get(code, 0))
+        reported = totals
+        print(json.dumps({'progress': time.time() - started_at, 'requests': sum(status_codes.values()),
+                          'status_codes': status_codes}))
+        sys.stdout.flush()
+        if last:
+            return
+
+
+def run_ab(ab_args, requests, concurrency, work_dir, processes=0, start_at=None, progress=None):
+    """
+    Fire one ab per process, requests and concurrency split across them
+    :param ab_args: list of str, ab arguments without -n, -c and -g
+    :param requests: int
+    :param concurrency: int
+    :param work_dir: str, directory for the ab -g files
+    :param processes: int, 0 for one per core
+    :param start_at: float, epoch seconds to start firing at, None to start at once
+    :param progress: float, seconds between progress records printed while ab runs, None for none
+    :return: dict, merged summary with started_at and finished_at, without ms_per_request when no ab finished
+    """
+    processes = max(1, min(processes or get_cpu_count(), concurrency))
+    splits = list(zip(split_evenly(requests, processes), split_evenly(concurrency, processes)))
+
+    devnull = open(os.devnull, 'w')
+    running = []
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        # ab prints its results when interrupted
+        stopping.set()
+        for process, _, _, _, _ in running:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGTERM, stop)
+    if start_at:
+        stopping.wait(max(0, start_at - time.time()))
+    started_at = time.time()
+    for i, (n, c) in enumerate(splits):
+        if stopping.is_set():
+            break
+        gnuplot_path = os.path.join(work_dir, 'gnuplot.%d.tsv' % i)
+        command = ['ab', '-n', str(n), '-c', str(c), '-g', gnuplot_path] + ab_args
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=devnull, universal_newlines=True)
+        # ab output is parsed as it comes, one reader per process so none of them blocks on a full pipe
+        parser = AbParser()
+        reader = threading.Thread(target=_feed_lines, args=(process.stdout, parser))
+        reader.daemon = True
+        reader.start()
+        running.append((process, reader, parser, gnuplot_path, c))
+
+    stopped = threading.Event()
+    if progress:
+        reporter = threading.Thread(target=_report_progress,
+                                    args=([parser for _, _, parser, _, _ in running], progress, started_at, stopped))
+        reporter.daemon = True
+        reporter.start()
+
+    for process, reader, parser, gnuplot_path, c in running:
+        process.wait()
+        reader.join()
+    finished_at = time.time()
+    if progress:
+        # The last partial interval, before the summary
+        stopped.set()
+        reporter.join()
+    devnull.close()
+
+    summaries = []
+    finished_concurrency = 0
+    for process, reader, parser, gnuplot_path, c in running:
+        gnuplot_lines = open(gnuplot_path) if os.path.exists(gnuplot_path) else []
+        summary = parser.result(gnuplot_lines)
+        if 'ms_per_request' in summary:
+            summaries.append(summary)
+            finished_concurrency += c
+
+    summary = merge_ab_summaries(summaries, finished_concurrency)
+    summary['started_at'] = started_at
+    summary['finished_at'] = finished_at
+    return summary
+
+
+def main():
+    parser = OptionParser(usage="ab -v 3 ... -g GNUPLOT_FILE URL | python beeside.py --gnuplot GNUPLOT_FILE\n"
+                                "       python beeside.py --run -n REQUESTS -c CONCURRENCY -d WORK_DIR -- AB_ARGS")
+    parser.add_option('-g', '--gnuplot', dest='gnuplot', help="The ab -g file with the per request timings.")
+    parser.add_option('--run', dest='run', action='store_true', default=False,
+                      help="Run ab itself, one process per core, with the arguments after --.")
+    parser.add_option('-n', dest='requests', type='int', default=1, help="--run: Number of requests (default: 1).")
+    parser.add_option('-c', dest='concurrency', type='int', default=1,
+                      help="--run: Number of concurrent requests (default: 1).")
+    parser.add_option('-d', '--work-dir', dest='work_dir', default='.',
+                      help="--run: Directory for the ab -g files (default: .).")
+    parser.add_option('-P', '--processes', dest='processes', type='int', default=0,
+                      help="--run: ab processes (default: one per core).")
+    parser.add_option('--start-at', dest='start_at', type='float', default=None,
+                      help="--run: Epoch seconds to start firing at, to start together with other bees.")
+    parser.add_option('--progress', dest='progress', type='float', default=None,
+                      help="--run: Seconds between progress records (default: none).")
+    (options, args) = parser.parse_args()
+
+    if options.run:
+        if not args:
+            parser.error('Please enter the ab arguments after --.')
+        summary = run_ab(args, options.requests, options.concurrency, options.work_dir, options.processes,
+                         options.start_at, options.progress)
+    else:
+        gnuplot_lines = []
+        if options.gnuplot:
+            try:
+                gnuplot_lines = open(options.gnuplot)
+            except IOError:
+                pass
+        summary = summarize_ab(sys.stdin, gnuplot_lines)
+    print(json.dumps(summary))
+    if 'ms_per_request' not in summary:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
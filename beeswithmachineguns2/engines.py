@@ -0,0 +1,296 @@
+"""
+Load engines the bees attack with.
+
+An engine declares what it needs on a bee (scripts to upload, an install command and a check that it runs),
+the command line that fires it and how its summary is read into the result _summarize_results consumes.
+The bee agent (agent.py) runs the command line without a shell and returns the last json line it prints.
+New engines subclass Engine and are added with register_engine, the attack pipeline stays the same.
+"""
+from __future__ import division
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from .histogram import LatencyHistogram
+
+ENGINES = {}
+
+# Placeholders in command lines, filled in by the agent on the bee
+WORK_DIR = '{work_dir}'  # fresh directory of the run, removed after it
+TOOLS_DIR = '{tools_dir}'  # where the tools of every engine are
+HOME_DIR = '{home}'  # the bee user's home
+
+# Keys every engine result has, counts are floats like ab reports them
+RESULT_DEFAULTS = {
+    'complete_requests': 0.0,
+    'failed_requests': 0.0,
+    'failed_requests_connect': 0.0,
+    'failed_requests_receive': 0.0,
+    'failed_requests_length': 0.0,
+    'failed_requests_exceptions': 0.0,
+    'number_of_200s': 0,
+    'number_of_300s': 0,
+    'number_of_400s': 0,
+    'number_of_500s': 0,
+    'total_bytes': 0,
+    'requests_per_second': 0.0,
+    'status_codes': {},
+}
+
+
+def register_engine(cls):
+    """
+    Make an engine available to bees2 attack --engine
+    :param cls: Engine subclass with a name
+    :return: cls, so it can be used as a class decorator
+    """
+    ENGINES[cls.name] = cls()
+    return cls
+
+
+def get_engine(name):
+    """
+    :param name: str, registered engine name
+    :return: Engine
+    """
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError("Unknown engine {}, pick one of {}".format(name, ', '.join(sorted(ENGINES))))
+
+
+def get_tools():
+    """
+    :return: list, file names of the tools of every engine
+    """
+    return sorted(set(tool for engine in ENGINES.values() for tool in engine.tools))
+
+
+def _get_header_args(params, flag='-H'):
+    args = []
+    if params['headers'] != '':
+        for h in params['headers'].split(';'):
+            if h != '':
+                args += [flag, h.strip()]
+    return args
+
+
+def _get_progress_args(params):
+    # Seconds between the progress records of the live view, see progress.py
+    if params.get('progress'):
+        return ['--progress', '%g' % params['progress']]
+    return []
+
+
+def _get_post_file_path(params):
+    # Uploaded next to the tools by content, see bees._upload_payload
+    return '%s/payloads/%s' % (TOOLS_DIR, params['post_file_digest'])
+
+
+class Engine(object):
+    """
+    Base class of the load engines
+    """
+    name = None
+    # Scripts of this package the engine runs on the bee, uploaded next to the agent
+    tools = []
+    # Idempotent shell command installing the engine on a bee
+    install_command = None
+    # Shell command that exits 0 once the engine runs
+    check_command = None
+    # Whether the engine waits for start_at itself, the agent waits for the others
+    schedules_start = True
+    # Whether the engine prints progress records, for the live view and the service level checks
+    progress = False
+
+    def argv(self, params):
+        """
+        Command line firing the engine on a bee, run by the agent without a shell.
+        It prints a json summary as its last json line, lines with a progress key are streamed as they come.
+        Engines that print progress records (see progress.py) do so every params['progress'] seconds.
+        :param params: dict, bee params from _get_paramiko_conn_params with start_at, epoch seconds on the bee's
+            clock the engine starts firing at
+        :return: list of str, with the WORK_DIR, TOOLS_DIR and HOME_DIR placeholders
+        """
+        raise NotImplementedError
+
+    def command(self, params):
+        """
+        :param params: dict, as for argv
+        :return: str, argv as a shell command, to show what runs
+        """
+        return ' '.join(quote(arg) for arg in self.argv(params))
+
+    def parse(self, summary):
+        """
+        Map the engine's own summary to the result schema, by default the engine prints it already.
+        started_at and finished_at in the summary are the bee's epoch seconds the engine fired between.
+        :param summary: dict, the last json line of the engine
+        :return: dict, summary or None when the engine failed
+        """
+        return summary
+
+    def result(self, summary):
+        """
+        Read the engine summary into the result schema _summarize_results consumes
+        :param summary: dict, the last json line of the engine, from the agent
+        :return: dict or None when the engine failed
+        """
+        summary = self.parse(summary)
+        if not summary or 'ms_per_request' not in summary:
+            return None
+
+        response = dict(RESULT_DEFAULTS, **summary)
+        for key in ('latency_histogram', 'uncorrected_latency_histogram'):
+            if isinstance(response.get(key), dict):
+                response[key] = LatencyHistogram.from_dict(response[key])
+        response.setdefault('latency_histogram', LatencyHistogram())
+        return response
+
+
+@register_engine
+class AbEngine(Engine):
+    """
+    Apache bench, one process per core started by beeside.py, which merges their output to a json summary
+    """
+    name = 'ab'
+    tools = ['beeside.py', 'histogram.py']
+    # https://www.thatsgeeky.com/2011/11/installing-apachebench-without-apache-on-amazons-linux/
+    install_command = 'which ab || sudo yum install httpd-tools -y'
+    check_command = 'ab -V'
+    progress = True
+
+    def argv(self, params):
+        args = ['-v', '3', '-r'] + _get_header_args(params)
+
+        if params['contenttype'] != '':
+            args += ['-T', params['contenttype']]
+
+        if params['post_file']:
+            args += ['-p', _get_post_file_path(params)]
+
+        if params['keep_alive']:
+            args += ['-k']
+
+        if params['cookies'] != '':
+            args += ['-H', 'Cookie: %s;sessionid=NotARealSessionID;' % params['cookies']]
+        else:
+            args += ['-C', 'sessionid=NotARealSessionID']
+
+        if params['ciphers'] != '':
+            args += ['-Z', params['ciphers']]
+
+        if params['basic_auth'] != '':
+            args += ['-A', params['basic_auth']]
+
+        # ab output is reduced next to ab by beeside.py, resolves issue #194, too much data sent over SSH control
+        # channel to BWMG. Only the json summary travels back, whatever the number of requests.
+        # beeside.py splits the requests and concurrency of the bee across one ab per core, -n, -c and the per
+        # request timings (-g) are set per process.
+        return ['python', TOOLS_DIR + '/beeside.py', '--run', '-n', str(params['num_requests']),
+                '-c', str(params['concurrent_requests']), '-d', WORK_DIR, '-P', str(params['processes']),
+                '--start-at', '%f' % params['start_at']] + _get_progress_args(params) + ['--'] + args + \
+            [params['url']]
+
+
+@register_engine
+class AioEngine(Engine):
+    """
+    asyncio engine, one event loop per core, keep-alive, pipelining and constant rate
+    """
+    name = 'aio'
+    tools = ['aioload.py', 'histogram.py']
+    # aioload.py needs python 3, python36 on older Amazon Linux
+    install_command = 'which python3 || sudo yum install -y python3 || sudo yum install -y python36'
+    check_command = 'python3 -V'
+    progress = True
+
+    def argv(self, params):
+        args = _get_header_args(params)
+
+        if params['contenttype'] != '':
+            args += ['-T', params['contenttype']]
+
+        if params['post_file']:
+            args += ['-p', _get_post_file_path(params)]
+
+        if params['keep_alive']:
+            args += ['-k', '--pipeline', str(params['pipeline'])]
+
+        if params['cookies'] != '':
+            args += ['-H', 'Cookie: %s' % params['cookies']]
+
+        if params['basic_auth'] != '':
+            args += ['-A', params['basic_auth']]
+
+        if params['processes']:
+            args += ['-P', str(params['processes'])]
+
+        if params['rate']:
+            # constant throughput, latency measured from when each request was due
+            args += ['--rate', '%f' % params['rate']]
+
+        return ['python3', TOOLS_DIR + '/aioload.py', '-n', str(params['num_requests']),
+                '-c', str(params['concurrent_requests']), '--start-at', '%f' % params['start_at']] + \
+            _get_progress_args(params) + args + [params['url']]
+
+
+@register_engine
+class HurlEngine(Engine):
+    """
+    hurl, https://github.com/VerizonDigital/hurl
+    There is no package for Amazon Linux, the binary has to be on the bees' path (i.e. in a custom AMI).
+    """
+    name = 'hurl'
+    check_command = 'which hurl'
+    # hurl can't be scheduled, the agent starts it at start_at and times it
+    schedules_start = False
+
+    def argv(self, params):
+        args = _get_header_args(params)
+
+        if params['contenttype'] != '':
+            args += ['-H', 'Content-Type: %s' % params['contenttype']]
+
+        if params['post_file']:
+            args += ['-d', _get_post_file_path(params)]
+
+        if params['cookies'] != '':
+            args += ['-H', 'Cookie: %s;' % params['cookies']]
+
+        if params['basic_auth'] != '':
+            args += ['-H', 'Authorization: Basic %s' % params['basic_auth']]
+
+        for key, flag in (('seconds', '-l'), ('rate', '-A'), ('threads', '-t'), ('fetches', '-f'),
+                          ('timeout', '-T'), ('send_buffer', '-S'), ('recv_buffer', '-R')):
+            if params.get(key):
+                args += [flag, '%d' % params[key]]
+
+        if params.get('verb'):
+            args += ['-X', params['verb']]
+
+        # hurl writes its json report to a file, on several lines
+        hurl_command = ' '.join(quote(arg) for arg in ['hurl', params['url'], '-p', str(params['concurrent_requests'])]
+                                + args + ['-j', '-o', WORK_DIR + '/hurl.json'])
+        return ['sh', '-c', '%s >/dev/null 2>&1; tr -d "\\n" < %s/hurl.json; echo' % (hurl_command, WORK_DIR)]
+
+    def parse(self, hurl_json):
+        if not hurl_json or not hurl_json.get('fetches'):
+            return None
+
+        summary = {
+            'complete_requests': float(hurl_json['fetches']),
+            'requests_per_second': float(hurl_json.get('fetches-per-sec', 0)),
+            'ms_per_request': float(hurl_json.get('end2end-ms-mean', hurl_json.get('connect-ms-mean', 0))),
+            'total_bytes': hurl_json.get('bytes', 0),
+            'status_codes': dict((str(code), int(count)) for code, count in
+                                 (hurl_json.get('response-codes') or {}).items()),
+            'started_at': hurl_json.get('started_at'),
+            'finished_at': hurl_json.get('finished_at'),
+        }
+        for status_class in range(2, 6):
+            summary['number_of_%d00s' % status_class] = sum(count for code, count in summary['status_codes'].items()
+                                                            if code.startswith(str(status_class)))
+        return summary
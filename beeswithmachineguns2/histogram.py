@@ -0,0 +1,161 @@
+"""
+Mergeable latency histograms with log-linear (HDR style) buckets.
+
+Kept to the standard library and python 2/3 compatible so it can also run on the bees.
+"""
+from __future__ import division
+
+import math
+
+# Values are recorded as integer microseconds. Values below 2 ** SUB_BUCKET_BITS are exact, above that every power
+# of two is split in 2 ** (SUB_BUCKET_BITS - 1) buckets, so a bucket is never wider than 0.2% of its values.
+SUB_BUCKET_BITS = 10
+UNITS_PER_MS = 1000
+
+
+class LatencyHistogram(object):
+    """
+    Counts of request latencies in log-linear buckets.
+    The number of buckets only depends on the range of the values, not on how many were recorded,
+    and two histograms merge exactly by adding their counts.
+    """
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        return (shift << self.sub_bucket_bits) | (value >> shift)
+
+    def _highest_equivalent_value(self, index):
+        shift = index >> self.sub_bucket_bits
+        sub_bucket = index & ((1 << self.sub_bucket_bits) - 1)
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, ms, count=1):
+        """
+        Record a latency
+        :param ms: float, latency in ms
+        :param count: int, number of requests with this latency
+        :return:
+        """
+        value = max(0, int(round(ms * UNITS_PER_MS)))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this one
+        :param other: LatencyHistogram, with the same sub_bucket_bits
+        :return: self
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Can't merge histograms with {} and {} sub bucket bits"
+                             "".format(self.sub_bucket_bits, other.sub_bucket_bits))
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def percentiles(self, percents):
+        """
+        Latencies below which the given percentages of the requests fall, in one pass over the buckets
+        :param percents: list of floats, 0 - 100
+        :return: list of floats, ms, None for an empty histogram
+        """
+        if not self.count:
+            return [None for _ in percents]
+
+        ranks = sorted((max(1, int(math.ceil(percent / 100 * self.count))), i) for i, percent in enumerate(percents))
+        values = [None] * len(percents)
+        seen = 0
+        position = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while position < len(ranks) and ranks[position][0] <= seen:
+                value = min(max(self._highest_equivalent_value(index), self.min), self.max)
+                values[ranks[position][1]] = value / UNITS_PER_MS
+                position += 1
+            if position == len(ranks):
+                break
+        # Ranks above the count only come from rounding, they belong to the slowest request
+        for rank, i in ranks[position:]:
+            values[i] = self.max / UNITS_PER_MS
+        return values
+
+    def percentile(self, percent):
+        """
+        Latency below which the given percentage of the requests fall
+        :param percent: float, 0 - 100
+        :return: float, ms
+        """
+        return self.percentiles([percent])[0]
+
+    def mean(self):
+        """
+        :return: float, mean latency in ms
+        """
+        return self.total / self.count / UNITS_PER_MS if self.count else None
+
+    def to_dict(self):
+        """
+        Json friendly representation, only non empty buckets are included
+        :return: dict
+        """
+        return {
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'counts': dict((str(index), count) for index, count in self.counts.items()),
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a histogram from to_dict output
+        :param data: dict
+        :return: LatencyHistogram
+        """
+        histogram = cls(data['sub_bucket_bits'])
+        histogram.counts = dict((int(index), count) for index, count in data['counts'].items())
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+def read_ab_gnuplot(lines, histogram=None):
+    """
+    Record the total time of every request from an ab -g (gnuplot) file
+    :param lines: iterable of str, the file lines including the header
+    :param histogram: LatencyHistogram to record into, a new one by default
+    :return: LatencyHistogram
+    """
+    histogram = histogram or LatencyHistogram()
+    for line in lines:
+        # starttime  seconds  ctime  dtime  ttime  wait
+        columns = line.rstrip('\r\n').split('\t')
+        if len(columns) < 5 or columns[0] == 'starttime':
+            continue
+        try:
+            histogram.record(float(columns[4]))
+        except ValueError:
+            continue
+    return histogram
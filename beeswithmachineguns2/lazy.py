@@ -0,0 +1,26 @@
+"""
+Modules imported the first time one of their attributes is used.
+
+boto3 and paramiko take most of a second to import, bees2 --help, report or down shouldn't pay for the ones they
+don't use. benchmarks/startup.py checks that they stay out of the startup imports.
+"""
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stands for a module until it is used, i.e. paramiko = LazyModule('paramiko') then paramiko.SSHClient()
+    """
+
+    def __init__(self, name):
+        """
+        :param name: str, absolute module name
+        """
+        self._name = name
+
+    def __getattr__(self, attr):
+        # import_module returns the module imported already, from sys.modules, after the first time
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self._name)
@@ -25,21 +25,28 @@ THE SOFTWARE.
 """
 from __future__ import print_function
 
-from future import standard_library
-standard_library.install_aliases()
-from builtins import zip
+from . import aws
 from . import bees
+from . import engines
 from . import VERSION
 try:
     from urllib.parse import urlparse
 except ImportError:
-    from urllib.parse import urlparse
+    from urlparse import urlparse
 from optparse import OptionParser, OptionGroup
-import threading
-import time
 import sys
 
 
+def _print_api_stats():
+    """
+    Print the AWS API calls the command made
+    :return:
+    """
+    stats = aws.format_stats()
+    if stats:
+        print(stats)
+
+
 def parse_options():
     """
     Handle the command line arguments for spinning up bees
@@ -54,9 +61,11 @@ A utility for arming (creating) many bees (small EC2 instances) to attack
 
 commands:
   up      Start a batch of load testing servers.
+  bake    Make an image of an armed bee, up uses it by default in its region.
   attack  Begin the attack on a specific url.
   down    Shutdown and deactivate the load testing servers.
   report  Report the status of the load testing servers.
+  discover  Rebuild the roster from the tags of the bees in every region.
     """.format(VERSION))
 
     up_group = OptionGroup(parser, "up",
@@ -100,6 +109,23 @@ commands:
 
     parser.add_option_group(up_group)
 
+    bake_group = OptionGroup(parser, "bake",
+                             """Baking makes a private image of the first bee of the -z zone once it is armed with
+                             the load engines and tuning. The bee has to be up, it reboots once.""")
+    bake_group.add_option('--image-name', metavar="IMAGE_NAME", nargs=1,
+                          action='store', dest='image_name', type='string', default=None,
+                          help="The name of the image (default: bees2-<date>).")
+
+    parser.add_option_group(bake_group)
+
+    down_group = OptionGroup(parser, "down")
+    down_group.add_option('--stop', action='store_true', dest='stop', default=False,
+                          help="Stop the servers and keep them for the next up instead of terminating them.")
+    down_group.add_option('--wait', action='store_true', dest='wait', default=False,
+                          help="Wait until the servers are terminated (stopped) before exiting.")
+
+    parser.add_option_group(down_group)
+
     attack_group = OptionGroup(parser, "attack",
                                """Beginning an attack requires only that you specify the -u option with the URL you 
                                wish to target.""")
@@ -153,7 +179,9 @@ commands:
                             help="hurl only: Request command -HTTP verb to use -GET/PUT/etc. Default GET")
     attack_group.add_option('-M', '--rate', metavar="RATE", nargs=1,
                             action='store', dest='rate', type='int',
-                            help="hurl only: Max Request Rate.")
+                            help="Target request rate of the whole swarm, split across the bees. With the aio "
+                                 "engine the swarm holds this constant rate and measures latency from when each "
+                                 "request was due (wrk2 style). hurl: Max Request Rate.")
     attack_group.add_option('-a', '--threads', metavar="THREADS", nargs=1,
                             action='store', dest='threads', type='int', default=1,
                             help="hurl only: Number of parallel threads. Default: 1")
@@ -178,12 +206,43 @@ commands:
                             type='float',
                             help='The lower bounds for request per second. If this option is passed and the target '
                                  'is above the value a 1 will be returned with the report details (default: None).')
+    attack_group.add_option('--max-p99', metavar='MS', nargs=1, action='store', dest='max_p99', default=None,
+                            type='float',
+                            help='aio only: Call off the swarm when the 99th percentile latency of the swarm stays '
+                                 'above MS milliseconds for --breach-for seconds, 1 is returned (default: None).')
+    attack_group.add_option('--max-error-rate', metavar='PERCENT', nargs=1, action='store', dest='max_error_rate',
+                            default=None, type='float',
+                            help='aio only: Call off the swarm when more than PERCENT %% of the requests get no '
+                                 'response for --breach-for seconds (default: None).')
+    attack_group.add_option('--max-5xx-rate', metavar='PERCENT', nargs=1, action='store', dest='max_5xx_rate',
+                            default=None, type='float',
+                            help='ab and aio: Call off the swarm when more than PERCENT %% of the responses are 5xx '
+                                 'for --breach-for seconds (default: None).')
+    attack_group.add_option('--breach-for', metavar='SECONDS', nargs=1, action='store', dest='breach_for',
+                            default=10, type='float',
+                            help='How long a service level breach has to last before the swarm is called off '
+                                 '(default: 10).')
     attack_group.add_option('-A', '--basic_auth', metavar='basic_auth', nargs=1, action='store', dest='basic_auth',
                             default='', type='string',
                             help='BASIC authentication credentials, format auth-username:password (default: None).')
+    attack_group.add_option('-G', '--engine', metavar="ENGINE", nargs=1, action='store', dest='engine',
+                            type='choice', choices=sorted(engines.ENGINES), default='ab',
+                            help="The load generator the bees use: ab, aio for the asyncio engine that runs one "
+                                 "event loop per core, or hurl (default: ab).")
+    attack_group.add_option('--processes', metavar="PROCESSES", nargs=1, action='store', dest='processes',
+                            type='int', default=0,
+                            help="ab and aio: Load generator processes per bee, the requests and concurrency of the "
+                                 "bee are split across them (default: one per core).")
+    attack_group.add_option('--pipeline', metavar="PIPELINE", nargs=1, action='store', dest='pipeline',
+                            type='int', default=1,
+                            help="aio only: Requests in flight per keep-alive connection (default: 1).")
+    attack_group.add_option('--progress', metavar="SECONDS", nargs=1, action='store', dest='progress',
+                            type='float', default=10,
+                            help="ab and aio: Seconds between the live swarm-wide rate, error rate and latency "
+                                 "lines printed while the bees fire, 0 for none (default: 10).")
     attack_group.add_option('-j', '--hurl', metavar="HURL_COMMANDS",
                             action='store_true', dest='hurl',
-                            help="use hurl")
+                            help="use hurl, same as --engine hurl")
     attack_group.add_option('-o', '--long_output', metavar="LONG_OUTPUT",
                             action='store_true', dest='long_output',
                             help="display hurl output")
@@ -199,8 +258,6 @@ commands:
         parser.error('Please enter a command.')
 
     command = args[0]
-    # set time for in between threads
-    delay = 0.2
 
     if command == 'up':
         if not options.key:
@@ -211,33 +268,31 @@ commands:
                   'open on this group. You will need to use to the EC2 tools to open it before you will be able to '
                   'attack.')
 
-        zone_len = options.zone.split(',')
-        if len(zone_len) > 1:
-            if len(options.image.split(',')) != len(zone_len):
-                print("Your instance count does not match zone count")
-                sys.exit(1)
-            else:
-                ami_list = [a for a in options.image.split(',')]
-                zone_list = [z for z in zone_len]
-                # for each ami and zone set zone and instance
-                for tup_val in zip(ami_list, zone_list):
-                    options.image, options.zone = tup_val
-                    # running up()
-                    threading.Thread(target=bees.up, args=(options.servers, options.group,
-                                                           options.zone, options.image,
-                                                           options.type, options.login,
-                                                           options.key, options.subnet,
-                                                           options.tags, options.bid)).start()
-                    # time allowed between threads
-                    time.sleep(delay)
-        else:
-            bees.up(options.servers, options.group, options.zone, options.image, options.type, options.login,
-                    options.key, options.subnet, options.tags, options.bid)
+        zone_list = options.zone.split(',')
+        ami_list = options.image.split(',') if options.image else [None] * len(zone_list)
+        if len(ami_list) != len(zone_list):
+            print("Your instance count does not match zone count")
+            sys.exit(1)
+
+        # for each ami and zone set zone and instance
+        jobs = [(zone, (options.servers, options.group, zone, image, options.type, options.login, options.key,
+                        options.subnet, options.tags, options.bid), {})
+                for image, zone in zip(ami_list, zone_list)]
+        outcomes = bees.run_in_zones(bees.up, jobs)
+        bees._print_zone_outcomes(outcomes)
+        _print_api_stats()
+        sys.exit(bees._get_exit_code(outcomes))
 
     elif command == 'attack':
         if not options.url:
             parser.error('To run an attack you need to specify a url with -u')
 
+        if options.hurl:
+            options.engine = 'hurl'
+
+        if options.rate and options.engine == 'ab':
+            parser.error('A constant request rate with -M needs the aio engine, add --engine aio')
+
         regions_list = []
         for region in bees._get_existing_regions():
                 regions_list.append(region)
@@ -263,7 +318,6 @@ commands:
             basic_auth=options.basic_auth,
             contenttype=options.contenttype,
             sting=options.sting,
-            hurl=options.hurl,
             seconds=options.seconds,
             rate=options.rate,
             long_output=options.long_output,
@@ -273,28 +327,31 @@ commands:
             fetches=options.fetches,
             timeout=options.timeout,
             send_buffer=options.send_buffer,
-            recv_buffer=options.recv_buffer
+            recv_buffer=options.recv_buffer,
+            engine=options.engine,
+            pipeline=options.pipeline,
+            processes=options.processes,
+            progress=options.progress,
+            max_p99=options.max_p99,
+            max_error_rate=options.max_error_rate,
+            max_5xx_rate=options.max_5xx_rate,
+            breach_for=options.breach_for
         )
-        if options.hurl:
-            for region in regions_list:
-                additional_options['zone'] = region
-                threading.Thread(target=bees.hurl_attack, args=(options.url, options.number, options.concurrent),
-                                 kwargs=additional_options).start()
-                # time allowed between threads
-                time.sleep(delay)
-        else:
-            for region in regions_list:
-                additional_options['zone'] = region
-                threading.Thread(target=bees.attack, args=(options.url, options.number,
-                                                           options.concurrent), kwargs=additional_options).start()
-                # time allowed between threads
-                time.sleep(delay)
+        # All zones attack at once and are summarized together, whatever the engine
+        bees.attack(options.url, options.number, options.concurrent, zones=regions_list, **additional_options)
 
+    elif command == 'bake':
+        bees.bake(options.zone, options.image_name)
     elif command == 'down':
-        bees.down()
+        outcomes = bees.down(stop=options.stop, wait=options.wait)
+        _print_api_stats()
+        sys.exit(bees._get_exit_code(outcomes))
     elif command == 'report':
-        bees.report()
+        sys.exit(bees._get_exit_code(bees.report()))
+    elif command == 'discover':
+        bees.discover()
 
 
 def main():
+    bees.raise_open_file_limit()
     parse_options()
@@ -0,0 +1,181 @@
+"""
+Live view of an attack, merged from the progress records the bees stream while they fire.
+
+Every interval the engines print what they did since their last record (agent.py forwards it as it comes):
+  {"progress": 12.0, "requests": 5120, "errors": 3, "status_codes": {"200": 5100, "503": 20},
+   "latency_histogram": {...}}
+requests counts the responses, errors the requests that got none. latency_histogram is a LatencyHistogram.to_dict
+of the responses of the interval, engines that only time requests at the end (ab) leave it out.
+
+SloGuard checks every window against service level thresholds, so an attack can be called off once the target
+breaches them for long enough.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+from .histogram import LatencyHistogram
+
+
+class SwarmProgress(object):
+    """
+    Adds up the progress records of every bee of the swarm, one window at a time.
+    Fed from the threads waiting on the bees, read by the thread printing the live view.
+    """
+
+    def __init__(self, bees, started=None, clock=time.time):
+        """
+        :param bees: int, number of bees firing
+        :param started: float, epoch seconds the bees start firing at, elapsed times count from it, now by default
+        :param clock: callable, epoch seconds
+        """
+        self.bees = bees
+        self.clock = clock
+        self.lock = threading.Lock()
+        now = clock()
+        self.started = now if started is None else started
+        self._new_window(now)
+
+    def _new_window(self, now):
+        self.window_started = now
+        self.requests = 0
+        self.errors = 0
+        self.status_classes = {}
+        self.histogram = LatencyHistogram()
+        self.reporting = set()
+
+    def add(self, bee, record):
+        """
+        :param bee: str, instance id of the bee the record comes from
+        :param record: dict, a progress record
+        """
+        histogram = record.get('latency_histogram')
+        if histogram:
+            histogram = LatencyHistogram.from_dict(histogram)
+        with self.lock:
+            self.requests += record.get('requests', 0)
+            self.errors += record.get('errors', 0)
+            for code, count in (record.get('status_codes') or {}).items():
+                status_class = '%sxx' % code[0]
+                self.status_classes[status_class] = self.status_classes.get(status_class, 0) + count
+            if histogram:
+                self.histogram.merge(histogram)
+            self.reporting.add(bee)
+
+    def take(self):
+        """
+        Close the current window and start the next one
+        :return: dict, the swarm over the window: rps, error_rate and 5xx_rate (0 - 1), p50 and p99 (ms, None without
+            latencies), status_classes, the bees that reported and elapsed seconds since the view started
+        """
+        with self.lock:
+            now = self.clock()
+            seconds = now - self.window_started
+            attempted = self.requests + self.errors
+            view = {
+                'elapsed': now - self.started,
+                'seconds': seconds,
+                'requests': self.requests,
+                'errors': self.errors,
+                'rps': self.requests / seconds if seconds > 0 else 0.0,
+                'error_rate': self.errors / attempted if attempted else 0.0,
+                '5xx_rate': self.status_classes.get('5xx', 0) / self.requests if self.requests else 0.0,
+                'status_classes': self.status_classes,
+                'p50': None,
+                'p99': None,
+                'reporting': len(self.reporting),
+                'bees': self.bees,
+            }
+            if self.histogram.count:
+                view['p50'], view['p99'] = self.histogram.percentiles([50, 99])
+            self._new_window(now)
+        return view
+
+
+class SloGuard(object):
+    """
+    Watches the windows of the live view for a breach of the thresholds that lasts
+    """
+
+    def __init__(self, max_p99=None, max_error_rate=None, max_5xx_rate=None, sustain=0):
+        """
+        :param max_p99: float, ms
+        :param max_error_rate: float, 0 - 1, of the requests that got no response
+        :param max_5xx_rate: float, 0 - 1, of the responses
+        :param sustain: float, seconds the windows have to breach one after the other before it counts
+        """
+        self.thresholds = [(name, limit) for name, limit in (('p99', max_p99), ('error_rate', max_error_rate),
+                                                             ('5xx_rate', max_5xx_rate)) if limit is not None]
+        self.sustain = sustain
+        self.breaching_since = None
+
+    def check(self, view):
+        """
+        :param view: dict, from SwarmProgress.take, of a window some bee reported in
+        :return: dict, the breach once it lasted: since and elapsed, seconds into the attack it started and was
+            called at, breached, list of (name, value, limit), and the view. None before.
+        """
+        breached = [(name, view[name], limit) for name, limit in self.thresholds
+                    if view[name] is not None and view[name] > limit]
+        if not breached:
+            self.breaching_since = None
+            return None
+
+        if self.breaching_since is None:
+            self.breaching_since = max(0.0, view['elapsed'] - view['seconds'])
+        if view['elapsed'] - self.breaching_since < self.sustain:
+            return None
+        return {'since': self.breaching_since, 'elapsed': view['elapsed'], 'breached': breached, 'view': view}
+
+
+def format_breach(breach):
+    """
+    :param breach: dict, from SloGuard.check
+    :return: str, one line
+    """
+    thresholds = []
+    for name, value, limit in breach['breached']:
+        if name == 'p99':
+            thresholds.append('p99 {:.1f} [ms] > {:g} [ms]'.format(value, limit))
+        else:
+            thresholds.append('{} {:.2%} > {:.2%}'.format(name.replace('_', ' '), value, limit))
+    return '{} from {:.0f}s to {:.0f}s'.format(', '.join(thresholds), breach['since'], breach['elapsed'])
+
+
+def format_view(view):
+    """
+    :param view: dict, from SwarmProgress.take
+    :return: str, one line
+    """
+    latency = 'p50 -, p99 -'
+    if view['p50'] is not None:
+        latency = 'p50 {:.1f} [ms], p99 {:.1f} [ms]'.format(view['p50'], view['p99'])
+    status_classes = ', '.join('{} {:.1%}'.format(status_class, count / view['requests'])
+                               for status_class, count in sorted(view['status_classes'].items()) if view['requests'])
+    return '[{:>5.0f}s] {:.1f} [#/sec], errors {:.2%}, {}, {} ({} of {} bees reporting)'.format(
+        view['elapsed'], view['rps'], view['error_rate'], latency, status_classes or 'no responses',
+        view['reporting'], view['bees'])
+
+
+def watch(progress, interval, stopped, out=None, guard=None, on_breach=None):
+    """
+    Print the live view every interval seconds until stopped, windows no bee reported in are skipped
+    :param progress: SwarmProgress
+    :param interval: float, seconds
+    :param stopped: threading.Event
+    :param out: callable printing a line, print by default
+    :param guard: SloGuard checking every window, None for none
+    :param on_breach: callable, called once with the breach from guard, watching ends with it
+    """
+    out = out or print
+    while not stopped.wait(interval):
+        view = progress.take()
+        if not view['reporting']:
+            continue
+        out(format_view(view))
+        breach = guard.check(view) if guard else None
+        if breach:
+            on_breach(breach)
+            return
@@ -0,0 +1,205 @@
+"""
+The roster of the swarm, the bees up mobilized, by region and zone, in one json index:
+
+  {"version": 1, "regions": {"us-east-1": {"us-east-1a": {"username": "ec2-user", "key_name": "bees",
+    "bees": {"i-0123456789abcdef0": {"ip": "54.1.2.3", "dns": "ec2-54-1-2-3.compute-1.amazonaws.com",
+                                     "type": "t3.micro", "armed": ["ab", "aio"], "cores": 2,
+                                     "launched_at": 1544000000.0, "state": "running"}}}}}}
+
+Every read and change holds an exclusive lock on LOCK_FILENAME, so up, attack and down running side by side, in
+processes or in the threads of the zones, don't lose each other's changes, and the index is replaced atomically so
+it is never seen half written. The rosters of earlier versions, one ~/.bees2.<zone> text file per zone, are moved
+into the index the first time it is used.
+"""
+import errno
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows), only the threads of one bees2 are kept apart
+    fcntl = None
+
+ROSTER_FILENAME = os.path.expanduser('~/.bees2.json')
+LOCK_FILENAME = os.path.expanduser('~/.bees2.lock')
+VERSION = 1
+# Rosters of earlier versions, ~/.bees2.<zone>
+LEGACY_FILENAME = re.compile(r'^\.bees2\.([a-z]{2}(?:-[a-z]+)+-\d+[a-z]?)$')
+
+# flock keeps processes apart, and threads as long as each opens the lock file, this covers the platforms without it
+_lock = threading.Lock()
+
+
+def get_region(zone):
+    """
+    Get region name from zone
+    :param zone: str, zone
+    :return:
+    """
+    return zone if 'gov' in zone else zone[:-1]  # chop off the "d" in the "us-east-1d" to get the "Region"
+
+
+@contextmanager
+def _locked():
+    with _lock:
+        with open(LOCK_FILENAME, 'a') as lock_file:
+            if fcntl:
+                # Released when the file is closed
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def _read_legacy(path):
+    """
+    :param path: str, a ~/.bees2.<zone> file, username, key name and zone lines, then an instance id per line with
+        the comma separated engines the bee is armed with
+    :return: tuple, zone and its roster entry
+    """
+    with open(path) as f:
+        username = f.readline().strip()
+        key_name = f.readline().strip()
+        zone = f.readline().strip()
+        bees = {}
+        for line in f:
+            fields = line.split()
+            if fields:
+                bees[fields[0]] = {'armed': fields[1].split(',') if len(fields) > 1 else []}
+    return zone, {'username': username, 'key_name': key_name, 'bees': bees}
+
+
+def _load():
+    """
+    :return: tuple, the roster and the paths of the legacy rosters moved into it, to remove once it is saved
+    """
+    try:
+        with open(ROSTER_FILENAME) as f:
+            return json.load(f), []
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    roster = {'version': VERSION, 'regions': {}}
+    home = os.path.dirname(ROSTER_FILENAME)
+    legacy_paths = [os.path.join(home, filename) for filename in os.listdir(home) if LEGACY_FILENAME.match(filename)]
+    for path in legacy_paths:
+        zone, entry = _read_legacy(path)
+        if zone:
+            roster['regions'].setdefault(get_region(zone), {})[zone] = entry
+    return roster, legacy_paths
+
+
+def _save(roster):
+    handle, path = tempfile.mkstemp(prefix='.bees2.json.', dir=os.path.dirname(ROSTER_FILENAME))
+    try:
+        with os.fdopen(handle, 'w') as f:
+            json.dump(roster, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        getattr(os, 'replace', os.rename)(path, ROSTER_FILENAME)
+    except Exception:
+        os.remove(path)
+        raise
+
+
+@contextmanager
+def transaction():
+    """
+    Exclusive access to the roster, changes made to it in the block are saved when it ends without an error
+    :return: dict, the roster
+    """
+    with _locked():
+        roster, legacy_paths = _load()
+        before = json.dumps(roster, sort_keys=True)
+        yield roster
+        if legacy_paths or json.dumps(roster, sort_keys=True) != before:
+            _save(roster)
+        for path in legacy_paths:
+            os.remove(path)
+
+
+def get_zone(zone):
+    """
+    :param zone: str
+    :return: dict, username, key_name and bees, instance id to bee, of the zone or None
+    """
+    with transaction() as roster:
+        return roster['regions'].get(get_region(zone), {}).get(zone)
+
+
+def set_zone(zone, username, key_name, bees):
+    """
+    Replace the roster of a zone
+    :param zone: str
+    :param username: str
+    :param key_name: str
+    :param bees: dict, instance id to ip, dns, type, armed, cores, launched_at and state of the bee
+    """
+    with transaction() as roster:
+        roster['regions'].setdefault(get_region(zone), {})[zone] = {'username': username, 'key_name': key_name,
+                                                                    'bees': bees}
+
+
+def _drop_zone(roster, zone):
+    zones = roster['regions'].get(get_region(zone), {})
+    zones.pop(zone, None)
+    if not zones:
+        roster['regions'].pop(get_region(zone), None)
+
+
+def merge_zone(zone, username, key_name, bees, removed=()):
+    """
+    Put bees on the roster of a zone next to the ones there, bees put on it by others in the meantime are kept. The
+    engines a bee is armed with are only added to.
+    :param zone: str
+    :param username: str
+    :param key_name: str
+    :param bees: dict, instance id to bee, as in set_zone
+    :param removed: iterable, instance ids to take off the roster of the zone
+    """
+    with transaction() as roster:
+        entry = roster['regions'].setdefault(get_region(zone), {}).setdefault(zone, {'bees': {}})
+        entry.update(username=username, key_name=key_name)
+        for instance_id in removed:
+            entry['bees'].pop(instance_id, None)
+        for instance_id, bee in bees.items():
+            armed = (entry['bees'].get(instance_id) or {}).get('armed') or []
+            entry['bees'][instance_id] = dict(bee, armed=sorted(set(armed) | set(bee.get('armed') or [])))
+        if not entry['bees']:
+            _drop_zone(roster, zone)
+
+
+def remove_bees(zone, instance_ids):
+    """
+    Take bees off the roster of a zone, the zone goes with its last bee
+    :param zone: str
+    :param instance_ids: iterable
+    """
+    with transaction() as roster:
+        entry = roster['regions'].get(get_region(zone), {}).get(zone)
+        if entry is None:
+            return
+        for instance_id in instance_ids:
+            entry['bees'].pop(instance_id, None)
+        if not entry['bees']:
+            _drop_zone(roster, zone)
+
+
+def delete_zone(zone):
+    """
+    :param zone: str
+    """
+    with transaction() as roster:
+        _drop_zone(roster, zone)
+
+
+def get_zones():
+    """
+    :return: list, the zones with bees
+    """
+    with transaction() as roster:
+        return sorted(zone for zones in roster['regions'].values() for zone in zones)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Cold start of bees2, a regression check.
+
+Times fresh interpreters importing the bees2 command and running bees2 --help, net of a bare interpreter, and
+checks which heavy modules they import. The SDKs are imported lazily (see beeswithmachineguns2/lazy.py), the check
+fails, exit 1, once one of them is imported at startup again or the median startup goes over its budget.
+
+  python benchmarks/startup.py [--runs 15] [--budget 250]
+"""
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the startup must not import, the commands import them when they need them
+HEAVY_MODULES = ['boto', 'boto3', 'botocore', 'paramiko', 'future', 'past', 'multiprocessing', 'ssl',
+                 'urllib.request', 'concurrent.futures']
+# Median startup, ms over a bare interpreter
+DEFAULT_BUDGET = 250
+
+CASES = [
+    ('import', 'import beeswithmachineguns2.main'),
+    ('--help', 'import sys\n'
+               'sys.argv = ["bees2", "--help"]\n'
+               'from beeswithmachineguns2 import main\n'
+               'try:\n'
+               '    main.main()\n'
+               'except SystemExit:\n'
+               '    pass'),
+]
+REPORT_MODULES = '\nimport sys, json\nsys.stderr.write(json.dumps([m for m in {} if m in sys.modules]))'
+
+
+def _run(code):
+    """
+    :param code: str, python run in a fresh interpreter
+    :return: tuple, wall seconds and what it wrote to stderr
+    """
+    started = time.time()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    seconds = time.time() - started
+    if process.returncode:
+        raise RuntimeError(err.decode('utf-8', 'replace'))
+    return seconds, err.decode('utf-8', 'replace')
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def measure(code, runs):
+    """
+    :param code: str, python run in a fresh interpreter
+    :param runs: int
+    :return: float, median wall seconds
+    """
+    return _median([_run(code)[0] for _ in range(runs)])
+
+
+def main():
+    parser = OptionParser(usage="python benchmarks/startup.py [options]")
+    parser.add_option('--runs', type='int', default=15, help="Interpreters started per case.")
+    parser.add_option('--budget', type='float', default=DEFAULT_BUDGET,
+                      help="Max median startup, ms over a bare interpreter (default: %default).")
+    options, _ = parser.parse_args()
+
+    bare = measure('pass', options.runs)
+    print("bare interpreter: {:.1f} [ms]".format(bare * 1000))
+
+    failed = False
+    for name, code in CASES:
+        net = measure(code, options.runs) - bare
+        heavy = json.loads(_run(code + REPORT_MODULES.format(HEAVY_MODULES))[1].strip().splitlines()[-1])
+        ok = net * 1000 <= options.budget and not heavy
+        failed = failed or not ok
+        print("{:<8} {:7.1f} [ms]{}{}".format(name, net * 1000, ', imports ' + ', '.join(heavy) if heavy else '',
+                                             '' if ok else '  FAIL'))
+
+    print("budget: {:g} [ms]".format(options.budget))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+import threading
+import time
+import unittest
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from beeswithmachineguns2 import aws
+
+
+class FakeClock(object):
+    """
+    Time that only moves when someone sleeps
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'DescribeInstances')
+
+
+class StubEC2(object):
+    """
+    Answers each call with the next of its outcomes, the last one sticks, exceptions are raised
+    """
+
+    class meta(object):
+        method_to_api_mapping = {'describe_instances': 'DescribeInstances', 'run_instances': 'RunInstances'}
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def _answer(self, operation, kwargs):
+        self.calls.append((operation, kwargs))
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def describe_instances(self, **kwargs):
+        return self._answer('describe_instances', kwargs)
+
+    def run_instances(self, **kwargs):
+        return self._answer('run_instances', kwargs)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = aws.TokenBucket(2, 3, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_burst_then_rate(self):
+        self.assertEqual([self.bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(self.bucket.take(), 0.5)
+        self.assertEqual(self.bucket.take(), 0.5)
+        self.assertEqual(self.clock.now, 1.0)
+
+    def test_refill_capped_at_burst(self):
+        for _ in range(3):
+            self.bucket.take()
+        self.clock.now += 100
+        self.assertEqual([self.bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(self.bucket.take(), 0.5)
+
+    def test_empty(self):
+        # A throttle empties a full bucket, the next call waits for a token
+        self.bucket.empty()
+        self.assertEqual(self.bucket.take(), 0.5)
+
+    def test_empty_keeps_debt(self):
+        for _ in range(3):
+            self.bucket.take()
+        self.bucket.tokens = -1
+        self.bucket.empty()
+        self.assertEqual(self.bucket.tokens, -1)
+
+
+class CallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = aws._get_retry_delay, aws.MAX_RETRIES
+        aws._get_retry_delay = lambda attempt: 0
+        aws._buckets.clear()
+        aws._stats.clear()
+        self.clock = FakeClock()
+        self.region = 'test-region-1'
+        self.read_bucket = aws._buckets[(self.region, True)] = aws.TokenBucket(
+            10, 2, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def tearDown(self):
+        aws._get_retry_delay, aws.MAX_RETRIES = self.saved
+        aws._buckets.clear()
+        aws._stats.clear()
+
+    def call(self, client, operation='describe_instances', **kwargs):
+        return getattr(aws.Client(client, self.region), operation)(**kwargs)
+
+    def test_budget(self):
+        client = StubEC2({'Reservations': []})
+        for _ in range(4):
+            self.call(client, InstanceIds=['i-1'])
+        # A burst of 2, then a token every 0.1s
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 0.2)
+        self.assertAlmostEqual(aws.get_stats()['describe_instances']['waited'], 0.2)
+
+    def test_reads_and_writes_have_their_own_buckets(self):
+        client = StubEC2({})
+        self.call(client)
+        self.call(client, 'run_instances')
+        self.assertIn((self.region, False), aws._buckets)
+        self.assertIsNot(aws._buckets[(self.region, False)], self.read_bucket)
+
+    def test_throttle_retried_and_empties_bucket(self):
+        client = StubEC2(_client_error('RequestLimitExceeded'), _client_error('Throttling'), {'Reservations': []})
+        self.assertEqual(self.call(client), {'Reservations': []})
+        self.assertEqual(len(client.calls), 3)
+        # Emptied by each throttle, the retries waited for their tokens
+        self.assertEqual(len(self.clock.sleeps), 2)
+        stats = aws.get_stats()['describe_instances']
+        self.assertEqual((stats['calls'], stats['throttles'], stats['retries']), (3, 2, 2))
+
+    def test_connection_error_retried(self):
+        client = StubEC2(EndpointConnectionError(endpoint_url='https://ec2.test'), {'Reservations': []})
+        self.assertEqual(self.call(client), {'Reservations': []})
+        stats = aws.get_stats()['describe_instances']
+        self.assertEqual((stats['calls'], stats['throttles'], stats['retries']), (2, 0, 1))
+
+    def test_other_errors_not_retried(self):
+        client = StubEC2(_client_error('InvalidInstanceID.NotFound'), {'Reservations': []})
+        with self.assertRaises(ClientError):
+            self.call(client)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(aws.get_stats()['describe_instances']['retries'], 0)
+
+    def test_retries_exhausted(self):
+        aws.MAX_RETRIES = 2
+        client = StubEC2(_client_error('RequestLimitExceeded'))
+        with self.assertRaises(ClientError):
+            self.call(client)
+        self.assertEqual(len(client.calls), 3)
+
+    def test_identical_reads_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+        client = StubEC2({'Reservations': [{'Instances': [{'InstanceId': 'i-1'}]}]})
+        answer = client.describe_instances
+
+        def describe_instances(**kwargs):
+            started.set()
+            release.wait(5)
+            return answer(**kwargs)
+
+        client.describe_instances = describe_instances
+        responses = []
+
+        def read():
+            responses.append(self.call(client, InstanceIds=['i-1']))
+
+        leader = threading.Thread(target=read)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=read) for _ in range(5)]
+        for follower in followers:
+            follower.start()
+        deadline = time.time() + 5
+        while aws.get_stats()['describe_instances']['coalesced'] < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(aws.get_stats()['describe_instances']['coalesced'], 5)
+        self.assertEqual(len(responses), 6)
+        for response in responses:
+            self.assertEqual(response, {'Reservations': [{'Instances': [{'InstanceId': 'i-1'}]}]})
+        # Followers get copies, free to change
+        self.assertEqual(len(set(id(response) for response in responses)), 6)
+        del responses[1]['Reservations'][:]
+        self.assertEqual(len(responses[2]['Reservations']), 1)
+        # Done, the next read calls again
+        self.call(client, InstanceIds=['i-1'])
+        self.assertEqual(len(client.calls), 2)
+
+    def test_coalesced_error(self):
+        started = threading.Event()
+        release = threading.Event()
+        client = StubEC2(_client_error('UnauthorizedOperation'))
+        answer = client.describe_instances
+
+        def describe_instances(**kwargs):
+            started.set()
+            release.wait(5)
+            return answer(**kwargs)
+
+        client.describe_instances = describe_instances
+        errors = []
+
+        def read():
+            try:
+                self.call(client)
+            except ClientError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=read))
+        threads[1].start()
+        deadline = time.time() + 5
+        while aws.get_stats()['describe_instances']['coalesced'] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(len(errors), 2)
+
+    def test_different_reads_not_coalesced(self):
+        client = StubEC2({'Reservations': []})
+        self.call(client, InstanceIds=['i-1'])
+        self.call(client, InstanceIds=['i-2'])
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(aws.get_stats()['describe_instances']['coalesced'], 0)
+
+    def test_format_stats(self):
+        self.assertIsNone(aws.format_stats({}))
+        self.call(StubEC2({}))
+        self.assertTrue(aws.format_stats().startswith('AWS API: 1 calls, 0 throttled, 0 coalesced'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from beeswithmachineguns2 import bees
+
+
+class FakeClock(object):
+    """
+    Time that only moves when the waiter sleeps
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubEC2(object):
+    """
+    describe_instance_status of bees going through the states of a script, one per poll, the last one sticks
+    """
+
+    def __init__(self, scripts):
+        """
+        :param scripts: dict, instance id to list of states, 'ready' for running with both checks ok
+        """
+        self.scripts = scripts
+        self.calls = []
+
+    def describe_instance_status(self, **kwargs):
+        self.calls.append(kwargs)
+        poll = len(self.calls) - 1
+        statuses = []
+        for instance_id in kwargs['InstanceIds']:
+            script = self.scripts[instance_id]
+            state = script[min(poll, len(script) - 1)]
+            checks = 'ok' if state == 'ready' else 'initializing'
+            statuses.append({'InstanceId': instance_id,
+                             'InstanceState': {'Name': 'running' if state == 'ready' else state},
+                             'SystemStatus': {'Status': checks}, 'InstanceStatus': {'Status': checks}})
+        return {'InstanceStatuses': statuses}
+
+
+class WaitForInstancesReadyTest(unittest.TestCase):
+
+    def wait(self, scripts, timeout=bees.READY_TIMEOUT):
+        self.clock = FakeClock()
+        self.ec2 = StubEC2(scripts)
+        instances = [{'InstanceId': instance_id} for instance_id in sorted(scripts)]
+        return bees._wait_for_instances_ready(self.ec2, instances, timeout=timeout, sleep=self.clock.sleep,
+                                              clock=self.clock.time)
+
+    def test_ready_bees(self):
+        provisioning_times, lost_instance_ids = self.wait({'i-1': ['pending', 'ready'],
+                                                           'i-2': ['pending', 'running', 'ready']})
+        self.assertEqual(set(provisioning_times), {'i-1', 'i-2'})
+        self.assertEqual(lost_instance_ids, set())
+        # Timed from the start of the wait, the instances have no LaunchTime
+        self.assertEqual(provisioning_times['i-1'], self.clock.sleeps[0])
+        self.assertEqual(provisioning_times['i-2'], sum(self.clock.sleeps))
+        # One batched call per poll, for the bees still pending
+        self.assertEqual([call['InstanceIds'] for call in self.ec2.calls], [['i-1', 'i-2'], ['i-1', 'i-2'], ['i-2']])
+
+    def test_ready_at_once(self):
+        provisioning_times, lost_instance_ids = self.wait({'i-1': ['ready']})
+        self.assertEqual(provisioning_times, {'i-1': 0.0})
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_lost_bee(self):
+        provisioning_times, lost_instance_ids = self.wait({'i-1': ['pending', 'ready'],
+                                                           'i-2': ['pending', 'terminated']})
+        self.assertEqual(set(provisioning_times), {'i-1'})
+        self.assertEqual(lost_instance_ids, {'i-2'})
+        self.assertEqual(len(self.ec2.calls), 2)
+
+    def test_backoff_and_reset(self):
+        self.wait({'i-1': ['pending', 'pending', 'ready'],
+                   'i-2': ['pending', 'pending', 'pending', 'pending', 'ready']})
+        grown = bees.READY_POLL_MIN_DELAY * bees.READY_POLL_BACKOFF
+        # Backs off while no bee is ready, back to the shortest delay once one is
+        self.assertEqual(self.clock.sleeps, [grown, grown * bees.READY_POLL_BACKOFF, bees.READY_POLL_MIN_DELAY,
+                                             grown])
+
+    def test_backoff_capped(self):
+        self.wait({'i-1': ['pending'] * 20 + ['ready']})
+        self.assertEqual(len(self.clock.sleeps), 20)
+        self.assertEqual(max(self.clock.sleeps), bees.READY_POLL_MAX_DELAY)
+        self.assertEqual(self.clock.sleeps, sorted(self.clock.sleeps))
+
+    def test_timeout(self):
+        provisioning_times, lost_instance_ids = self.wait({'i-1': ['pending', 'ready'], 'i-2': ['pending']},
+                                                          timeout=60)
+        # Bees still initializing are neither ready nor lost
+        self.assertEqual(set(provisioning_times), {'i-1'})
+        self.assertEqual(lost_instance_ids, set())
+        self.assertGreater(self.clock.now - 1000.0, 60)
+        self.assertLessEqual(self.clock.now - 1000.0, 60 + bees.READY_POLL_MAX_DELAY)
+
+
+if __name__ == '__main__':
+    unittest.main()
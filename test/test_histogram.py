@@ -0,0 +1,94 @@
+import json
+import math
+import random
+import unittest
+
+from beeswithmachineguns2.histogram import LatencyHistogram, UNITS_PER_MS
+
+# Most a bucket is wider than its values, see SUB_BUCKET_BITS
+MAX_RELATIVE_ERROR = 0.002
+PERCENTS = [0, 1, 10, 25, 50, 66, 75, 80, 90, 95, 98, 99, 99.9, 99.99, 100]
+
+
+def _latencies(count, seed):
+    """
+    :return: list of floats, ms, log normal like request latencies, from under a ms to seconds
+    """
+    generator = random.Random(seed)
+    return [generator.lognormvariate(3, 1.5) for _ in range(count)]
+
+
+def _exact_percentile(values, percent):
+    """
+    Nearest rank percentile of the recorded (us rounded) values
+    """
+    ranked = sorted(max(0, int(round(ms * UNITS_PER_MS))) for ms in values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(ranked))))
+    return ranked[rank - 1] / float(UNITS_PER_MS)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def record(self, values):
+        histogram = LatencyHistogram()
+        for ms in values:
+            histogram.record(ms)
+        return histogram
+
+    def assertClose(self, value, exact):
+        # Buckets report their highest value, never under the exact one
+        self.assertGreaterEqual(value, exact)
+        self.assertLessEqual(value, exact * (1 + MAX_RELATIVE_ERROR))
+
+    def test_percentiles_within_error(self):
+        for seed, count in ((1, 1), (2, 7), (3, 1000), (4, 50000)):
+            values = _latencies(count, seed)
+            histogram = self.record(values)
+            for percent, value in zip(PERCENTS, histogram.percentiles(PERCENTS)):
+                self.assertClose(value, _exact_percentile(values, percent))
+
+    def test_percentile_matches_percentiles(self):
+        histogram = self.record(_latencies(1000, 5))
+        self.assertEqual([histogram.percentile(percent) for percent in PERCENTS], histogram.percentiles(PERCENTS))
+
+    def test_small_values_exact(self):
+        values = [0, 0.001, 0.5, 1, 1.023]
+        histogram = self.record(values)
+        self.assertEqual(histogram.percentiles([0, 50, 100]), [0, 0.5, 1.023])
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentiles([50, 99]), [None, None])
+        self.assertIsNone(histogram.mean())
+
+    def test_mean(self):
+        values = _latencies(1000, 6)
+        self.assertAlmostEqual(self.record(values).mean(), sum(values) / len(values), places=3)
+
+    def test_merge_equals_one_histogram(self):
+        values = _latencies(20000, 7)
+        merged = self.record(values[:5000]).merge(self.record(values[5000:]))
+        whole = self.record(values)
+        self.assertEqual(merged.to_dict(), whole.to_dict())
+        self.assertEqual(merged.percentiles(PERCENTS), whole.percentiles(PERCENTS))
+
+    def test_merge_empty(self):
+        values = _latencies(100, 8)
+        whole = self.record(values)
+        self.assertEqual(LatencyHistogram().merge(whole).to_dict(), whole.to_dict())
+        self.assertEqual(self.record(values).merge(LatencyHistogram()).to_dict(), whole.to_dict())
+
+    def test_merge_other_buckets(self):
+        with self.assertRaises(ValueError):
+            LatencyHistogram().merge(LatencyHistogram(sub_bucket_bits=8))
+
+    def test_dict_round_trip(self):
+        # As the bees send them, through json
+        histogram = self.record(_latencies(1000, 9))
+        copy = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+        self.assertEqual(copy.to_dict(), histogram.to_dict())
+        self.assertEqual(copy.percentiles(PERCENTS), histogram.percentiles(PERCENTS))
+
+
+if __name__ == '__main__':
+    unittest.main()
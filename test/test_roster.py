@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from beeswithmachineguns2 import roster
+
+
+class RosterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.saved = roster.ROSTER_FILENAME, roster.LOCK_FILENAME
+        roster.ROSTER_FILENAME = os.path.join(self.home, '.bees2.json')
+        roster.LOCK_FILENAME = os.path.join(self.home, '.bees2.lock')
+
+    def tearDown(self):
+        roster.ROSTER_FILENAME, roster.LOCK_FILENAME = self.saved
+        shutil.rmtree(self.home)
+
+    def read(self):
+        with open(roster.ROSTER_FILENAME) as f:
+            return json.load(f)
+
+    def test_empty(self):
+        self.assertIsNone(roster.get_zone('us-east-1a'))
+        self.assertEqual(roster.get_zones(), [])
+        # Nothing changed, nothing written
+        self.assertFalse(os.path.exists(roster.ROSTER_FILENAME))
+
+    def test_set_zone_replaces(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': ['ab']}})
+        roster.set_zone('us-east-1a', 'ubuntu', 'other', {'i-2': {'armed': []}})
+        self.assertEqual(roster.get_zone('us-east-1a'), {'username': 'ubuntu', 'key_name': 'other',
+                                                         'bees': {'i-2': {'armed': []}}})
+        self.assertEqual(self.read()['version'], roster.VERSION)
+
+    def test_merge_by_instance_id(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': [], 'state': 'pending'},
+                                                           'i-2': {'armed': [], 'state': 'running'}})
+        roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': [], 'state': 'running'},
+                                                             'i-3': {'armed': [], 'state': 'pending'}})
+        bees = roster.get_zone('us-east-1a')['bees']
+        self.assertEqual(sorted(bees), ['i-1', 'i-2', 'i-3'])
+        self.assertEqual(bees['i-1']['state'], 'running')
+
+    def test_merge_removed(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}, 'i-2': {'armed': []}})
+        roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {'i-3': {'armed': []}}, removed=['i-1', 'i-9'])
+        self.assertEqual(sorted(roster.get_zone('us-east-1a')['bees']), ['i-2', 'i-3'])
+
+    def test_merge_keeps_armed_engines(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': ['ab', 'wrk']}})
+        roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': ['aio'], 'ip': '1.2.3.4'}})
+        self.assertEqual(roster.get_zone('us-east-1a')['bees']['i-1'], {'armed': ['ab', 'aio', 'wrk'],
+                                                                        'ip': '1.2.3.4'})
+        roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}})
+        self.assertEqual(roster.get_zone('us-east-1a')['bees']['i-1']['armed'], ['ab', 'aio', 'wrk'])
+
+    def test_merge_last_bee_removed_drops_zone(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}})
+        roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {}, removed=['i-1'])
+        self.assertIsNone(roster.get_zone('us-east-1a'))
+        self.assertEqual(self.read()['regions'], {})
+
+    def test_remove_bees(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}, 'i-2': {'armed': []}})
+        roster.set_zone('us-east-1b', 'ec2-user', 'bees', {'i-3': {'armed': []}})
+        roster.remove_bees('us-east-1a', ['i-1'])
+        self.assertEqual(sorted(roster.get_zone('us-east-1a')['bees']), ['i-2'])
+        # The zone goes with its last bee, the region with its last zone
+        roster.remove_bees('us-east-1a', ['i-2'])
+        self.assertIsNone(roster.get_zone('us-east-1a'))
+        self.assertEqual(roster.get_zones(), ['us-east-1b'])
+        roster.remove_bees('us-east-1b', ['i-3'])
+        self.assertEqual(self.read()['regions'], {})
+        # Zones that aren't on the roster are left alone
+        roster.remove_bees('eu-west-1a', ['i-4'])
+        self.assertEqual(roster.get_zones(), [])
+
+    def test_delete_zone(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}})
+        roster.set_zone('eu-west-1a', 'ec2-user', 'bees', {'i-2': {'armed': []}})
+        roster.delete_zone('us-east-1a')
+        self.assertEqual(roster.get_zones(), ['eu-west-1a'])
+        self.assertNotIn('us-east-1', self.read()['regions'])
+
+    def test_concurrent_merges(self):
+        def merge(i):
+            roster.merge_zone('us-east-1a', 'ec2-user', 'bees', {'i-{}'.format(i): {'armed': []}})
+
+        threads = [threading.Thread(target=merge, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(roster.get_zone('us-east-1a')['bees']), 20)
+
+    def test_failed_transaction_not_saved(self):
+        roster.set_zone('us-east-1a', 'ec2-user', 'bees', {'i-1': {'armed': []}})
+        with self.assertRaises(RuntimeError):
+            with roster.transaction() as data:
+                data['regions'].clear()
+                raise RuntimeError
+        self.assertEqual(roster.get_zones(), ['us-east-1a'])
+
+    def test_legacy_migration(self):
+        with open(os.path.join(self.home, '.bees2.us-east-1a'), 'w') as f:
+            f.write('ec2-user\nbees\nus-east-1a\ni-1 ab,wrk\ni-2\n')
+        with open(os.path.join(self.home, '.bees2.us-gov-west-1'), 'w') as f:
+            f.write('ubuntu\ngov\nus-gov-west-1\ni-3 aio\n')
+
+        self.assertEqual(roster.get_zones(), ['us-east-1a', 'us-gov-west-1'])
+        self.assertEqual(roster.get_zone('us-east-1a'), {'username': 'ec2-user', 'key_name': 'bees',
+                                                         'bees': {'i-1': {'armed': ['ab', 'wrk']},
+                                                                  'i-2': {'armed': []}}})
+        self.assertEqual(roster.get_zone('us-gov-west-1')['bees'], {'i-3': {'armed': ['aio']}})
+        # Moved into the index, the legacy files are gone
+        self.assertEqual(sorted(os.listdir(self.home)), ['.bees2.json', '.bees2.lock'])
+        self.assertEqual(sorted(self.read()['regions']), ['us-east-1', 'us-gov-west-1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
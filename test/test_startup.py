@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported lazily by the commands that use them, see beeswithmachineguns2/lazy.py. benchmarks/startup.py times the
+# startup against its budget.
+HEAVY_MODULES = ['boto', 'boto3', 'botocore', 'paramiko', 'future', 'past', 'multiprocessing', 'ssl',
+                 'urllib.request', 'concurrent.futures']
+REPORT_MODULES = '\nimport sys, json\nsys.stderr.write(json.dumps([m for m in {} if m in sys.modules]))'
+
+
+def _imported_heavy_modules(code):
+    """
+    :param code: str, python run in a fresh interpreter
+    :return: list, the heavy modules it imported
+    """
+    process = subprocess.Popen([sys.executable, '-c', code + REPORT_MODULES.format(HEAVY_MODULES)], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    err = err.decode('utf-8', 'replace')
+    if process.returncode:
+        raise AssertionError(err)
+    return json.loads(err.strip().splitlines()[-1])
+
+
+class StartupImportsTest(unittest.TestCase):
+
+    def test_import(self):
+        self.assertEqual(_imported_heavy_modules('import beeswithmachineguns2.main'), [])
+
+    def test_import_bees(self):
+        self.assertEqual(_imported_heavy_modules('from beeswithmachineguns2 import aws, bees, roster'), [])
+
+    def test_help(self):
+        self.assertEqual(_imported_heavy_modules('import sys\n'
+                                                 'sys.argv = ["bees2", "--help"]\n'
+                                                 'from beeswithmachineguns2 import main\n'
+                                                 'try:\n'
+                                                 '    main.main()\n'
+                                                 'except SystemExit:\n'
+                                                 '    pass'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()